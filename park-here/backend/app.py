@@ -1,13 +1,15 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from datetime import timedelta
+import hmac
+import json
 import os
 from dotenv import load_dotenv
 
 # Initialize extensions
 from extensions import db, jwt
 
-def create_app():
+def create_app(test_config=None):
     # Load environment variables
     load_dotenv()
 
@@ -16,39 +18,160 @@ def create_app():
     CORS(app)
 
     # Configuration
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///park_here.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///park_here.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 10))
+    app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 30))
+    app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    app.config['DB_POOL_PRE_PING'] = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    app.config['SQLITE_SHARED_CACHE'] = os.getenv('SQLITE_SHARED_CACHE', 'false').lower() == 'true'
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key-here')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
+    app.config['SPATIAL_CELL_DEGREES'] = float(os.getenv('SPATIAL_CELL_DEGREES', 0.05))
+    app.config['RESPONSE_CACHE_TTL'] = float(os.getenv('RESPONSE_CACHE_TTL', 30))
+    app.config['RESPONSE_CACHE_MAX_ENTRIES'] = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+    app.config['PRICING_TYPE_MULTIPLIERS'] = json.loads(os.getenv(
+        'PRICING_TYPE_MULTIPLIERS', '{"car": 1.0, "bike": 1.0, "ev": 1.0, "handicap": 1.0}'
+    ))
+    app.config['PRICING_MINIMUM_HOURS'] = float(os.getenv('PRICING_MINIMUM_HOURS', 0))
+    app.config['PRICING_MINIMUM_CHARGE'] = float(os.getenv('PRICING_MINIMUM_CHARGE', 0))
+    app.config['PRICING_INCREMENT_MINUTES'] = int(os.getenv('PRICING_INCREMENT_MINUTES', 0))
+    app.config['PRICING_CACHE_MAX_LOCATIONS'] = int(os.getenv('PRICING_CACHE_MAX_LOCATIONS', 1024))
+    app.config['PRICING_CACHE_TTL'] = float(os.getenv('PRICING_CACHE_TTL', 30))
+    app.config['SCHEDULER_ENABLED'] = os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true'
+    app.config['SCHEDULER_HORIZON_SECONDS'] = int(os.getenv('SCHEDULER_HORIZON_SECONDS', 1800))
+    app.config['SCHEDULER_BATCH_SIZE'] = int(os.getenv('SCHEDULER_BATCH_SIZE', 500))
+    app.config['SCHEDULER_POLL_SECONDS'] = float(os.getenv('SCHEDULER_POLL_SECONDS', 1.0))
+    app.config['PUBSUB_BROKER'] = os.getenv('PUBSUB_BROKER')
+    app.config['PUBSUB_MAX_QUEUE'] = int(os.getenv('PUBSUB_MAX_QUEUE', 1000))
+    app.config['LIVE_MAX_STREAMS'] = int(os.getenv('LIVE_MAX_STREAMS', 100))
+    app.config['LIVE_HEARTBEAT_SECONDS'] = float(os.getenv('LIVE_HEARTBEAT_SECONDS', 15))
+    app.config['PAYMENT_GATEWAY'] = os.getenv('PAYMENT_GATEWAY', 'simulated')
+    app.config['PAYMENT_GATEWAY_LATENCY_MS'] = float(os.getenv('PAYMENT_GATEWAY_LATENCY_MS', 200))
+    app.config['PAYMENT_GATEWAY_FAILURE_RATE'] = float(os.getenv('PAYMENT_GATEWAY_FAILURE_RATE', 0.0))
+    app.config['PAYMENT_GATEWAY_DECLINE_RATE'] = float(os.getenv('PAYMENT_GATEWAY_DECLINE_RATE', 0.0))
+    app.config['PAYMENT_WORKERS'] = int(os.getenv('PAYMENT_WORKERS', 4))
+    app.config['PAYMENT_QUEUE_SIZE'] = int(os.getenv('PAYMENT_QUEUE_SIZE', 1000))
+    app.config['PAYMENT_MAX_ATTEMPTS'] = int(os.getenv('PAYMENT_MAX_ATTEMPTS', 5))
+    app.config['PAYMENT_RETRY_BASE_SECONDS'] = float(os.getenv('PAYMENT_RETRY_BASE_SECONDS', 0.5))
+    app.config['PAYMENT_RETRY_MAX_SECONDS'] = float(os.getenv('PAYMENT_RETRY_MAX_SECONDS', 30))
+    app.config['IDEMPOTENCY_TTL_SECONDS'] = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 86400))
+    app.config['IDEMPOTENCY_LOCK_SECONDS'] = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 60))
+    app.config['IDEMPOTENCY_WAIT_SECONDS'] = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 5))
+    app.config['IDEMPOTENCY_PURGE_SECONDS'] = int(os.getenv('IDEMPOTENCY_PURGE_SECONDS', 300))
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.getenv('PASSWORD_HASH_QUEUE', app.config['PASSWORD_HASH_WORKERS'] * 4))
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.getenv('PASSWORD_HASH_TIMEOUT', 30))
+    app.config['PRINCIPAL_CACHE_TTL'] = float(os.getenv('PRINCIPAL_CACHE_TTL', 60))
+    app.config['PRINCIPAL_CACHE_MAX_ENTRIES'] = int(os.getenv('PRINCIPAL_CACHE_MAX_ENTRIES', 4096))
+    app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
+    app.config['RATELIMIT_STORE'] = os.getenv('RATELIMIT_STORE', 'memory')  # 'memory' or 'shared'
+    app.config['RATELIMIT_QUEUE_TIMEOUT'] = float(os.getenv('RATELIMIT_QUEUE_TIMEOUT', 0.05))
+    app.config['RATELIMIT_TRUST_PROXY'] = os.getenv('RATELIMIT_TRUST_PROXY', 'false').lower() == 'true'
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')  # bearer token required to scrape, if set
+    app.config['PROFILING_ENABLED'] = os.getenv('PROFILING_ENABLED', 'true').lower() == 'true'
+    app.config['PROFILING_SAMPLE_RATE'] = float(os.getenv('PROFILING_SAMPLE_RATE', 0.0))
+    app.config['PROFILING_INTERVAL_MS'] = float(os.getenv('PROFILING_INTERVAL_MS', 2))
+    app.config['PROFILING_DIR'] = os.getenv('PROFILING_DIR')  # defaults to <instance>/profiles
+    app.config['PROFILING_MAX_PROFILES'] = int(os.getenv('PROFILING_MAX_PROFILES', 100))
 
-    # Initialize extensions with app
-    db.init_app(app)
+    # Overrides used by scripts that run against a scratch database
+    if test_config:
+        app.config.update(test_config)
+
+    # Initialize extensions with app; the database engine is configured from
+    # the settings above
+    import database
+    database.init_app(app)
     jwt.init_app(app)
 
+    # Count requests and SQL statements for /metrics
+    from services.metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+    metrics.init_app(app)
+
+    # Profile single requests on demand for admins
+    from services.profiling import profiler
+    profiler.init_app(app)
+
+    # Hash passwords in a process pool rather than in request threads
+    from services.passwords import hasher
+    hasher.init_app(app)
+
+    # Throttle login, register and search before they reach the views
+    from services.ratelimit import rate_limiter
+    rate_limiter.init_app(app)
+
     # Import models (after db initialization)
-    from models import User, ParkingLocation, Slot, Booking, Payment
+    from models import User, ParkingLocation, Slot, SlotCounter, Booking, Payment, IdempotencyKey
 
     # Import blueprints from routes
     from routes.auth import auth_bp
     from routes.parking import parking_bp
     from routes.booking import booking_bp
     from routes.payment import payment_bp
+    from routes.admin import admin_bp
 
     # Register blueprints with consistent URL prefixes
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(parking_bp, url_prefix='/api/parking')
     app.register_blueprint(booking_bp, url_prefix='/api/bookings')
     app.register_blueprint(payment_bp, url_prefix='/api/payments')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
 
-    # Create tables
+    # Create tables, then bring existing databases up to the current schema
     with app.app_context():
         db.create_all()
 
+    import migrations
+    migrations.init_app(app)
+
+    # Build in-memory indexes from the database
+    from services import counters
+    from services.spatial import spatial_index
+    from services.availability import availability
+    from services.cache import response_cache
+    from services.principals import principal_cache
+    from services.pricing import pricing
+    counters.init_app(app)
+    response_cache.init_app(app)
+    pricing.init_app(app)
+    principal_cache.init_app(app)
+    spatial_index.init_app(app)
+    availability.init_app(app)
+
+    # Fan committed slot changes out to live feed subscribers
+    from services.pubsub import broker
+    broker.init_app(app)
+
+    # Move bookings through their lifecycle in the background
+    from services.scheduler import scheduler
+    scheduler.init_app(app)
+
+    # Charge pending payments in the background
+    from services.payments import processor
+    processor.init_app(app)
+
     # Health check endpoint
     @app.route('/api/health')
     def health_check():
         return jsonify({'status': 'healthy'}), 200
 
+    # Prometheus metrics
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if not metrics.enabled:
+            return jsonify({'error': 'Not found'}), 404
+        token = app.config.get('METRICS_TOKEN')
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
     # Root endpoint
     @app.route('/')
     def index():
@@ -60,7 +183,9 @@ def create_app():
                 'parking': '/api/parking',
                 'booking': '/api/bookings',
                 'payment': '/api/payments',
-                'health': '/api/health'
+                'admin': '/api/admin',
+                'health': '/api/health',
+                'metrics': '/metrics'
             }
         }), 200
 
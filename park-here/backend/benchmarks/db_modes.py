@@ -0,0 +1,164 @@
+"""Compare read/write throughput of the SQLite journal and cache modes.
+
+Each mode gets its own scratch database. Reader workers list a location's
+slots and their own bookings while writer workers book consecutive windows
+on a slot of their own, all for a fixed time. The script reports completed
+requests per second and how many requests failed or had to be retried.
+
+Usage: python benchmarks/db_modes.py [--mode threads|processes] [--readers 8] [--writers 4] [--seconds 5]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token
+
+MODES = {
+    'rollback-journal': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL'},
+    'wal': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL'},
+    'wal-shared-cache': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL', 'SQLITE_SHARED_CACHE': True},
+}
+
+def make_app(database_path, settings):
+    from app import create_app
+    config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database_path}', 'RESPONSE_CACHE_TTL': 0,
+              'SCHEDULER_ENABLED': False}
+    config.update(settings)
+    return create_app(config)
+
+def seed(database_path, settings, writers):
+    from models import db, User, ParkingLocation, Slot
+
+    app = make_app(database_path, settings)
+    with app.app_context():
+        user = User(name='Bench', email='bench@example.com', phone='9000000002')
+        user.set_password('bench')
+        location = ParkingLocation(name='Bench Lot', address='Nowhere', city='Test',
+                                   latitude=0.0, longitude=0.0)
+        slots = [Slot(parking_location=location, slot_number=f'B-{i:03d}', type='car',
+                      status='available', price_per_hour=10) for i in range(max(writers, 1))]
+        db.session.add_all([user, location] + slots)
+        db.session.commit()
+        seeded = create_access_token(identity=user.id), location.id, [slot.id for slot in slots]
+        db.engine.dispose()
+        return seeded
+
+def read_loop(client, token, location_id, deadline):
+    headers = {'Authorization': f'Bearer {token}'}
+    outcome = Counter()
+    urls = [f'/api/parking/locations/{location_id}/slots', '/api/bookings']
+    while time.monotonic() < deadline:
+        response = client.get(urls[outcome['requests'] % len(urls)], headers=headers)
+        outcome['requests'] += 1
+        outcome['ok' if response.status_code == 200 else f'status {response.status_code}'] += 1
+    return outcome
+
+def write_loop(client, token, slot_id, deadline, first_window):
+    headers = {'Authorization': f'Bearer {token}'}
+    outcome = Counter()
+    start = first_window
+    while time.monotonic() < deadline:
+        response = client.post('/api/bookings', headers=headers, json={
+            'slot_id': slot_id,
+            'vehicle_number': 'BENCH',
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(minutes=30)).isoformat()
+        })
+        outcome['requests'] += 1
+        if response.status_code == 201:
+            outcome['ok'] += 1
+            start += timedelta(hours=1)
+        elif response.status_code == 409:
+            outcome['retried'] += 1
+        else:
+            outcome[f'status {response.status_code}'] += 1
+    return outcome
+
+def worker(database_path, settings, role, token, target, seconds, barrier):
+    app = make_app(database_path, settings)
+    client = app.test_client()
+    first_window = (datetime.utcnow() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+    barrier.wait()
+    deadline = time.monotonic() + seconds
+    if role == 'read':
+        outcome = read_loop(client, token, target, deadline)
+    else:
+        outcome = write_loop(client, token, target, deadline, first_window)
+    return role, outcome
+
+def _process_worker(queue, *args):
+    queue.put(worker(*args))
+
+def run(database_path, settings, mode, readers, writers, seconds):
+    token, location_id, slot_ids = seed(database_path, settings, writers)
+    jobs = [('read', location_id)] * readers + [('write', slot_id) for slot_id in slot_ids[:writers]]
+
+    if mode == 'threads':
+        barrier = threading.Barrier(len(jobs))
+        results = []
+        lock = threading.Lock()
+
+        def thread_worker(role, target):
+            outcome = worker(database_path, settings, role, token, target, seconds, barrier)
+            with lock:
+                results.append(outcome)
+
+        threads = [threading.Thread(target=thread_worker, args=job) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(len(jobs))
+    queue = context.Queue()
+    processes = [
+        context.Process(target=_process_worker,
+                        args=(queue, database_path, settings, role, token, target, seconds, barrier))
+        for role, target in jobs
+    ]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['threads', 'processes'], default='threads')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f'{args.readers} readers + {args.writers} writers as {args.mode} for {args.seconds:g}s')
+    print(f'{"mode":18} {"reads/s":>9} {"writes/s":>9} {"retried":>8} {"failed":>7}')
+    for name, settings in MODES.items():
+        with tempfile.TemporaryDirectory() as directory:
+            results = run(os.path.join(directory, f'{name}.db'), settings,
+                          args.mode, args.readers, args.writers, args.seconds)
+
+        totals = {'read': Counter(), 'write': Counter()}
+        for role, outcome in results:
+            totals[role].update(outcome)
+        failed = sum(
+            count for totals_by_role in totals.values()
+            for key, count in totals_by_role.items() if key.startswith('status')
+        )
+        print(f'{name:18} {totals["read"]["ok"] / args.seconds:9.1f} {totals["write"]["ok"] / args.seconds:9.1f} '
+              f'{totals["write"]["retried"]:8d} {failed:7d}')
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
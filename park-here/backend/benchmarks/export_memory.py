@@ -0,0 +1,110 @@
+"""Check that admin exports stream: flat memory and an immediate first byte.
+
+Seeds a scratch database with bookings and payments in bulk, then streams
+the booking and payment exports in both formats at several sizes. For each
+export it records the time to the first chunk, the total time and the peak
+Python memory seen by tracemalloc while streaming. Peak memory should stay
+about the same from the smallest size to the largest.
+
+Usage: python benchmarks/export_memory.py [--sizes 1000,100000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+
+def seed(app, rows):
+    from models import db, User, ParkingLocation, Slot, Booking, Payment
+
+    with app.app_context():
+        admin = User(name='Admin', email='admin@example.com', phone='9000000003', role='admin')
+        admin.set_password('admin')
+        location = ParkingLocation(name='Export Lot', address='Nowhere', city='Test',
+                                   latitude=0.0, longitude=0.0)
+        slots = [Slot(parking_location=location, slot_number=f'E-{i:03d}', type='car',
+                      status='available', price_per_hour=10) for i in range(50)]
+        db.session.add_all([admin, location] + slots)
+        db.session.commit()
+        slot_ids = [slot.id for slot in slots]
+
+        start = datetime(2025, 1, 1)
+        for offset in range(0, rows, 10000):
+            bookings, payments = [], []
+            for i in range(offset, min(rows, offset + 10000)):
+                booking_id = str(uuid.uuid4())
+                begins = start + timedelta(minutes=i)
+                bookings.append({
+                    'id': booking_id, 'user_id': admin.id, 'slot_id': slot_ids[i % len(slot_ids)],
+                    'vehicle_number': 'EXP', 'start_time': begins, 'end_time': begins + timedelta(hours=1),
+                    'total_amount': 10.0, 'status': 'completed', 'version': 1,
+                    'created_at': begins, 'updated_at': begins
+                })
+                payments.append({
+                    'id': str(uuid.uuid4()), 'booking_id': booking_id, 'user_id': admin.id, 'amount': 10.0,
+                    'payment_method': 'upi', 'transaction_id': f'TXN-EXP-{i}', 'status': 'completed',
+                    'created_at': begins, 'updated_at': begins
+                })
+            db.session.execute(insert(Booking), bookings)
+            db.session.execute(insert(Payment), payments)
+            db.session.commit()
+        return create_access_token(identity=admin.id)
+
+def measure(client, url, headers):
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(url, headers=headers)
+    first_chunk, size, lines = None, 0, 0
+    for chunk in response.response:
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - started
+        size += len(chunk)
+        lines += chunk.count('\n') if isinstance(chunk, str) else chunk.count(b'\n')
+    total = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    response.close()
+    return response.status_code, first_chunk or total, total, peak, size, lines
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,100000')
+    args = parser.parse_args()
+
+    from app import create_app
+    from models import db
+
+    print(f'{"export":18} {"rows":>8} {"first chunk":>12} {"total":>8} {"peak memory":>12} {"size":>10}')
+    for rows in [int(size) for size in args.sizes.split(',')]:
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, "export.db")}',
+                              'SCHEDULER_ENABLED': False})
+            token = seed(app, rows)
+            client = app.test_client()
+            headers = {'Authorization': f'Bearer {token}'}
+
+            for name in ('bookings', 'payments'):
+                for export_format in ('ndjson', 'csv'):
+                    status, first, total, peak, size, lines = measure(
+                        client, f'/api/admin/export/{name}?format={export_format}', headers
+                    )
+                    label = f'{name}.{export_format}'
+                    print(f'{label:18} {rows:8d} {first * 1000:10.1f}ms {total:7.2f}s '
+                          f'{peak / 1024:9.0f}KiB {size / 1024 / 1024:8.1f}MiB'
+                          + ('' if status == 200 else f' status {status}'))
+
+            with app.app_context():
+                db.engine.dispose()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Measure login latency and its effect on other endpoints during a login storm.
+
+Seeds a scratch database with users, then runs login threads that sign in
+as fast as they can next to probe threads that list bookings and fetch a
+location. This is done twice: with passwords hashed in the request threads
+(``PASSWORD_HASH_WORKERS=0``, the old behaviour) and with the hashing
+process pool. For each run the script reports login and probe p50/p99 and
+how many logins were turned away with 503 by admission control.
+
+Usage: python benchmarks/login_storm.py [--logins 16] [--probes 4] [--seconds 10] [--workers 1]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def seed(app, users):
+    from models import db, User, ParkingLocation, Slot
+    from werkzeug.security import generate_password_hash
+
+    with app.app_context():
+        # Every user shares one hash so seeding does not take minutes
+        password_hash = generate_password_hash('storm')
+        accounts = [User(name=f'Storm {i}', email=f'storm{i}@example.com', phone=f'{9100000000 + i}',
+                         password_hash=password_hash) for i in range(users)]
+        location = ParkingLocation(name='Storm Lot', address='Nowhere', city='Test',
+                                   latitude=0.0, longitude=0.0)
+        slots = [Slot(parking_location=location, slot_number=f'S-{i:03d}', type='car',
+                      status='available', price_per_hour=10) for i in range(20)]
+        db.session.add_all(accounts + [location] + slots)
+        db.session.commit()
+        return [account.email for account in accounts], create_access_token(identity=accounts[0].id), location.id
+
+def run(workers, args):
+    from app import create_app
+    from models import db
+    from services.passwords import hasher
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, "storm.db")}',
+            'RESPONSE_CACHE_TTL': 0,
+            'SCHEDULER_ENABLED': False,
+            'PAYMENT_WORKERS': 0,
+            'RATELIMIT_ENABLED': False,
+            'PASSWORD_HASH_WORKERS': workers
+        })
+        emails, token, location_id = seed(app, args.logins)
+        # Start the pool before measuring
+        if workers:
+            hasher.hash('warm-up')
+
+        logins, probes = [], []
+        outcomes = Counter()
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def login_loop(email):
+            client = app.test_client()
+            while not stop.is_set():
+                started = time.perf_counter()
+                response = client.post('/api/auth/login', json={'email': email, 'password': 'storm'})
+                elapsed = time.perf_counter() - started
+                with lock:
+                    outcomes[response.status_code] += 1
+                    if response.status_code == 200:
+                        logins.append(elapsed)
+                # Well-behaved clients back off as told when turned away
+                if response.status_code == 503:
+                    stop.wait(float(response.headers.get('Retry-After', 1)))
+
+        def probe_loop():
+            client = app.test_client()
+            headers = {'Authorization': f'Bearer {token}'}
+            urls = ['/api/bookings', f'/api/parking/locations/{location_id}']
+            count = 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                client.get(urls[count % len(urls)], headers=headers)
+                elapsed = time.perf_counter() - started
+                count += 1
+                with lock:
+                    probes.append(elapsed)
+
+        threads = [threading.Thread(target=login_loop, args=(email,)) for email in emails]
+        threads += [threading.Thread(target=probe_loop) for _ in range(args.probes)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        hasher.shutdown()
+        with app.app_context():
+            db.engine.dispose()
+    return logins, probes, outcomes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=16)
+    parser.add_argument('--probes', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    args = parser.parse_args()
+
+    print(f'{args.logins} login threads + {args.probes} probe threads for {args.seconds:g}s')
+    print(f'{"hashing":16} {"logins/s":>9} {"login p50":>10} {"login p99":>10} {"503s":>6} '
+          f'{"probe p50":>10} {"probe p99":>10}')
+    for label, workers in (('request thread', 0), (f'pool x{args.workers}', args.workers)):
+        logins, probes, outcomes = run(workers, args)
+        print(f'{label:16} {len(logins) / args.seconds:9.1f} {percentile(logins, 0.5) * 1000:8.0f}ms '
+              f'{percentile(logins, 0.99) * 1000:8.0f}ms {outcomes[503]:6d} '
+              f'{percentile(probes, 0.5) * 1000:8.1f}ms {percentile(probes, 0.99) * 1000:8.1f}ms')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Measure payment initiation latency and settlement against a slow, flaky gateway.
+
+Seeds a scratch database with unpaid bookings, then initiates a payment for
+each one against the simulated gateway with the given latency and failure
+rates. Initiation should stay fast however slow the gateway is. The script
+then waits for the worker pool to settle every payment and reports the
+outcome counts and how long the pipeline took to drain.
+
+Usage: python benchmarks/payment_pipeline.py [--payments 200] [--latency-ms 300] [--failure-rate 0.3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token
+
+def seed(app, payments):
+    from models import db, User, ParkingLocation, Slot, Booking
+
+    with app.app_context():
+        user = User(name='Payer', email='payer@example.com', phone='9000000005')
+        user.set_password('payer')
+        location = ParkingLocation(name='Payment Lot', address='Nowhere', city='Test',
+                                   latitude=0.0, longitude=0.0)
+        slot = Slot(parking_location=location, slot_number='P-001', type='car',
+                    status='available', price_per_hour=10)
+        db.session.add_all([user, location, slot])
+        db.session.flush()
+
+        start = datetime.utcnow() + timedelta(days=1)
+        bookings = [Booking(user_id=user.id, slot_id=slot.id, vehicle_number='PAY',
+                            start_time=start + timedelta(hours=2 * i), end_time=start + timedelta(hours=2 * i + 1),
+                            total_amount=10, status='upcoming') for i in range(payments)]
+        db.session.add_all(bookings)
+        db.session.commit()
+        return create_access_token(identity=user.id), [booking.id for booking in bookings]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--payments', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=300)
+    parser.add_argument('--failure-rate', type=float, default=0.3)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    from app import create_app
+    from models import db, Payment
+    from services.payments import processor
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, "payments.db")}',
+            'SCHEDULER_ENABLED': False,
+            'PAYMENT_WORKERS': args.workers,
+            'PAYMENT_GATEWAY_LATENCY_MS': args.latency_ms,
+            'PAYMENT_GATEWAY_FAILURE_RATE': args.failure_rate,
+            'PAYMENT_RETRY_BASE_SECONDS': 0.1,
+            'PAYMENT_RETRY_MAX_SECONDS': 2
+        })
+        token, booking_ids = seed(app, args.payments)
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+
+        latencies = []
+        started = time.perf_counter()
+        for booking_id in booking_ids:
+            request_started = time.perf_counter()
+            response = client.post('/api/payments/initiate', headers=headers, json={
+                'booking_id': booking_id, 'amount': 10, 'payment_method': 'upi'
+            })
+            latencies.append(time.perf_counter() - request_started)
+            if response.status_code != 202:
+                print(f'initiate failed: {response.status_code} {response.get_json()}')
+                return 1
+
+        with app.app_context():
+            while time.perf_counter() - started < args.timeout:
+                pending = Payment.query.filter_by(status='pending').count()
+                db.session.remove()
+                if not pending:
+                    break
+                time.sleep(0.1)
+            drained = time.perf_counter() - started
+            outcomes = Counter(status for status, in db.session.query(Payment.status))
+            processor.stop()
+            db.engine.dispose()
+
+    latencies.sort()
+    ok = not outcomes['pending']
+    print(f'gateway:    {args.latency_ms:g}ms latency, {args.failure_rate:.0%} transient failures, {args.workers} workers')
+    print(f'initiate:   p50 {statistics.median(latencies) * 1000:.1f}ms, '
+          f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms')
+    print(f'settled in: {drained:.2f}s for {args.payments} payments')
+    print(f'outcomes:   {dict(sorted(outcomes.items()))} {"OK" if ok else "FAIL"}')
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,458 @@
+"""Load-test the search and booking hot paths and compare results between runs.
+
+Seeds a scratch database with cities full of locations and slots, users and
+pools of bookings, then drives the app with a weighted mix of requests at
+each concurrency level for a fixed time. Requests go through the Flask test
+client in-process by default, or over HTTP to a threaded server started on a
+local port with ``--target http``.
+
+Scenarios: search, location_detail, location_quote, booking_create,
+booking_cancel, booking_extend, payment_initiate and login. ``--mix`` takes one of the named
+mixes below or a single scenario name.
+
+For every level the script prints throughput and p50/p95/p99 latency per
+scenario. It saves everything, together with the git revision and settings,
+as JSON. ``compare`` lines two result files up and flags regressions.
+
+Usage:
+  python benchmarks/run.py [--mix mixed] [--concurrency 1,8,32] [--seconds 10] [--target client|http]
+                           [--output results.json]
+  python benchmarks/run.py compare OLD.json NEW.json [--threshold 10]
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND, 'benchmarks', 'results')
+PASSWORD = 'bench-password'
+
+CITIES = [
+    ('Mumbai', 19.0760, 72.8777), ('Delhi', 28.6139, 77.2090), ('Bengaluru', 12.9716, 77.5946),
+    ('Kolkata', 22.5726, 88.3639), ('Hyderabad', 17.3850, 78.4867), ('Pune', 18.5204, 73.8567),
+]
+
+MIXES = {
+    'browse': {'search': 60, 'location_detail': 35, 'login': 5},
+    'booking': {'booking_create': 40, 'booking_cancel': 15, 'booking_extend': 15,
+                'payment_initiate': 20, 'location_detail': 10},
+    'mixed': {'search': 35, 'location_detail': 25, 'booking_create': 15, 'booking_cancel': 5,
+              'booking_extend': 5, 'payment_initiate': 10, 'login': 5},
+}
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+class Dataset:
+    """Ids and per-user booking pools the scenarios draw from"""
+
+    def __init__(self):
+        self.users = []
+        self.locations = []
+        self.slots = []
+        self.pools = defaultdict(deque)
+        self.lock = threading.Lock()
+        self.windows = itertools.count()
+        self.window_start = (datetime.utcnow() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+
+    def take(self, pool, user_id):
+        with self.lock:
+            queue = self.pools[(pool, user_id)]
+            return queue.popleft() if queue else None
+
+    def next_window(self):
+        """A slot and window nobody else books, so creates never conflict"""
+        with self.lock:
+            number = next(self.windows)
+        slot_id = self.slots[number % len(self.slots)]
+        start = self.window_start + timedelta(hours=3 * (number // len(self.slots)))
+        return slot_id, start, start + timedelta(hours=1)
+
+def seed(app, args, rng):
+    """Bulk insert the dataset and return a ``Dataset`` describing it"""
+    from models import db, User, ParkingLocation, Slot, Booking
+    from services.counters import reconcile_counters
+    from services.principals import token_claims
+    from werkzeug.security import generate_password_hash
+
+    dataset = Dataset()
+    now = datetime.utcnow()
+    with app.app_context():
+        # One real hash shared by every user keeps seeding fast and logins realistic
+        password_hash = generate_password_hash(PASSWORD, method=app.config['PASSWORD_HASH_METHOD'])
+        users = [{'id': str(uuid.uuid4()), 'name': f'Bench {i}', 'email': f'bench{i}@example.com',
+                  'phone': f'{9500000000 + i}', 'password_hash': password_hash, 'role': 'user',
+                  'created_at': now, 'updated_at': now} for i in range(args.users)]
+        db.session.execute(insert(User), users)
+
+        locations, slots = [], []
+        for i in range(args.locations):
+            city, lat, lng = CITIES[i % len(CITIES)]
+            location_id = str(uuid.uuid4())
+            locations.append({'id': location_id, 'name': f'{city} Lot {i}', 'address': f'{i} Bench Road',
+                              'city': city, 'latitude': lat + rng.gauss(0, 0.1), 'longitude': lng + rng.gauss(0, 0.1),
+                              'total_slots': 0, 'available_slots': 0, 'is_active': True,
+                              'created_at': now, 'updated_at': now})
+            for number in range(args.slots):
+                slots.append({'id': str(uuid.uuid4()), 'parking_location_id': location_id,
+                              'slot_number': f'B-{number:03d}', 'type': 'car' if number % 4 else 'bike',
+                              'status': 'available', 'price_per_hour': float(rng.choice([20, 30, 40, 50])),
+                              'version': 1, 'created_at': now, 'updated_at': now})
+        db.session.execute(insert(ParkingLocation), locations)
+        db.session.execute(insert(Slot), slots)
+
+        # Bookings to cancel, extend and pay for, a year out so creates never meet them
+        bookings = []
+        pool_start = now.replace(minute=0, second=0, microsecond=0) + timedelta(days=365)
+        for number in range(args.users * args.pool):
+            user = users[number % args.users]
+            slot = slots[number % len(slots)]
+            start = pool_start + timedelta(hours=3 * (number // len(slots)))
+            booking_id = str(uuid.uuid4())
+            pool = ('booking_cancel', 'booking_extend', 'payment_initiate')[(number // args.users) % 3]
+            # Only active bookings can be extended; the scheduler is off, so they stay that way
+            status = 'active' if pool == 'booking_extend' else 'upcoming'
+            bookings.append({'id': booking_id, 'user_id': user['id'], 'slot_id': slot['id'],
+                             'vehicle_number': 'BENCH', 'start_time': start, 'end_time': start + timedelta(hours=1),
+                             'total_amount': slot['price_per_hour'], 'status': status, 'version': 1,
+                             'created_at': now, 'updated_at': now})
+            dataset.pools[(pool, user['id'])].append((booking_id, slot['price_per_hour']))
+        for offset in range(0, len(bookings), 10000):
+            db.session.execute(insert(Booking), bookings[offset:offset + 10000])
+        db.session.commit()
+        reconcile_counters()
+
+        dataset.users = [(user['id'], user['email'], create_access_token(identity=user['id'],
+                                                                         additional_claims=token_claims(User(role='user'))))
+                         for user in users]
+        dataset.locations = [location['id'] for location in locations]
+        dataset.slots = [slot['id'] for slot in slots]
+        db.engine.dispose()
+    return dataset
+
+class ClientDriver:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json=None, headers=None):
+        response = self.client.open(path, method=method, json=json, headers=headers)
+        status = response.status_code
+        response.close()
+        return status
+
+class HttpDriver:
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def request(self, method, path, json=None, headers=None):
+        return self.session.request(method, self.base_url + path, json=json, headers=headers).status_code
+
+class Worker:
+    """One simulated client: its own user, token and random stream"""
+
+    def __init__(self, number, driver, dataset, seed):
+        self.driver = driver
+        self.dataset = dataset
+        self.rng = random.Random(seed * 1000 + number)
+        self.user_id, self.email, token = dataset.users[number % len(dataset.users)]
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    def search(self):
+        if self.rng.random() < 0.5:
+            city = self.rng.choice(CITIES)[0]
+            return self.driver.request('GET', f'/api/parking/locations?city={city}&limit=20')
+        _, lat, lng = self.rng.choice(CITIES)
+        return self.driver.request('GET', f'/api/parking/locations?lat={lat + self.rng.gauss(0, 0.05):.5f}'
+                                          f'&lng={lng + self.rng.gauss(0, 0.05):.5f}&radius_km=5&limit=20')
+
+    def location_detail(self):
+        return self.driver.request('GET', f'/api/parking/locations/{self.rng.choice(self.dataset.locations)}')
+
+    def location_quote(self):
+        start = self.dataset.window_start + timedelta(hours=self.rng.randrange(24 * 30))
+        windows = [{'start_time': (start + timedelta(hours=hour)).isoformat(),
+                    'end_time': (start + timedelta(hours=hour + length)).isoformat()}
+                   for hour in range(0, 24, 2) for length in (1, 3)]
+        return self.driver.request('POST', f'/api/parking/locations/{self.rng.choice(self.dataset.locations)}/quote',
+                                   json={'windows': windows})
+
+    def booking_create(self):
+        slot_id, start, end = self.dataset.next_window()
+        return self.driver.request('POST', '/api/bookings', headers=self.headers, json={
+            'slot_id': slot_id, 'vehicle_number': 'BENCH',
+            'start_time': start.isoformat(), 'end_time': end.isoformat()
+        })
+
+    def booking_cancel(self):
+        booking = self.dataset.take('booking_cancel', self.user_id)
+        if booking is None:
+            return None
+        return self.driver.request('POST', f'/api/bookings/{booking[0]}/cancel', headers=self.headers)
+
+    def booking_extend(self):
+        booking = self.dataset.take('booking_extend', self.user_id)
+        if booking is None:
+            return None
+        return self.driver.request('POST', f'/api/bookings/{booking[0]}/extend', headers=self.headers,
+                                   json={'additional_hours': 1})
+
+    def payment_initiate(self):
+        booking = self.dataset.take('payment_initiate', self.user_id)
+        if booking is None:
+            return None
+        return self.driver.request('POST', '/api/payments/initiate', headers=self.headers, json={
+            'booking_id': booking[0], 'amount': booking[1], 'payment_method': 'upi'
+        })
+
+    def login(self):
+        return self.driver.request('POST', '/api/auth/login', json={'email': self.email, 'password': PASSWORD})
+
+def run_level(make_driver, dataset, mix, concurrency, seconds, warmup, seed, first_user=0):
+    """Run ``concurrency`` workers for ``warmup + seconds``; returns per-scenario samples"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = defaultdict(list)
+    statuses = defaultdict(Counter)
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+    window = {}
+
+    def loop(number):
+        worker = Worker(first_user + number, make_driver(), dataset, seed)
+        local_samples = defaultdict(list)
+        local_statuses = defaultdict(Counter)
+        barrier.wait()
+        while True:
+            now = time.perf_counter()
+            if now >= window['end']:
+                break
+            name = worker.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            status = getattr(worker, name)()
+            elapsed = time.perf_counter() - started
+            if status is None:
+                local_statuses[name]['skipped'] += 1
+                continue
+            if started >= window['start']:
+                local_samples[name].append(elapsed)
+                local_statuses[name][status] += 1
+        with lock:
+            for name, values in local_samples.items():
+                samples[name].extend(values)
+            for name, counts in local_statuses.items():
+                statuses[name].update(counts)
+
+    threads = [threading.Thread(target=loop, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    window['start'] = time.perf_counter() + warmup
+    window['end'] = window['start'] + seconds
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    return samples, statuses
+
+def summarise(samples, statuses, seconds):
+    scenarios = {}
+    everything = []
+    for name in sorted(set(samples) | set(statuses)):
+        values = sorted(samples.get(name, []))
+        everything.extend(values)
+        counts = statuses.get(name, Counter())
+        ok = sum(count for status, count in counts.items() if isinstance(status, int) and status < 400)
+        scenarios[name] = {
+            'requests': len(values),
+            'ok': ok,
+            'errors': {str(status): count for status, count in counts.items()
+                       if status == 'skipped' or status >= 400},
+            'throughput': len(values) / seconds,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'mean_ms': (sum(values) / len(values) * 1000) if values else 0.0,
+            'max_ms': (values[-1] * 1000) if values else 0.0,
+        }
+    everything.sort()
+    overall = {
+        'requests': len(everything),
+        'throughput': len(everything) / seconds,
+        'p50_ms': percentile(everything, 0.50) * 1000,
+        'p95_ms': percentile(everything, 0.95) * 1000,
+        'p99_ms': percentile(everything, 0.99) * 1000,
+    }
+    return overall, scenarios
+
+def print_level(result):
+    print(f'\n{result["mix"]} via {result["target"]}, concurrency {result["concurrency"]}: '
+          f'{result["overall"]["throughput"]:.1f} req/s, p99 {result["overall"]["p99_ms"]:.1f}ms')
+    print(f'  {"scenario":18} {"req/s":>8} {"p50":>9} {"p95":>9} {"p99":>9}  errors')
+    for name, stats in result['scenarios'].items():
+        errors = ', '.join(f'{status}: {count}' for status, count in stats['errors'].items()) or '-'
+        print(f'  {name:18} {stats["throughput"]:8.1f} {stats["p50_ms"]:7.1f}ms {stats["p95_ms"]:7.1f}ms '
+              f'{stats["p99_ms"]:7.1f}ms  {errors}')
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def start_server(app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def run(args):
+    if args.mix in MIXES:
+        mix = MIXES[args.mix]
+    elif hasattr(Worker, args.mix) and not args.mix.startswith('_'):
+        mix = {args.mix: 1}
+    else:
+        print(f'unknown mix or scenario: {args.mix}')
+        return 2
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    from app import create_app
+    from models import db
+
+    rng = random.Random(args.seed)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        config = {
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, "bench.db")}',
+            'SCHEDULER_ENABLED': False,
+            'RATELIMIT_ENABLED': args.rate_limits,
+        }
+        if args.no_cache:
+            config['RESPONSE_CACHE_TTL'] = 0
+        dataset = seed(create_app(config), args, rng)
+        # A fresh app builds its in-memory indexes from the seeded database
+        app = create_app(config)
+
+        server = None
+        if args.target == 'http':
+            server, base_url = start_server(app)
+            make_driver = lambda: HttpDriver(base_url)
+        else:
+            make_driver = lambda: ClientDriver(app)
+
+        try:
+            first_user = 0
+            for concurrency in levels:
+                # Each level starts on fresh users so earlier levels have not drained their pools
+                samples, statuses = run_level(make_driver, dataset, mix, concurrency,
+                                              args.seconds, args.warmup, args.seed, first_user)
+                first_user += concurrency
+                overall, scenarios = summarise(samples, statuses, args.seconds)
+                result = {'mix': args.mix, 'target': args.target, 'concurrency': concurrency,
+                          'seconds': args.seconds, 'overall': overall, 'scenarios': scenarios}
+                print_level(result)
+                results.append(result)
+        finally:
+            if server is not None:
+                server.shutdown()
+            from services.passwords import hasher
+            from services.payments import processor
+            hasher.shutdown()
+            processor.stop()
+            with app.app_context():
+                db.engine.dispose()
+
+    output = args.output or os.path.join(RESULTS_DIR, f'{datetime.now():%Y%m%d-%H%M%S}-{args.mix}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as handle:
+        json.dump({
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+            },
+            'runs': results,
+        }, handle, indent=2)
+    print(f'\nSaved {output}')
+    return 0
+
+def compare(args):
+    with open(args.old) as handle:
+        old = json.load(handle)
+    with open(args.new) as handle:
+        new = json.load(handle)
+
+    print(f'old: {args.old} (revision {old["meta"].get("revision")})')
+    print(f'new: {args.new} (revision {new["meta"].get("revision")})')
+    baseline = {(run['mix'], run['target'], run['concurrency']): run for run in old['runs']}
+    regressions = 0
+    for run in new['runs']:
+        before = baseline.get((run['mix'], run['target'], run['concurrency']))
+        if before is None:
+            continue
+        print(f'\n{run["mix"]} via {run["target"]}, concurrency {run["concurrency"]}')
+        print(f'  {"scenario":18} {"req/s":>18} {"p50 ms":>20} {"p99 ms":>20}')
+        for name, stats in run['scenarios'].items():
+            previous = before['scenarios'].get(name)
+            if previous is None or not previous['requests'] or not stats['requests']:
+                continue
+            changes = []
+            flagged = False
+            for metric, worse_when_higher in (('throughput', False), ('p50_ms', True), ('p99_ms', True)):
+                change = (stats[metric] - previous[metric]) / previous[metric] * 100 if previous[metric] else 0.0
+                worse = change > args.threshold if worse_when_higher else change < -args.threshold
+                flagged = flagged or worse
+                changes.append(f'{previous[metric]:7.1f} → {stats[metric]:7.1f} {change:+5.0f}%')
+            regressions += flagged
+            print(f'  {name:18} ' + '  '.join(changes) + ('  REGRESSION' if flagged else ''))
+    print(f'\n{regressions} regression(s) beyond {args.threshold:g}%')
+    return 1 if regressions else 0
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+        parser.add_argument('old')
+        parser.add_argument('new')
+        parser.add_argument('--threshold', type=float, default=10.0, help='percent change flagged as a regression')
+        return compare(parser.parse_args(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mix', default='mixed', help=f'one of {", ".join(MIXES)} or a single scenario')
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--target', choices=['client', 'http'], default='client')
+    parser.add_argument('--locations', type=int, default=500)
+    parser.add_argument('--slots', type=int, default=20)
+    parser.add_argument('--users', type=int, default=64)
+    parser.add_argument('--pool', type=int, default=150, help='seeded bookings per user to cancel, extend and pay')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-cache', action='store_true', help='turn the response cache off')
+    parser.add_argument('--rate-limits', action='store_true', help='keep rate limiting on')
+    parser.add_argument('--output')
+    return run(parser.parse_args())
+
+if __name__ == '__main__':
+    sys.exit(main())
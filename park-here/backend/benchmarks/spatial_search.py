@@ -0,0 +1,88 @@
+"""Benchmark nearest-location search on the grid index against a full scan.
+
+Usage: python benchmarks/spatial_search.py [--locations 100000] [--queries 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.spatial import SpatialIndex, haversine_km
+
+# Rough city centres so the synthetic data is clustered like real demand
+CITIES = [
+    (19.0760, 72.8777), (28.6139, 77.2090), (13.1986, 77.7066),
+    (12.9716, 77.5946), (22.5726, 88.3639), (17.3850, 78.4867),
+    (18.5204, 73.8567), (23.0225, 72.5714), (26.9124, 75.7873),
+]
+
+def generate_points(count, rng):
+    points = []
+    for i in range(count):
+        lat, lng = rng.choice(CITIES)
+        points.append((f'loc-{i}', lat + rng.gauss(0, 0.15), lng + rng.gauss(0, 0.15)))
+    return points
+
+def brute_force(points, lat, lng, radius_km, limit):
+    hits = []
+    for location_id, p_lat, p_lng in points:
+        distance = haversine_km(lat, lng, p_lat, p_lng)
+        if distance <= radius_km:
+            hits.append((distance, location_id))
+    hits.sort()
+    return hits[:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--locations', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--radius-km', type=float, default=10.0)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--cell-degrees', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    points = generate_points(args.locations, rng)
+
+    index = SpatialIndex(args.cell_degrees)
+    started = time.perf_counter()
+    for location_id, lat, lng in points:
+        index.upsert(location_id, lat, lng)
+    build_seconds = time.perf_counter() - started
+
+    queries = []
+    for _ in range(args.queries):
+        lat, lng = rng.choice(CITIES)
+        queries.append((lat + rng.gauss(0, 0.2), lng + rng.gauss(0, 0.2)))
+
+    started = time.perf_counter()
+    indexed = [list(islice(index.nearest(lat, lng, args.radius_km), args.limit)) for lat, lng in queries]
+    index_seconds = time.perf_counter() - started
+
+    # A full scan is slow, so only sample enough queries to compare
+    sample = queries[:max(1, min(len(queries), 50))]
+    started = time.perf_counter()
+    scanned = [brute_force(points, lat, lng, args.radius_km, args.limit) for lat, lng in sample]
+    scan_seconds = (time.perf_counter() - started) * len(queries) / len(sample)
+
+    mismatches = sum(
+        1 for got, expected in zip(indexed, scanned)
+        if [location_id for _, location_id in got] != [location_id for _, location_id in expected]
+    )
+
+    print(f'locations:        {args.locations}')
+    print(f'index build:      {build_seconds * 1000:.1f} ms')
+    print(f'indexed search:   {index_seconds / len(queries) * 1000:.3f} ms/query')
+    print(f'full scan:        {scan_seconds / len(queries) * 1000:.3f} ms/query (extrapolated)')
+    print(f'speedup:          {scan_seconds / index_seconds:.1f}x')
+    print(f'result mismatches: {mismatches}/{len(sample)}')
+
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
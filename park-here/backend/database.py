@@ -0,0 +1,83 @@
+"""Engine setup for the SQLAlchemy extension.
+
+The database URL and pool settings come from the app config (filled from the
+environment in ``create_app``). On SQLite every new connection is switched to
+the configured journal mode (WAL by default), so readers no longer block
+behind a writer. It also gets ``synchronous=NORMAL``, which is durable under
+WAL, and a busy timeout that makes writers wait for the lock instead of
+failing at once with ``database is locked``. A shared page cache can be
+turned on with ``SQLITE_SHARED_CACHE``.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from extensions import db
+
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+def _is_sqlite(url):
+    return url.get_backend_name() == 'sqlite'
+
+def _is_memory(url):
+    return url.database in (None, '', ':memory:')
+
+def engine_options(config):
+    """Build ``SQLALCHEMY_ENGINE_OPTIONS`` from the pool settings in ``config``"""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+
+    # In-memory SQLite uses a single static connection, which takes no pool settings
+    if _is_sqlite(url) and _is_memory(url):
+        return options
+
+    for option, key in (
+        ('pool_size', 'DB_POOL_SIZE'),
+        ('max_overflow', 'DB_MAX_OVERFLOW'),
+        ('pool_timeout', 'DB_POOL_TIMEOUT'),
+        ('pool_recycle', 'DB_POOL_RECYCLE'),
+        ('pool_pre_ping', 'DB_POOL_PRE_PING'),
+    ):
+        if config.get(key) is not None:
+            options.setdefault(option, config[key])
+    return options
+
+def _shared_cache_uri(uri):
+    url = make_url(uri)
+    if not _is_sqlite(url) or _is_memory(url) or url.query.get('uri'):
+        return uri
+    # pysqlite only honours cache=shared on URI filenames
+    url = url.set(database=f'file:{url.database}')
+    return url.update_query_dict({'cache': 'shared', 'uri': 'true'}).render_as_string(hide_password=False)
+
+def _pragma_listener(journal_mode, synchronous, busy_timeout_ms):
+    if journal_mode and journal_mode.upper() not in JOURNAL_MODES:
+        raise ValueError(f'SQLITE_JOURNAL_MODE must be one of {", ".join(JOURNAL_MODES)}')
+    if synchronous and synchronous.upper() not in SYNCHRONOUS_MODES:
+        raise ValueError(f'SQLITE_SYNCHRONOUS must be one of {", ".join(SYNCHRONOUS_MODES)}')
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA busy_timeout = {int(busy_timeout_ms)}')
+        if journal_mode:
+            cursor.execute(f'PRAGMA journal_mode = {journal_mode.upper()}')
+        if synchronous:
+            cursor.execute(f'PRAGMA synchronous = {synchronous.upper()}')
+        cursor.close()
+    return set_pragmas
+
+def init_app(app):
+    config = app.config
+    if config.get('SQLITE_SHARED_CACHE'):
+        config['SQLALCHEMY_DATABASE_URI'] = _shared_cache_uri(config['SQLALCHEMY_DATABASE_URI'])
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(config)
+
+    db.init_app(app)
+
+    if _is_sqlite(make_url(config['SQLALCHEMY_DATABASE_URI'])):
+        listener = _pragma_listener(
+            config.get('SQLITE_JOURNAL_MODE'),
+            config.get('SQLITE_SYNCHRONOUS'),
+            config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)
+        )
+        with app.app_context():
+            event.listen(db.engine, 'connect', listener)
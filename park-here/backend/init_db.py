@@ -1,8 +1,30 @@
 from app import create_app
 from models import db, User, ParkingLocation, Slot, Booking, Payment
 from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import insert, text
+from werkzeug.security import generate_password_hash
+import argparse
+import math
+import random
+import sys
+import time
 import uuid
 
+# Synthetic data: city, latitude, longitude and relative share of locations
+CITIES = [
+    ('Mumbai', 19.0760, 72.8777, 10), ('Delhi', 28.6139, 77.2090, 10), ('Bangalore', 12.9716, 77.5946, 8),
+    ('Hyderabad', 17.3850, 78.4867, 6), ('Chennai', 13.0827, 80.2707, 6), ('Kolkata', 22.5726, 88.3639, 5),
+    ('Pune', 18.5204, 73.8567, 5), ('Ahmedabad', 23.0225, 72.5714, 4), ('Jaipur', 26.9124, 75.7873, 3),
+    ('Lucknow', 26.8467, 80.9462, 2), ('Kochi', 9.9312, 76.2673, 2), ('Chandigarh', 30.7333, 76.7794, 2),
+]
+SLOT_TYPES = [('car', 70, 50), ('bike', 20, 30), ('ev', 6, 80), ('handicap', 4, 40)]  # type, share, base price
+PAYMENT_METHODS = [('upi', 55), ('card', 25), ('wallet', 15), ('cash', 5)]
+# Relative booking demand by hour of day and by weekday (Monday first)
+HOURLY_DEMAND = [1, 0.5, 0.3, 0.3, 0.4, 1, 3, 7, 10, 9, 7, 6, 6, 6, 6, 6, 7, 9, 10, 8, 6, 4, 3, 2]
+WEEKDAY_DEMAND = [1.0, 1.0, 1.0, 1.0, 1.1, 0.8, 0.6]
+SYNTHETIC_PASSWORD = 'synthetic123'
+
 def init_db():
     app = create_app()
     with app.app_context():
@@ -46,32 +68,27 @@ def init_db():
                     'address': '123 Main St, City Center',
                     'city': 'Mumbai',
                     'latitude': 19.0760,
-                    'longitude': 72.8777,
-                    'total_slots': 50,
-                    'available_slots': 30
+                    'longitude': 72.8777
                 },
                 {
                     'name': 'Mall Parking',
                     'address': '456 Shopping St, Downtown',
                     'city': 'Delhi',
                     'latitude': 28.6139,
-                    'longitude': 77.2090,
-                    'total_slots': 100,
-                    'available_slots': 45
+                    'longitude': 77.2090
                 },
                 {
                     'name': 'Airport Parking',
                     'address': 'Airport Road',
                     'city': 'Bangalore',
                     'latitude': 13.1986,
-                    'longitude': 77.7066,
-                    'total_slots': 200,
-                    'available_slots': 120
+                    'longitude': 77.7066
                 }
             ]
             
+            # Slot counts on each location are filled in by the slot counters
             for loc_data in locations:
-                location = ParkingLocation(**loc_data)
+                location = ParkingLocation(total_slots=0, available_slots=0, **loc_data)
                 db.session.add(location)
                 
                 # Create some slots for each location
@@ -92,5 +109,249 @@ def init_db():
         db.session.commit()
         print("Database initialized successfully!")
 
-if __name__ == '__main__':
+class SyntheticData:
+    """Generates a production-sized dataset and bulk inserts it in batches
+
+    Everything random comes from one seeded generator, so the same seed,
+    volumes and end date always produce the same rows. Bookings on a slot
+    never overlap. Their start times follow the hourly and weekday demand
+    curves above and their durations are log-normal around 90 minutes.
+    Status and payments follow from where a booking falls relative to the
+    end date.
+    """
+
+    ORDER = (User, ParkingLocation, Slot, Booking, Payment)
+
+    def __init__(self, connection, options):
+        self.connection = connection
+        self.options = options
+        self.rng = random.Random(options.seed)
+        self.now = options.end_date
+        self.window_start = self.now - timedelta(days=options.days)
+        self.window_seconds = int((options.future_days + options.days) * 86400)
+        self.batches = {model: [] for model in self.ORDER}
+        self.inserted = {model: 0 for model in self.ORDER}
+        self.started = time.monotonic()
+        self.user_ids = []
+
+        self.city_weights = list(accumulate(city[3] for city in CITIES))
+        self.type_weights = list(accumulate(slot_type[1] for slot_type in SLOT_TYPES))
+        self.method_weights = list(accumulate(method[1] for method in PAYMENT_METHODS))
+        # Start of every hour in the window, weighted by demand at that hour
+        self.hours = list(range(0, self.window_seconds, 3600))
+        self.hour_weights = list(accumulate(
+            HOURLY_DEMAND[moment.hour] * WEEKDAY_DEMAND[moment.weekday()]
+            for moment in (self.window_start + timedelta(seconds=offset) for offset in self.hours)
+        ))
+
+    def uuid(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def at(self, offset):
+        return self.window_start + timedelta(seconds=offset)
+
+    def add(self, model, row):
+        batch = self.batches[model]
+        batch.append(row)
+        if len(batch) >= self.options.batch_size:
+            self.flush()
+
+    def flush(self):
+        # Parents before children, one transaction per batch
+        for model in self.ORDER:
+            rows = self.batches[model]
+            if rows:
+                self.connection.execute(insert(model), rows)
+                self.inserted[model] += len(rows)
+                self.batches[model] = []
+        self.connection.commit()
+        elapsed = time.monotonic() - self.started
+        print(f"  {elapsed:7.0f}s  " + ', '.join(
+            f"{model.__tablename__} {count:,}" for model, count in self.inserted.items()
+        ), flush=True)
+
+    def generate(self):
+        self.users()
+        expected_slots = self.options.locations * self.options.slots_per_location
+        bookings_per_slot = self.options.bookings / max(expected_slots, 1)
+        for index in range(self.options.locations):
+            self.location(index, bookings_per_slot)
+        self.flush()
+        return self.inserted
+
+    def users(self):
+        # One shared hash; hashing millions of passwords would dominate the run
+        password_hash = generate_password_hash(SYNTHETIC_PASSWORD)
+        for index in range(self.options.users):
+            user_id = self.uuid()
+            created_at = self.window_start - timedelta(seconds=self.rng.randint(0, 365 * 86400))
+            self.user_ids.append(user_id)
+            self.add(User, {
+                'id': user_id, 'name': f"Synthetic User {index}", 'email': f"synthetic{index}@example.com",
+                'phone': f"7{index:09d}", 'password_hash': password_hash, 'role': 'user',
+                'created_at': created_at, 'updated_at': created_at
+            })
+
+    def location(self, index, bookings_per_slot):
+        rng = self.rng
+        city, latitude, longitude, _ = rng.choices(CITIES, cum_weights=self.city_weights)[0]
+        location_id = self.uuid()
+        created_at = self.window_start - timedelta(days=rng.randint(1, 365))
+        self.add(ParkingLocation, {
+            'id': location_id, 'name': f"{city} Parking {index}", 'address': f"{index} Synthetic Road, {city}",
+            'city': city, 'latitude': latitude + rng.gauss(0, 0.08), 'longitude': longitude + rng.gauss(0, 0.08),
+            'total_slots': 0, 'available_slots': 0, 'is_active': rng.random() > 0.02,
+            'created_at': created_at, 'updated_at': created_at
+        })
+
+        # Log-normal sizes and popularity, both with a mean of one times the average
+        slot_count = max(1, round(rng.lognormvariate(math.log(self.options.slots_per_location) - 0.125, 0.5)))
+        popularity = rng.lognormvariate(-0.18, 0.6)
+        price_factor = rng.choice([0.8, 1.0, 1.0, 1.2, 1.5])
+        for number in range(1, slot_count + 1):
+            slot_type, _, base_price = rng.choices(SLOT_TYPES, cum_weights=self.type_weights)[0]
+            slot_id = self.uuid()
+            price = float(max(10, round(base_price * price_factor / 5) * 5))
+            self.add(Slot, {
+                'id': slot_id, 'parking_location_id': location_id, 'slot_number': f"S-{number:05d}",
+                'type': slot_type, 'status': 'maintenance' if rng.random() < 0.03 else 'available',
+                'price_per_hour': price, 'version': 1, 'created_at': created_at, 'updated_at': created_at
+            })
+            self.bookings(slot_id, price, bookings_per_slot * popularity)
+
+    def bookings(self, slot_id, price, mean):
+        rng = self.rng
+        count = max(0, round(rng.gauss(mean, math.sqrt(mean)))) if mean > 0 else 0
+        if not count:
+            return
+        # Demand weighted hours, a random minute within each, on a five minute grid
+        starts = sorted(
+            (hour + rng.randrange(3600)) // 300 * 300
+            for hour in rng.choices(self.hours, cum_weights=self.hour_weights, k=count)
+        )
+        now = (self.now - self.window_start).total_seconds()
+        for position, start in enumerate(starts):
+            # Clip to the next booking on the slot so none overlap
+            room = (starts[position + 1] if position + 1 < count else self.window_seconds) - start
+            duration = min(12 * 3600, math.ceil(rng.lognormvariate(math.log(5400), 0.7) / 900) * 900)
+            duration = min(duration, room // 900 * 900)
+            if duration < 900:
+                continue
+            end = start + duration
+
+            if rng.random() < 0.07:
+                status = 'cancelled'
+            elif end <= now:
+                status = 'completed'
+            elif start <= now:
+                status = 'active'
+            else:
+                status = 'upcoming'
+            # Booked a while ahead, but never after the end date
+            created = min(start - max(300, int(rng.expovariate(1 / 21600))), int(now) - rng.randint(60, 3600))
+            actual_end = None
+            if status == 'completed':
+                actual_end = self.at(max(start + 300, end + int(rng.gauss(0, 480))))
+
+            booking_id = self.uuid()
+            user_id = self.user_ids[int(len(self.user_ids) * rng.random() ** 2)]
+            amount = round(duration / 3600 * price, 2)
+            self.add(Booking, {
+                'id': booking_id, 'user_id': user_id, 'slot_id': slot_id,
+                'vehicle_number': f"MH{rng.randint(1, 50):02d}AB{rng.randint(0, 9999):04d}",
+                'start_time': self.at(start), 'end_time': self.at(end), 'actual_end_time': actual_end,
+                'total_amount': amount, 'status': status, 'version': 1,
+                'created_at': self.at(created), 'updated_at': actual_end or self.at(created)
+            })
+            self.payments(booking_id, user_id, amount, status, created)
+
+    def payments(self, booking_id, user_id, amount, booking_status, created):
+        rng = self.rng
+        if booking_status == 'cancelled':
+            statuses = ['refunded'] if rng.random() < 0.5 else []
+        elif booking_status == 'upcoming':
+            roll = rng.random()
+            statuses = ['completed'] if roll < 0.7 else ['pending'] if roll < 0.75 else []
+        else:
+            statuses = ['failed', 'completed'] if rng.random() < 0.04 else ['completed']
+
+        for status in statuses:
+            created += rng.randint(10, 600)
+            payment_id = self.uuid()
+            self.add(Payment, {
+                'id': payment_id, 'booking_id': booking_id, 'user_id': user_id, 'amount': amount,
+                'payment_method': rng.choices(PAYMENT_METHODS, cum_weights=self.method_weights)[0][0],
+                'transaction_id': f"TXN{int(self.at(created).timestamp())}{payment_id.replace('-', '')[:16].upper()}",
+                'status': status, 'payment_details': None,
+                'created_at': self.at(created), 'updated_at': self.at(created)
+            })
+
+def generate_synthetic(options):
+    """Fill an empty database with generated locations, slots, users, bookings and payments"""
+    from services.counters import reconcile_counters
+
+    config = {'SCHEDULER_ENABLED': False, 'PAYMENT_WORKERS': 0}
+    if options.database_url:
+        config['SQLALCHEMY_DATABASE_URI'] = options.database_url
+    app = create_app(config)
+    with app.app_context():
+        if db.session.query(ParkingLocation.id).first() is not None:
+            print("Database already has parking locations; point --database-url at an empty database")
+            return 1
+
+        print(f"Generating {options.locations:,} locations with ~{options.slots_per_location} slots each, "
+              f"{options.users:,} users and ~{options.bookings:,} bookings (seed {options.seed})...")
+        started = time.monotonic()
+        # Secondary indexes are dropped for the load and built once at the end
+        tables = [model.__table__ for model in (Slot, Booking, Payment)]
+        indexes = [index for table in tables for index in table.indexes]
+        with db.engine.connect() as connection:
+            if db.engine.dialect.name == 'sqlite':
+                connection.execute(text('PRAGMA synchronous = OFF'))
+            for index in indexes:
+                index.drop(connection, checkfirst=True)
+            connection.commit()
+            try:
+                inserted = SyntheticData(connection, options).generate()
+            finally:
+                print("Building indexes...")
+                for index in indexes:
+                    index.create(connection, checkfirst=True)
+                if db.engine.dialect.name == 'sqlite':
+                    connection.execute(text('ANALYZE'))
+                connection.commit()
+
+        print("Rebuilding slot counters...")
+        reconcile_counters()
+        db.engine.dispose()
+
+    elapsed = time.monotonic() - started
+    print(f"Inserted {sum(inserted.values()):,} rows in {elapsed:.0f}s ("
+          + ', '.join(f"{model.__tablename__} {count:,}" for model, count in inserted.items()) + ")")
+    print(f"Synthetic users sign in as synthetic<N>@example.com with password {SYNTHETIC_PASSWORD!r}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the database tables and seed demo or synthetic data.")
+    parser.add_argument('--synthetic', action='store_true', help="generate a large dataset instead of the demo data")
+    parser.add_argument('--database-url', help="database to fill, defaults to DATABASE_URL")
+    parser.add_argument('--locations', type=int, default=1000)
+    parser.add_argument('--slots-per-location', type=int, default=100, help="average; sizes vary per location")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--bookings', type=int, default=1000000, help="approximate number of bookings")
+    parser.add_argument('--days', type=int, default=365, help="days of booking history")
+    parser.add_argument('--future-days', type=int, default=14, help="days of upcoming bookings")
+    parser.add_argument('--end-date', type=datetime.fromisoformat,
+                        default=datetime.utcnow().replace(minute=0, second=0, microsecond=0),
+                        help="the 'now' the history leads up to (ISO format), fix it for reproducible runs")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=20000)
+    options = parser.parse_args()
+
+    if options.synthetic:
+        return generate_synthetic(options)
     init_db()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,8 @@
+"""Add the optimistic concurrency ``version`` columns to slots and bookings"""
+from sqlalchemy import inspect
+
+def upgrade(conn):
+    inspector = inspect(conn)
+    for table in ('slots', 'bookings'):
+        if 'version' not in {column['name'] for column in inspector.get_columns(table)}:
+            conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
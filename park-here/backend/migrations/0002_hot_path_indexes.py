@@ -0,0 +1,13 @@
+"""Composite indexes for the booking overlap check, slot filters and payment lookups"""
+
+INDEXES = (
+    ('ix_bookings_slot_status_start', 'bookings', 'slot_id, status, start_time'),
+    ('ix_bookings_user_start', 'bookings', 'user_id, start_time'),
+    ('ix_slots_location_type_status', 'slots', 'parking_location_id, type, status'),
+    ('ix_payments_booking_status', 'payments', 'booking_id, status'),
+    ('ix_payments_user_created', 'payments', 'user_id, created_at'),
+)
+
+def upgrade(conn):
+    for name, table, columns in INDEXES:
+        conn.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
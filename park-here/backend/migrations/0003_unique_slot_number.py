@@ -0,0 +1,14 @@
+"""Enforce unique slot numbers within a location"""
+
+def upgrade(conn):
+    duplicates = conn.exec_driver_sql(
+        'SELECT parking_location_id, slot_number FROM slots '
+        'GROUP BY parking_location_id, slot_number HAVING COUNT(*) > 1'
+    ).fetchall()
+    if duplicates:
+        listed = ', '.join(f'{location_id}/{number}' for location_id, number in duplicates[:10])
+        raise RuntimeError(f'Duplicate slot numbers must be resolved before migrating: {listed}')
+
+    conn.exec_driver_sql(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_slots_location_number ON slots (parking_location_id, slot_number)'
+    )
@@ -0,0 +1,10 @@
+"""Indexes for the scheduler's scans of bookings due to start or end"""
+
+INDEXES = (
+    ('ix_bookings_status_start', 'bookings', 'status, start_time'),
+    ('ix_bookings_status_end', 'bookings', 'status, end_time'),
+)
+
+def upgrade(conn):
+    for name, table, columns in INDEXES:
+        conn.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
@@ -0,0 +1,84 @@
+"""Versioned schema migrations for databases created by ``db.create_all()``.
+
+``create_all`` only creates missing tables, so any later change to an
+existing table lives here as a numbered module, ``NNNN_description.py``,
+exposing ``upgrade(conn)``. Applied versions are recorded in
+``schema_migrations``. Each migration runs in its own transaction together
+with its bookkeeping row, so a failed migration leaves no trace. When several
+processes start at once, only the first one to insert the row applies it.
+
+Migrations must also be safe on a fresh database, where ``create_all`` has
+already built the current schema from the models.
+"""
+import importlib
+import os
+import re
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+_MODULE_PATTERN = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+def discover():
+    """Return ``[(version, name, module)]`` sorted by version"""
+    migrations = []
+    for filename in os.listdir(os.path.dirname(__file__)):
+        match = _MODULE_PATTERN.match(filename)
+        if match:
+            module = importlib.import_module(f'{__name__}.{filename[:-3]}')
+            migrations.append((int(match.group(1)), match.group(2), module))
+    migrations.sort(key=lambda migration: migration[0])
+    return migrations
+
+def _ensure_table(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at DATETIME NOT NULL)'
+        )
+
+def applied_versions(engine):
+    _ensure_table(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+def upgrade(engine):
+    """Apply pending migrations in order and return the ones applied"""
+    applied = applied_versions(engine)
+    ran = []
+    for version, name, module in discover():
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            if not _claim(conn, version, name):
+                continue
+            module.upgrade(conn)
+        ran.append((version, name))
+    return ran
+
+def _claim(conn, version, name):
+    # Recording the version first takes the write lock, which keeps a
+    # concurrent process from running the same migration
+    try:
+        conn.execute(
+            text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :now)'),
+            {'version': version, 'name': name, 'now': datetime.utcnow()}
+        )
+    except IntegrityError:
+        return False
+    return True
+
+def init_app(app):
+    from extensions import db
+
+    with app.app_context():
+        upgrade(db.engine)
+
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Apply pending schema migrations."""
+        ran = upgrade(db.engine)
+        for version, name in ran:
+            print(f'Applied {version:04d}_{name}')
+        if not ran:
+            print('Schema is up to date')
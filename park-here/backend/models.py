@@ -42,14 +42,37 @@ class ParkingLocation(db.Model):
     
     # Relationships
     slots = db.relationship('Slot', backref='parking_location', lazy=True)
+    counters = db.relationship('SlotCounter', lazy=True)
     
     def update_available_slots(self):
-        self.available_slots = Slot.query.filter_by(
-            parking_location_id=self.id, 
-            status='available'
-        ).count()
+        # Per-type counters are maintained on every slot write, so summing
+        # them is exact without counting slot rows
+        counters = SlotCounter.query.filter_by(parking_location_id=self.id).all()
+        self.total_slots = sum(counter.total for counter in counters)
+        self.available_slots = sum(counter.available for counter in counters)
         db.session.commit()
 
+class SlotCounter(db.Model):
+    __tablename__ = 'slot_counters'
+    
+    # Slot counts per location and slot type, kept in step with the slots
+    # table by services/counters.py
+    parking_location_id = db.Column(db.String(36), db.ForeignKey('parking_locations.id'), primary_key=True)
+    slot_type = db.Column(db.String(20), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    available = db.Column(db.Integer, nullable=False, default=0)
+    booked = db.Column(db.Integer, nullable=False, default=0)
+    maintenance = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'total': self.total,
+            'available': self.available,
+            'booked': self.booked,
+            'maintenance': self.maintenance
+        }
+
 class Slot(db.Model):
     __tablename__ = 'slots'
     
@@ -59,12 +82,26 @@ class Slot(db.Model):
     type = db.Column(db.String(20), nullable=False)  # 'car', 'bike', 'handicap', 'ev'
     status = db.Column(db.String(20), default='available')  # 'available', 'booked', 'maintenance'
     price_per_hour = db.Column(db.Float, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1)  # optimistic concurrency token
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     bookings = db.relationship('Booking', backref='slot', lazy=True)
     
+    # Optimistic concurrency: UPDATEs match on the version that was read
+    __mapper_args__ = {'version_id_col': version}
+    
+    # Indexes are created on existing databases by the migrations package
+    __table_args__ = (
+        db.Index('uq_slots_location_number', 'parking_location_id', 'slot_number', unique=True),
+        db.Index('ix_slots_location_type_status', 'parking_location_id', 'type', 'status'),
+    )
+    
+    def touch(self):
+        # Force a versioned UPDATE so concurrent writers to this slot conflict
+        self.updated_at = datetime.utcnow()
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -86,18 +123,29 @@ class Booking(db.Model):
     actual_end_time = db.Column(db.DateTime)
     total_amount = db.Column(db.Float, default=0.0)
     status = db.Column(db.String(20), default='upcoming')  # 'upcoming', 'active', 'completed', 'cancelled'
+    version = db.Column(db.Integer, nullable=False, default=1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     payments = db.relationship('Payment', backref='booking', lazy=True)
     
+    __mapper_args__ = {'version_id_col': version}
+    
+    __table_args__ = (
+        db.Index('ix_bookings_slot_status_start', 'slot_id', 'status', 'start_time'),
+        db.Index('ix_bookings_user_start', 'user_id', 'start_time'),
+        db.Index('ix_bookings_status_start', 'status', 'start_time'),
+        db.Index('ix_bookings_status_end', 'status', 'end_time'),
+    )
+    
     def calculate_amount(self):
         if not self.end_time or not self.start_time:
             return 0.0
         
-        duration_hours = (self.end_time - self.start_time).total_seconds() / 3600
-        return round(duration_hours * self.slot.price_per_hour, 2)
+        # Imported here; the pricing service imports these models
+        from services.pricing import quote_amount
+        return quote_amount(self.slot, self.start_time, self.end_time)
 
 class Payment(db.Model):
     __tablename__ = 'payments'
@@ -112,3 +160,28 @@ class Payment(db.Model):
     payment_details = db.Column(db.JSON)  # Store additional payment details
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_payments_booking_status', 'booking_id', 'status'),
+        db.Index('ix_payments_user_created', 'user_id', 'created_at'),
+    )
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    
+    # Saved outcome of a request sent with an Idempotency-Key header, scoped
+    # to the user who sent it; see services/idempotency.py
+    user_id = db.Column(db.String(36), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # 'in_progress', 'completed'
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    response_mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_idempotency_keys_expires', 'expires_at'),
+    )
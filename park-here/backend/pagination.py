@@ -0,0 +1,81 @@
+"""Keyset (cursor) pagination for the list endpoints.
+
+Lists are ordered on a timestamp plus the primary key, and every page carries
+an opaque cursor holding the sort key of its last row. The next page seeks
+past that key with ``WHERE (ts, id) < (:ts, :id)`` instead of an OFFSET, so a
+deep page costs the same as the first one. Totals need a separate COUNT and
+are only computed when the client passes ``include_total=true``.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from flask import request
+from sqlalchemy import DateTime, tuple_
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(values):
+    payload = json.dumps(
+        [value.isoformat() if isinstance(value, datetime) else value for value in values],
+        separators=(',', ':')
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return tuple(
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+            for column, value in zip(columns, values)
+        )
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError('invalid cursor')
+
+def page_size(default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    value = request.args.get('limit')
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if not 0 < limit <= maximum:
+        raise ValueError(f'limit must be between 1 and {maximum}')
+    return limit
+
+def paginate(query, columns, descending=True, options=()):
+    """Fetch the page of ``query`` named by the request's ``cursor`` and ``limit``
+
+    ``columns`` is the sort key and must end with a unique column. Returns the
+    rows and the ``pagination`` block for the response; raises ValueError for
+    a bad cursor or limit.
+    """
+    limit = page_size()
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total', 'false').lower() == 'true'
+
+    total = query.order_by(None).count() if include_total else None
+
+    if cursor:
+        key = tuple_(*columns)
+        values = decode_cursor(cursor, columns)
+        query = query.filter(key < values if descending else key > values)
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    # One extra row tells whether another page exists without counting
+    rows = query.options(*options).order_by(*order).limit(limit + 1).all()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+
+    pagination = {
+        'limit': limit,
+        'has_next': has_next,
+        'next_cursor': encode_cursor([getattr(rows[-1], column.key) for column in columns]) if has_next else None
+    }
+    if total is not None:
+        pagination['total'] = total
+    return rows, pagination
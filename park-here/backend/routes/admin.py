@@ -0,0 +1,226 @@
+from flask import Blueprint, Response, request, jsonify, send_file
+from flask_jwt_extended import jwt_required
+from datetime import datetime
+from models import Booking, Payment, Slot, ParkingLocation, db
+from routes.booking import parse_datetime
+from services.principals import is_admin
+from services.profiling import profiler
+from sqlalchemy import select
+import csv
+import io
+import json
+
+admin_bp = Blueprint('admin', __name__)
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+# Rows fetched from the database per round trip and written per chunk
+EXPORT_BATCH_SIZE = 1000
+
+def _require_admin():
+    if not is_admin():
+        return jsonify({'error': 'Unauthorized'}), 403
+    return None
+
+def _export_filters(time_column, location_column, status_column):
+    """Build WHERE criteria from the from/to, location_id and status parameters"""
+    criteria = []
+    for name, compare in (('from', time_column.__ge__), ('to', time_column.__lt__)):
+        value = request.args.get(name)
+        if value:
+            try:
+                criteria.append(compare(parse_datetime(value)))
+            except ValueError:
+                raise ValueError(f'{name} must be an ISO 8601 datetime')
+
+    if request.args.get('location_id'):
+        criteria.append(location_column == request.args['location_id'])
+
+    statuses = [status for status in request.args.get('status', '').split(',') if status]
+    if statuses:
+        criteria.append(status_column.in_(statuses))
+    return criteria
+
+def _format_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _stream_rows(engine, statement, export_format):
+    """Yield the encoded result of ``statement`` batch by batch
+
+    The export runs on its own connection with a server-side cursor, so rows
+    are fetched as they are written out and memory does not grow with the
+    size of the export. The engine is passed in because the generator runs
+    after the view has returned, outside the app context.
+    """
+    columns = [column.name for column in statement.selected_columns]
+
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        # Send the header before the query runs so the first byte is immediate
+        yield buffer.getvalue()
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE).execute(statement)
+        for rows in result.partitions():
+            if export_format == 'csv':
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows([[_format_value(value) for value in row] for row in rows])
+                yield buffer.getvalue()
+            else:
+                yield ''.join(
+                    json.dumps({column: _format_value(value) for column, value in zip(columns, row)}) + '\n'
+                    for row in rows
+                )
+
+def _export_response(statement, name):
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'format must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+
+    filename = f'{name}-{datetime.utcnow():%Y%m%dT%H%M%SZ}.{export_format}'
+    response = Response(_stream_rows(db.engine, statement, export_format), mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Keep reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Rows are exported in storage order so nothing has to be sorted before the
+# first one can be sent
+@admin_bp.route('/export/bookings', methods=['GET'])
+@jwt_required()
+def export_bookings():
+    try:
+        denied = _require_admin()
+        if denied:
+            return denied
+        
+        try:
+            criteria = _export_filters(Booking.start_time, Slot.parking_location_id, Booking.status)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        statement = (
+            select(
+                Booking.id,
+                Booking.user_id,
+                Booking.slot_id,
+                Slot.slot_number,
+                Slot.parking_location_id.label('location_id'),
+                ParkingLocation.name.label('location_name'),
+                Booking.vehicle_number,
+                Booking.start_time,
+                Booking.end_time,
+                Booking.actual_end_time,
+                Booking.total_amount,
+                Booking.status,
+                Booking.created_at,
+                Booking.updated_at
+            )
+            .join(Slot, Slot.id == Booking.slot_id)
+            .join(ParkingLocation, ParkingLocation.id == Slot.parking_location_id)
+            .where(*criteria)
+        )
+        return _export_response(statement, 'bookings')
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/export/payments', methods=['GET'])
+@jwt_required()
+def export_payments():
+    try:
+        denied = _require_admin()
+        if denied:
+            return denied
+        
+        try:
+            criteria = _export_filters(Payment.created_at, Slot.parking_location_id, Payment.status)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        statement = (
+            select(
+                Payment.id,
+                Payment.booking_id,
+                Payment.user_id,
+                Slot.parking_location_id.label('location_id'),
+                Payment.amount,
+                Payment.payment_method,
+                Payment.transaction_id,
+                Payment.status,
+                Payment.created_at,
+                Payment.updated_at
+            )
+            .join(Booking, Booking.id == Payment.booking_id)
+            .join(Slot, Slot.id == Booking.slot_id)
+            .where(*criteria)
+        )
+        return _export_response(statement, 'payments')
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Profiles captured with X-Profile or by PROFILING_SAMPLE_RATE
+@admin_bp.route('/profiles', methods=['GET'])
+@jwt_required()
+def list_profiles():
+    try:
+        denied = _require_admin()
+        if denied:
+            return denied
+        
+        return jsonify({'profiles': profiler.list()}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+@jwt_required()
+def get_profile(profile_id):
+    try:
+        denied = _require_admin()
+        if denied:
+            return denied
+        
+        meta = profiler.meta(profile_id)
+        if meta is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        
+        return jsonify(meta), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiles/<profile_id>/download', methods=['GET'])
+@jwt_required()
+def download_profile(profile_id):
+    try:
+        denied = _require_admin()
+        if denied:
+            return denied
+        
+        profile_format = request.args.get('format', 'speedscope').lower()
+        if profile_format == 'collapsed':
+            collapsed = profiler.collapsed(profile_id)
+            if collapsed is None:
+                return jsonify({'error': 'Profile not found'}), 404
+            response = Response(collapsed, mimetype='text/plain')
+            response.headers['Content-Disposition'] = f'attachment; filename="{profile_id}.collapsed.txt"'
+            return response
+        if profile_format != 'speedscope':
+            return jsonify({'error': 'format must be one of speedscope, collapsed'}), 400
+        
+        path = profiler.speedscope_path(profile_id)
+        if path is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return send_file(path, mimetype='application/json', as_attachment=True,
+                         download_name=f'{profile_id}.speedscope.json')
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
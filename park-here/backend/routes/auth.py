@@ -4,6 +4,9 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import timedelta
 import re
 from models import User, db
+from services.passwords import HasherBusy, hasher
+from services.principals import current_principal, token_claims
+from services.ratelimit import auth_limit, limit
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -15,7 +18,13 @@ def validate_phone(phone):
     # Simple phone number validation (10 digits)
     return re.match(r'^\d{10}$', phone)
 
+def hasher_busy_response():
+    response = jsonify({'error': 'Too many sign-in requests, please retry shortly', 'retryable': True})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @auth_bp.route('/register', methods=['POST'])
+@auth_limit
 def register():
     data = request.get_json()
     
@@ -47,15 +56,16 @@ def register():
             name=data['name'],
             email=data['email'],
             phone=data['phone'],
-            role=data.get('role', 'user')
+            role=data.get('role', 'user'),
+            password_hash=hasher.hash(data['password'])
         )
-        user.set_password(data['password'])
         
         db.session.add(user)
         db.session.commit()
         
         # Generate access token
-        access_token = create_access_token(identity=user.id, expires_delta=timedelta(days=30))
+        access_token = create_access_token(identity=user.id, additional_claims=token_claims(user),
+                                           expires_delta=timedelta(days=30))
         
         return jsonify({
             'message': 'User registered successfully',
@@ -69,11 +79,14 @@ def register():
             'access_token': access_token
         }), 201
         
+    except HasherBusy:
+        return hasher_busy_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/login', methods=['POST'])
+@auth_limit
 def login():
     data = request.get_json()
     
@@ -85,11 +98,28 @@ def login():
     user = User.query.filter_by(email=data['email']).first()
     
     # Check if user exists and password is correct
-    if not user or not user.check_password(data['password']):
+    if not user:
+        return jsonify({'error': 'Invalid email or password'}), 401
+    
+    try:
+        valid, new_hash = hasher.verify(user.password_hash, data['password'])
+    except HasherBusy:
+        return hasher_busy_response()
+    
+    if not valid:
         return jsonify({'error': 'Invalid email or password'}), 401
     
+    # Upgrade hashes made with older parameters; a failure here must not fail the login
+    if new_hash:
+        try:
+            user.password_hash = new_hash
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+    
     # Generate access token
-    access_token = create_access_token(identity=user.id, expires_delta=timedelta(days=30))
+    access_token = create_access_token(identity=user.id, additional_claims=token_claims(user),
+                                       expires_delta=timedelta(days=30))
     
     return jsonify({
         'message': 'Login successful',
@@ -106,8 +136,7 @@ def login():
 @auth_bp.route('/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = current_principal()
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -168,6 +197,7 @@ def update_profile():
 
 @auth_bp.route('/change-password', methods=['POST'])
 @jwt_required()
+@limit('auth')
 def change_password():
     current_user_id = get_jwt_identity()
     user = User.query.get(current_user_id)
@@ -181,15 +211,17 @@ def change_password():
     if 'current_password' not in data or 'new_password' not in data:
         return jsonify({'error': 'Current password and new password are required'}), 400
     
-    # Verify current password
-    if not user.check_password(data['current_password']):
-        return jsonify({'error': 'Current password is incorrect'}), 400
-    
-    # Set new password
+    # Verify current password, then set the new one
     try:
-        user.set_password(data['new_password'])
+        valid, _ = hasher.verify(user.password_hash, data['current_password'])
+        if not valid:
+            return jsonify({'error': 'Current password is incorrect'}), 400
+        
+        user.password_hash = hasher.hash(data['new_password'])
         db.session.commit()
         return jsonify({'message': 'Password updated successfully'}), 200
+    except HasherBusy:
+        return hasher_busy_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
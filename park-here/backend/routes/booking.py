@@ -1,14 +1,49 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
-from models import Booking, Slot, ParkingLocation, User, db
-from sqlalchemy import or_
+from models import Booking, Slot, ParkingLocation, db
+from pagination import paginate
+from serializers import BOOKING_SUMMARY, BOOKING_DETAIL
+from services.availability import availability, to_utc_naive
+from services.idempotency import idempotent
+from services.pricing import quote_amount
+from services.principals import is_admin
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+import uuid
 
 booking_bp = Blueprint('booking', __name__)
 
+def parse_datetime(value):
+    """Parse an ISO 8601 string into the naive UTC datetimes stored in the database"""
+    return to_utc_naive(datetime.fromisoformat(value.replace('Z', '+00:00')))
+
+def release_slot(booking):
+    """Mark the slot available again unless another booking occupies it right now"""
+    slot = booking.slot
+    if slot.status == 'booked' and availability.occupant(slot.id, exclude_booking_id=booking.id) is None:
+        slot.status = 'available'
+
+def is_write_conflict(error):
+    """True for errors caused by a concurrent write that a retry can resolve"""
+    if isinstance(error, StaleDataError):
+        return True
+    return isinstance(error, OperationalError) and 'database is locked' in str(error)
+
+def write_conflict_response():
+    response = jsonify({
+        'error': 'The slot was changed by another request, please retry',
+        'retryable': True
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 409
+
 @booking_bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_booking():
+    booking_id = str(uuid.uuid4())
+    claimed = False
     try:
         current_user_id = get_jwt_identity()
         data = request.get_json()
@@ -21,8 +56,8 @@ def create_booking():
         
         # Parse datetime strings
         try:
-            start_time = datetime.fromisoformat(data['start_time'].replace('Z', '+00:00'))
-            end_time = datetime.fromisoformat(data['end_time'].replace('Z', '+00:00'))
+            start_time = parse_datetime(data['start_time'])
+            end_time = parse_datetime(data['end_time'])
         except ValueError as e:
             return jsonify({'error': 'Invalid date format. Use ISO 8601 format'}), 400
         
@@ -33,40 +68,34 @@ def create_booking():
         if start_time < datetime.utcnow():
             return jsonify({'error': 'Start time cannot be in the past'}), 400
         
-        # Check if slot exists and is available
-        slot = Slot.query.get(data['slot_id'])
+        # Check if slot exists and is available, locking the row where supported
+        slot = Slot.query.filter_by(id=data['slot_id']).with_for_update().first()
         if not slot:
             return jsonify({'error': 'Slot not found'}), 404
         
-        if slot.status != 'available':
+        # Whether the slot is free is decided by its booked windows below
+        if slot.status == 'maintenance':
             return jsonify({'error': 'This slot is not available for booking'}), 400
         
-        # Check for overlapping bookings
-        overlapping_booking = Booking.query.filter(
-            Booking.slot_id == data['slot_id'],
-            Booking.status.in_(['upcoming', 'active']),
-            or_(
-                # New booking starts during an existing booking
-                (start_time >= Booking.start_time) & (start_time < Booking.end_time),
-                # New booking ends during an existing booking
-                (end_time > Booking.start_time) & (end_time <= Booking.end_time),
-                # New booking completely contains an existing booking
-                (start_time <= Booking.start_time) & (end_time >= Booking.end_time)
-            )
-        ).first()
+        # Check for overlapping bookings and reserve the window in one step
+        availability.sync_slots({slot.id: slot.version})
+        claimed = availability.claim([slot.id], start_time, end_time, booking_id) is not None
         
-        if overlapping_booking:
+        if not claimed:
+            overlapping_booking = availability.find_conflict(slot.id, start_time, end_time)
+            next_start = availability.next_free_gap(slot.id, start_time, end_time - start_time)
             return jsonify({
                 'error': 'This slot is already booked for the selected time period',
-                'conflicting_booking_id': overlapping_booking.id
+                'conflicting_booking_id': overlapping_booking.booking_id if overlapping_booking else None,
+                'next_available_start': next_start.isoformat() if next_start else None
             }), 400
         
-        # Calculate duration and amount
-        duration_hours = (end_time - start_time).total_seconds() / 3600
-        amount = round(duration_hours * slot.price_per_hour, 2)
+        # Price the window under the current tariff
+        amount = quote_amount(slot, start_time, end_time)
         
         # Create booking
         booking = Booking(
+            id=booking_id,
             user_id=current_user_id,
             slot_id=data['slot_id'],
             vehicle_number=data['vehicle_number'],
@@ -76,22 +105,120 @@ def create_booking():
             status='upcoming'
         )
         
-        # Update slot status
-        slot.status = 'booked'
+        # Touch the slot; the versioned UPDATE fails if another request booked
+        # it since we read it. The scheduler marks it booked once the booking
+        # starts.
+        slot.touch()
         
-        # Update parking location available slots
-        location = ParkingLocation.query.get(slot.parking_location_id)
-        if location and slot.status == 'available':
-            location.available_slots = max(0, location.available_slots - 1)
+        db.session.add(booking)
+        db.session.commit()
+        claimed = False
+        
+        return jsonify({
+            'message': 'Booking created successfully',
+            'booking': {
+                'id': booking.id,
+                'slot_id': booking.slot_id,
+                'vehicle_number': booking.vehicle_number,
+                'start_time': booking.start_time.isoformat(),
+                'end_time': booking.end_time.isoformat(),
+                'total_amount': booking.total_amount,
+                'status': booking.status,
+                'created_at': booking.created_at.isoformat()
+            }
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        if claimed:
+            availability.remove(booking_id)
+        if is_write_conflict(e):
+            return write_conflict_response()
+        return jsonify({'error': str(e)}), 500
+
+@booking_bp.route('/allocate', methods=['POST'])
+@jwt_required()
+@idempotent
+def allocate_booking():
+    """Book any slot at a location that is free for the requested window"""
+    booking_id = str(uuid.uuid4())
+    claimed = False
+    try:
+        current_user_id = get_jwt_identity()
+        data = request.get_json()
+        
+        # Validate required fields
+        required_fields = ['location_id', 'vehicle_number', 'start_time', 'end_time']
+        for field in required_fields:
+            if field not in data or not data[field]:
+                return jsonify({'error': f'{field} is required'}), 400
+        
+        # Parse datetime strings
+        try:
+            start_time = parse_datetime(data['start_time'])
+            end_time = parse_datetime(data['end_time'])
+        except ValueError as e:
+            return jsonify({'error': 'Invalid date format. Use ISO 8601 format'}), 400
+        
+        # Validate time range
+        if start_time >= end_time:
+            return jsonify({'error': 'End time must be after start time'}), 400
+        
+        if start_time < datetime.utcnow():
+            return jsonify({'error': 'Start time cannot be in the past'}), 400
+        
+        location = ParkingLocation.query.get(data['location_id'])
+        if not location or not location.is_active:
+            return jsonify({'error': 'Parking location not found'}), 404
+        
+        # Every slot that is not under maintenance is a candidate; whether it
+        # is free is decided by its booked windows, cheapest slots first
+        query = Slot.query.filter(
+            Slot.parking_location_id == location.id,
+            Slot.status != 'maintenance'
+        )
+        if data.get('type'):
+            query = query.filter(Slot.type == data['type'])
+        
+        slots = {slot.id: slot for slot in query.order_by(Slot.price_per_hour, Slot.slot_number)}
+        availability.sync_slots({slot.id: slot.version for slot in slots.values()})
+        
+        slot_id = availability.claim(slots, start_time, end_time, booking_id)
+        if slot_id is None:
+            return jsonify({'error': 'No slots available for the selected time period'}), 400
+        claimed = True
+        slot = slots[slot_id]
+        
+        # Price the window under the current tariff
+        amount = quote_amount(slot, start_time, end_time)
+        
+        # Create booking under the id the slot was claimed with
+        booking = Booking(
+            id=booking_id,
+            user_id=current_user_id,
+            slot_id=slot.id,
+            vehicle_number=data['vehicle_number'],
+            start_time=start_time,
+            end_time=end_time,
+            total_amount=amount,
+            status='upcoming'
+        )
+        
+        # Touch the slot so concurrent writers to it conflict
+        slot.touch()
         
         db.session.add(booking)
         db.session.commit()
+        claimed = False
         
         return jsonify({
             'message': 'Booking created successfully',
             'booking': {
                 'id': booking.id,
                 'slot_id': booking.slot_id,
+                'slot_number': slot.slot_number,
+                'slot_type': slot.type,
+                'location_id': location.id,
                 'vehicle_number': booking.vehicle_number,
                 'start_time': booking.start_time.isoformat(),
                 'end_time': booking.end_time.isoformat(),
@@ -103,6 +230,11 @@ def create_booking():
         
     except Exception as e:
         db.session.rollback()
+        # Give the claimed window back if the booking never committed
+        if claimed:
+            availability.remove(booking_id)
+        if is_write_conflict(e):
+            return write_conflict_response()
         return jsonify({'error': str(e)}), 500
 
 @booking_bp.route('', methods=['GET'])
@@ -125,25 +257,17 @@ def get_user_bookings():
             now = datetime.utcnow()
             query = query.filter(Booking.start_time > now)
         
-        # Order by start time (newest first)
-        query = query.order_by(Booking.start_time.desc())
-        
-        bookings = query.all()
-        
-        return jsonify([{
-            'id': booking.id,
-            'slot_id': booking.slot_id,
-            'slot_number': booking.slot.slot_number if booking.slot else None,
-            'location_name': booking.slot.parking_location.name if booking.slot and booking.slot.parking_location else None,
-            'vehicle_number': booking.vehicle_number,
-            'start_time': booking.start_time.isoformat(),
-            'end_time': booking.end_time.isoformat(),
-            'actual_end_time': booking.actual_end_time.isoformat() if booking.actual_end_time else None,
-            'total_amount': float(booking.total_amount) if booking.total_amount else 0.0,
-            'status': booking.status,
-            'created_at': booking.created_at.isoformat(),
-            'payment_status': booking.payments[0].status if booking.payments else 'unpaid'
-        } for booking in bookings]), 200
+        # Newest first, one page at a time
+        try:
+            bookings, pagination = paginate(query, (Booking.start_time, Booking.id),
+                                            options=BOOKING_SUMMARY.options)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'bookings': [BOOKING_SUMMARY.serialize(booking) for booking in bookings],
+            'pagination': pagination
+        }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -154,34 +278,13 @@ def get_booking(booking_id):
     try:
         current_user_id = get_jwt_identity()
         
-        booking = Booking.query.get_or_404(booking_id)
+        booking = Booking.query.options(*BOOKING_DETAIL.options).filter_by(id=booking_id).first_or_404()
         
         # Check if the current user is the owner of the booking
-        if booking.user_id != current_user_id and not User.query.get(current_user_id).role == 'admin':
+        if booking.user_id != current_user_id and not is_admin():
             return jsonify({'error': 'Unauthorized'}), 403
         
-        return jsonify({
-            'id': booking.id,
-            'slot_id': booking.slot_id,
-            'slot_number': booking.slot.slot_number if booking.slot else None,
-            'slot_type': booking.slot.type if booking.slot else None,
-            'location_id': booking.slot.parking_location_id if booking.slot else None,
-            'location_name': booking.slot.parking_location.name if booking.slot and booking.slot.parking_location else None,
-            'address': booking.slot.parking_location.address if booking.slot and booking.slot.parking_location else None,
-            'vehicle_number': booking.vehicle_number,
-            'start_time': booking.start_time.isoformat(),
-            'end_time': booking.end_time.isoformat(),
-            'actual_end_time': booking.actual_end_time.isoformat() if booking.actual_end_time else None,
-            'total_amount': float(booking.total_amount) if booking.total_amount else 0.0,
-            'status': booking.status,
-            'created_at': booking.created_at.isoformat(),
-            'payment': {
-                'status': booking.payments[0].status if booking.payments else 'unpaid',
-                'payment_method': booking.payments[0].payment_method if booking.payments else None,
-                'transaction_id': booking.payments[0].transaction_id if booking.payments else None,
-                'paid_at': booking.payments[0].created_at.isoformat() if booking.payments else None
-            } if booking.payments else None
-        }), 200
+        return jsonify(BOOKING_DETAIL.serialize(booking)), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -194,25 +297,19 @@ def cancel_booking(booking_id):
         booking = Booking.query.get_or_404(booking_id)
         
         # Check if the current user is the owner of the booking or an admin
-        if booking.user_id != current_user_id and not User.query.get(current_user_id).role == 'admin':
+        if booking.user_id != current_user_id and not is_admin():
             return jsonify({'error': 'Unauthorized'}), 403
         
         # Check if booking can be cancelled
         if booking.status not in ['upcoming', 'active']:
             return jsonify({'error': 'This booking cannot be cancelled'}), 400
         
-        # Update booking status
+        # Update booking status; the slot is touched so other workers notice
         booking.status = 'cancelled'
         booking.updated_at = datetime.utcnow()
-        
-        # Update slot status if the booking is upcoming
-        if booking.status == 'upcoming' and booking.slot:
-            booking.slot.status = 'available'
-            
-            # Update parking location available slots
-            location = ParkingLocation.query.get(booking.slot.parking_location_id)
-            if location:
-                location.available_slots = min(location.total_slots, location.available_slots + 1)
+        if booking.slot:
+            booking.slot.touch()
+            release_slot(booking)
         
         db.session.commit()
         
@@ -226,11 +323,14 @@ def cancel_booking(booking_id):
         
     except Exception as e:
         db.session.rollback()
+        if is_write_conflict(e):
+            return write_conflict_response()
         return jsonify({'error': str(e)}), 500
 
 @booking_bp.route('/<booking_id>/extend', methods=['POST'])
 @jwt_required()
 def extend_booking(booking_id):
+    extension_id = None
     try:
         current_user_id = get_jwt_identity()
         data = request.get_json()
@@ -253,34 +353,35 @@ def extend_booking(booking_id):
         if booking.status != 'active':
             return jsonify({'error': 'Only active bookings can be extended'}), 400
         
-        # Calculate new end time and additional amount
+        # Calculate new end time; the extra charge is the difference the longer
+        # window makes, so increments and minimums are not applied twice
         new_end_time = booking.end_time + timedelta(hours=additional_hours)
-        additional_amount = round(additional_hours * booking.slot.price_per_hour, 2)
-        
-        # Check for overlapping bookings
-        overlapping_booking = Booking.query.filter(
-            Booking.slot_id == booking.slot_id,
-            Booking.id != booking.id,
-            Booking.status.in_(['upcoming', 'active']),
-            or_(
-                # New end time overlaps with an existing booking
-                (new_end_time > Booking.start_time) & (new_end_time <= Booking.end_time),
-                # New end time is after an existing booking that starts at our new end time
-                (new_end_time == Booking.start_time)
+        additional_amount = round(max(0.0,
+            quote_amount(booking.slot, booking.start_time, new_end_time)
+            - quote_amount(booking.slot, booking.start_time, booking.end_time)
+        ), 2)
+        
+        # Reserve the extra time so concurrent bookings cannot take it
+        availability.sync_slots({booking.slot_id: booking.slot.version})
+        extension_id = f'{booking.id}:extend:{uuid.uuid4().hex}'
+        if availability.claim([booking.slot_id], booking.end_time, new_end_time, extension_id) is None:
+            extension_id = None
+            overlapping_booking = availability.find_conflict(
+                booking.slot_id, booking.end_time, new_end_time, exclude_booking_id=booking.id
             )
-        ).first()
-        
-        if overlapping_booking:
+            if not overlapping_booking:
+                return write_conflict_response()
             return jsonify({
                 'error': 'Cannot extend booking as it would overlap with another booking',
-                'conflicting_booking_id': overlapping_booking.id,
-                'max_additional_hours': (overlapping_booking.start_time - booking.end_time).total_seconds() / 3600
+                'conflicting_booking_id': overlapping_booking.booking_id,
+                'max_additional_hours': (overlapping_booking.start - booking.end_time).total_seconds() / 3600
             }), 400
         
         # Update booking
         booking.end_time = new_end_time
         booking.total_amount += additional_amount
         booking.updated_at = datetime.utcnow()
+        booking.slot.touch()
         
         db.session.commit()
         
@@ -294,4 +395,11 @@ def extend_booking(booking_id):
         
     except Exception as e:
         db.session.rollback()
+        if is_write_conflict(e):
+            return write_conflict_response()
         return jsonify({'error': str(e)}), 500
+    
+    finally:
+        # The committed booking now covers the extension, or it failed
+        if extension_id:
+            availability.remove(extension_id)
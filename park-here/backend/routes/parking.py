@@ -1,18 +1,64 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import ParkingLocation, Slot, db
+from routes.booking import is_write_conflict, parse_datetime, write_conflict_response
+from pagination import page_size, paginate
+from serializers import LOCATION_DETAIL
+from services.cache import cached, location_tag, ALL_LOCATIONS, AVAILABILITY
+from services.live import format_event, location_topic, snapshot
+from services.pricing import pricing
+from services.pubsub import broker
+from services.ratelimit import limit
+from services.slots import bulk_create_slots, bulk_update_slots, expand_definitions, slot_changes, slot_criteria
+from services.spatial import spatial_index
 from datetime import datetime
+from itertools import islice
+from sqlalchemy.exc import IntegrityError
+import math
 
 parking_bp = Blueprint('parking', __name__)
 
+DEFAULT_SEARCH_RADIUS_KM = 10.0
+MAX_SEARCH_RADIUS_KM = 500.0
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+MAX_LIVE_LOCATIONS = 50
+LIVE_RETRY_MS = 2000
+MAX_QUOTE_WINDOWS = 100
+
+def _location_list_tags(body):
+    tags = [ALL_LOCATIONS] + [location_tag(loc['id']) for loc in body['locations']]
+    if request.args.get('available_only', 'false').lower() == 'true':
+        tags.append(AVAILABILITY)
+    return tags
+
 # Parking Location Endpoints
 @parking_bp.route('/locations', methods=['GET'])
+@limit('search')
+@cached(_location_list_tags)
 def get_parking_locations():
     try:
         # Get query parameters
         city = request.args.get('city')
         available_only = request.args.get('available_only', 'false').lower() == 'true'
         
+        try:
+            lat = _float_arg('lat')
+            lng = _float_arg('lng')
+            radius_km = _float_arg('radius_km', DEFAULT_SEARCH_RADIUS_KM)
+            limit = page_size(DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if (lat is None) != (lng is None):
+            return jsonify({'error': 'lat and lng must be provided together'}), 400
+        
+        if lat is not None and not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return jsonify({'error': 'lat/lng out of range'}), 400
+        
+        if not 0 < radius_km <= MAX_SEARCH_RADIUS_KM:
+            return jsonify({'error': f'radius_km must be between 0 and {MAX_SEARCH_RADIUS_KM}'}), 400
+        
         # Build query
         query = ParkingLocation.query.filter_by(is_active=True)
         
@@ -22,10 +68,17 @@ def get_parking_locations():
         if available_only:
             query = query.filter(ParkingLocation.available_slots > 0)
         
-        # Execute query
-        locations = query.all()
+        # Nearest searches are a bounded top-N by distance, so they have no cursor
+        if lat is not None:
+            return jsonify({'locations': _nearest_locations(query, lat, lng, radius_km, limit)}), 200
+        
+        try:
+            locations, pagination = paginate(query, (ParkingLocation.created_at, ParkingLocation.id),
+                                             descending=False)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return jsonify([{
+        return jsonify({'locations': [{
             'id': loc.id,
             'name': loc.name,
             'address': loc.address,
@@ -35,38 +88,184 @@ def get_parking_locations():
             'latitude': loc.latitude,
             'longitude': loc.longitude,
             'created_at': loc.created_at.isoformat()
-        } for loc in locations]), 200
+        } for loc in locations], 'pagination': pagination}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _nearest_locations(query, lat, lng, radius_km, limit):
+    """Resolve the nearest candidates from the spatial index in small batches"""
+    results = []
+    candidates = spatial_index.nearest(lat, lng, radius_km)
+    
+    while len(results) < limit:
+        batch = list(islice(candidates, limit - len(results)))
+        if not batch:
+            break
+        
+        # The index only holds ids, so the remaining filters run on this batch
+        distances = {location_id: distance for distance, location_id in batch}
+        locations = query.filter(ParkingLocation.id.in_(distances)).all()
+        
+        for loc in sorted(locations, key=lambda loc: distances[loc.id]):
+            results.append({
+                'id': loc.id,
+                'name': loc.name,
+                'address': loc.address,
+                'city': loc.city,
+                'total_slots': loc.total_slots,
+                'available_slots': loc.available_slots,
+                'latitude': loc.latitude,
+                'longitude': loc.longitude,
+                'distance_km': round(distances[loc.id], 3),
+                'created_at': loc.created_at.isoformat()
+            })
+    
+    return results
+
+def _float_arg(name, default=None):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        result = float(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+    if not math.isfinite(result):
+        raise ValueError(f'{name} must be a number')
+    return result
+
 @parking_bp.route('/locations/<location_id>', methods=['GET'])
+@cached(lambda location, location_id: [location_tag(location_id)])
 def get_parking_location(location_id):
     try:
-        location = ParkingLocation.query.get_or_404(location_id)
+        location = ParkingLocation.query.options(*LOCATION_DETAIL.options).filter_by(id=location_id).first_or_404()
+        
+        return jsonify(LOCATION_DETAIL.serialize(location)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Prices for every slot at a location across candidate windows, for comparison views
+@parking_bp.route('/locations/<location_id>/quote', methods=['POST'])
+@limit('search')
+def quote_location(location_id):
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        windows = data.get('windows')
+        if not isinstance(windows, list) or not windows:
+            return jsonify({'error': 'windows must be a non-empty list'}), 400
+        if len(windows) > MAX_QUOTE_WINDOWS:
+            return jsonify({'error': f'At most {MAX_QUOTE_WINDOWS} windows can be quoted at once'}), 400
+        
+        try:
+            windows = [(parse_datetime(window['start_time']), parse_datetime(window['end_time'])) for window in windows]
+        except (KeyError, TypeError, AttributeError, ValueError):
+            return jsonify({'error': 'Each window needs an ISO 8601 start_time and end_time'}), 400
+        if any(start_time >= end_time for start_time, end_time in windows):
+            return jsonify({'error': 'End time must be after start time'}), 400
+        
+        slot_ids = data.get('slot_ids')
+        if slot_ids is not None and not isinstance(slot_ids, list):
+            return jsonify({'error': 'slot_ids must be a list'}), 400
+        
+        location = ParkingLocation.query.get(location_id)
+        if not location or not location.is_active:
+            return jsonify({'error': 'Parking location not found'}), 404
+        
+        table, rows, billed_hours, amounts = pricing.quote_location(location_id, windows, data.get('type'), slot_ids)
+        # Cheapest slot per window; ties go to the lowest slot number
+        cheapest = amounts.argmin(axis=0) if len(rows) else []
         
         return jsonify({
-            'id': location.id,
-            'name': location.name,
-            'address': location.address,
-            'city': location.city,
-            'total_slots': location.total_slots,
-            'available_slots': location.available_slots,
-            'latitude': location.latitude,
-            'longitude': location.longitude,
-            'created_at': location.created_at.isoformat(),
+            'location_id': location_id,
+            'windows': [{
+                'start_time': start_time.isoformat(),
+                'end_time': end_time.isoformat(),
+                'billed_hours': hours
+            } for (start_time, end_time), hours in zip(windows, billed_hours.tolist())],
             'slots': [{
-                'id': slot.id,
-                'slot_number': slot.slot_number,
-                'type': slot.type,
-                'status': slot.status,
-                'price_per_hour': slot.price_per_hour
-            } for slot in location.slots]
+                'id': table.ids[row],
+                'slot_number': table.numbers[row],
+                'type': table.types[row],
+                'price_per_hour': table.prices[row].item(),
+                'hourly_rate': table.rates[row].item()
+            } for row in rows.tolist()],
+            # One row per slot, one column per window
+            'amounts': amounts.tolist(),
+            'cheapest': [{
+                'slot_id': table.ids[rows[index]],
+                'amount': amounts[index, column].item()
+            } for column, index in enumerate(cheapest)]
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _live_stream(subscription, events, heartbeat_seconds):
+    """Yield the snapshot, then deltas as they are published
+
+    Runs after the view has returned; it only reads the subscription, so it
+    needs no app context. The subscription is closed when the client goes
+    away and the server closes the generator.
+    """
+    try:
+        yield f'retry: {LIVE_RETRY_MS}\n\n'
+        for event in events:
+            yield format_event(event)
+        while not subscription.closed:
+            published = subscription.get(timeout=heartbeat_seconds)
+            if subscription.take_dropped():
+                # Deltas were lost; the client reconnects and starts from a new snapshot
+                yield format_event({'type': 'resync'})
+                return
+            if not published:
+                yield ': keepalive\n\n'
+            for _, event in published:
+                yield format_event(event)
+    finally:
+        subscription.close()
+
+# Push channel for maps and gate displays in place of polling location detail
+@parking_bp.route('/live', methods=['GET'])
+def live_feed():
+    try:
+        location_ids = list(dict.fromkeys(
+            location_id.strip() for location_id in request.args.get('locations', '').split(',') if location_id.strip()
+        ))
+        if not location_ids:
+            return jsonify({'error': 'locations is required'}), 400
+        
+        if len(location_ids) > MAX_LIVE_LOCATIONS:
+            return jsonify({'error': f'At most {MAX_LIVE_LOCATIONS} locations per stream'}), 400
+        
+        if broker.subscriber_count() >= current_app.config.get('LIVE_MAX_STREAMS', 100):
+            response = jsonify({'error': 'Too many live streams, try again later'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        
+        # Subscribe before reading the snapshot so no commit in between is missed
+        subscription = broker.subscribe([location_topic(location_id) for location_id in location_ids])
+        try:
+            events = snapshot(location_ids)
+        except Exception:
+            subscription.close()
+            raise
+        
+        if not events:
+            subscription.close()
+            return jsonify({'error': 'Parking location not found'}), 404
+        
+        heartbeat = current_app.config.get('LIVE_HEARTBEAT_SECONDS', 15)
+        response = Response(_live_stream(subscription, events, heartbeat), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @parking_bp.route('/locations', methods=['POST'])
 @jwt_required()
 def create_parking_location():
@@ -128,16 +327,19 @@ def get_slots(location_id):
         if status:
             query = query.filter_by(status=status)
         
-        slots = query.all()
+        try:
+            slots, pagination = paginate(query, (Slot.created_at, Slot.id), descending=False)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return jsonify([{
+        return jsonify({'slots': [{
             'id': slot.id,
             'slot_number': slot.slot_number,
             'type': slot.type,
             'status': slot.status,
             'price_per_hour': slot.price_per_hour,
             'created_at': slot.created_at.isoformat()
-        } for slot in slots]), 200
+        } for slot in slots], 'pagination': pagination}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -157,13 +359,6 @@ def add_slot(location_id):
             if field not in data or not data[field]:
                 return jsonify({'error': f'{field} is required'}), 400
         
-        # Check if slot number already exists in this location
-        if Slot.query.filter_by(
-            parking_location_id=location_id,
-            slot_number=data['slot_number']
-        ).first():
-            return jsonify({'error': 'Slot number already exists in this location'}), 400
-        
         # Create new slot
         slot = Slot(
             parking_location_id=location_id,
@@ -173,13 +368,14 @@ def add_slot(location_id):
             price_per_hour=float(data['price_per_hour'])
         )
         
+        # Location slot counts are maintained by the counters on flush;
+        # duplicate slot numbers are rejected by the unique index
         db.session.add(slot)
-        
-        # Update location slot counts
-        location.total_slots += 1
-        location.available_slots += 1 if slot.status == 'available' else 0
-        
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'Slot number already exists in this location'}), 400
         
         return jsonify({
             'message': 'Slot added successfully',
@@ -196,6 +392,87 @@ def add_slot(location_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@parking_bp.route('/locations/<location_id>/slots/bulk', methods=['POST'])
+@jwt_required()
+def bulk_add_slots(location_id):
+    try:
+        location = db.session.get(ParkingLocation, location_id)
+        if not location:
+            return jsonify({'error': 'Parking location not found'}), 404
+        
+        data = request.get_json() or {}
+        atomic = bool(data.get('atomic', False))
+        
+        try:
+            definitions, range_errors = expand_definitions(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if not definitions and not range_errors:
+            return jsonify({'error': 'slots or ranges is required'}), 400
+        
+        created, failed = bulk_create_slots(location, definitions)
+        failed = range_errors + failed
+        
+        # With atomic set, any failed row rejects the whole batch
+        if not created or (atomic and failed):
+            db.session.rollback()
+            return jsonify({
+                'error': 'No slots were added',
+                'created': 0,
+                'failed': failed
+            }), 400
+        
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another request took some of these numbers after our check
+            db.session.rollback()
+            response = jsonify({
+                'error': 'Slot numbers were added concurrently, please retry',
+                'retryable': True
+            })
+            response.headers['Retry-After'] = '1'
+            return response, 409
+        
+        return jsonify({
+            'message': f'{len(created)} slots added successfully',
+            'created': len(created),
+            'failed': failed,
+            'location': {
+                'id': location.id,
+                'total_slots': location.total_slots,
+                'available_slots': location.available_slots
+            }
+        }), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@parking_bp.route('/slots/bulk', methods=['PATCH'])
+@jwt_required()
+def bulk_update_slots_route():
+    try:
+        data = request.get_json() or {}
+        
+        try:
+            criteria = slot_criteria(data)
+            values = slot_changes(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        summary = bulk_update_slots(criteria, values, dry_run=bool(data.get('dry_run', False)))
+        db.session.commit()
+        
+        return jsonify(summary), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        if is_write_conflict(e):
+            return write_conflict_response()
+        return jsonify({'error': str(e)}), 500
+
 @parking_bp.route('/slots/<slot_id>', methods=['PUT'])
 @jwt_required()
 def update_slot(slot_id):
@@ -203,10 +480,8 @@ def update_slot(slot_id):
         slot = Slot.query.get_or_404(slot_id)
         data = request.get_json()
         
-        # Track if status changes from/to available for slot count updates
-        old_status = slot.status
-        
-        # Update slot fields if provided
+        # Update slot fields if provided; status and type changes move the
+        # location counters on flush
         if 'status' in data:
             slot.status = data['status']
         
@@ -216,14 +491,6 @@ def update_slot(slot_id):
         if 'price_per_hour' in data:
             slot.price_per_hour = float(data['price_per_hour'])
         
-        # Update location available_slots if status changed
-        if 'status' in data and old_status != slot.status:
-            location = ParkingLocation.query.get(slot.parking_location_id)
-            if old_status == 'available' and slot.status != 'available':
-                location.available_slots = max(0, location.available_slots - 1)
-            elif old_status != 'available' and slot.status == 'available':
-                location.available_slots = min(location.total_slots, location.available_slots + 1)
-        
         slot.updated_at = datetime.utcnow()
         db.session.commit()
         
@@ -247,14 +514,8 @@ def update_slot(slot_id):
 def delete_slot(slot_id):
     try:
         slot = Slot.query.get_or_404(slot_id)
-        location = ParkingLocation.query.get(slot.parking_location_id)
-        
-        # Update location slot counts
-        location.total_slots -= 1
-        if slot.status == 'available':
-            location.available_slots = max(0, location.available_slots - 1)
         
-        # Delete the slot
+        # Delete the slot; location slot counts follow on flush
         db.session.delete(slot)
         db.session.commit()
         
@@ -1,7 +1,12 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
-from models import Payment, Booking, User, db
+from models import Payment, Booking, db
+from pagination import paginate
+from routes.booking import release_slot, is_write_conflict, write_conflict_response
+from services.payments import processor, settle_payment
+from services.principals import is_admin
+from services.idempotency import idempotent
 import uuid
 
 payment_bp = Blueprint('payment', __name__)
@@ -12,6 +17,7 @@ def generate_transaction_id():
 
 @payment_bp.route('/initiate', methods=['POST'])
 @jwt_required()
+@idempotent
 def initiate_payment():
     try:
         current_user_id = get_jwt_identity()
@@ -28,11 +34,15 @@ def initiate_payment():
         if booking.user_id != current_user_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
-        # Check if booking is already paid
-        existing_payment = Payment.query.filter_by(booking_id=booking.id, status='completed').first()
+        # Check if booking is already paid or being paid
+        existing_payment = Payment.query.filter(
+            Payment.booking_id == booking.id,
+            Payment.status.in_(['completed', 'pending'])
+        ).first()
         if existing_payment:
             return jsonify({
-                'error': 'This booking has already been paid',
+                'error': 'This booking has already been paid' if existing_payment.status == 'completed'
+                         else 'A payment for this booking is already being processed',
                 'payment_id': existing_payment.id,
                 'status': existing_payment.status
             }), 400
@@ -43,7 +53,8 @@ def initiate_payment():
                 'error': f'Amount mismatch. Expected: {booking.total_amount}, Received: {data["amount"]}'
             }), 400
         
-        # Create payment record
+        # Record the payment; the gateway is charged by the payment workers once
+        # this commits, so the request never waits on it
         payment = Payment(
             booking_id=booking.id,
             user_id=current_user_id,
@@ -54,14 +65,6 @@ def initiate_payment():
         )
         
         db.session.add(payment)
-        
-        # In a real application, you would integrate with a payment gateway here
-        # For demo purposes, we'll simulate a successful payment
-        
-        # Simulate payment processing
-        payment.status = 'completed'
-        booking.payment_status = 'paid'
-        
         db.session.commit()
         
         return jsonify({
@@ -74,7 +77,7 @@ def initiate_payment():
                 'payment_method': payment.payment_method,
                 'created_at': payment.created_at.isoformat()
             }
-        }), 200
+        }), 202
         
     except Exception as e:
         db.session.rollback()
@@ -100,8 +103,13 @@ def verify_payment():
             user_id=current_user_id
         ).first_or_404()
         
-        # In a real application, you would verify the payment with the payment gateway here
-        # For demo purposes, we'll return the current status
+        # Ask the gateway for the outcome if the workers have not recorded it yet
+        if payment.status == 'pending':
+            if settle_payment(payment.id, processor.gateway.lookup(payment.transaction_id)):
+                db.session.commit()
+                db.session.refresh(payment)
+            else:
+                db.session.rollback()
         
         return jsonify({
             'payment_id': payment.id,
@@ -115,6 +123,7 @@ def verify_payment():
         }), 200
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @payment_bp.route('/history', methods=['GET'])
@@ -124,8 +133,6 @@ def payment_history():
         current_user_id = get_jwt_identity()
         
         # Get query parameters
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 10))
         status = request.args.get('status')
         
         # Build query
@@ -134,10 +141,10 @@ def payment_history():
         if status:
             query = query.filter_by(status=status)
         
-        # Paginate results
-        payments = query.order_by(Payment.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        try:
+            payments, pagination = paginate(query, (Payment.created_at, Payment.id))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
             'payments': [{
@@ -148,15 +155,8 @@ def payment_history():
                 'payment_method': payment.payment_method,
                 'booking_id': payment.booking_id,
                 'created_at': payment.created_at.isoformat()
-            } for payment in payments.items],
-            'pagination': {
-                'total': payments.total,
-                'pages': payments.pages,
-                'current_page': payments.page,
-                'per_page': payments.per_page,
-                'has_next': payments.has_next,
-                'has_prev': payments.has_prev
-            }
+            } for payment in payments],
+            'pagination': pagination
         }), 200
         
     except Exception as e:
@@ -212,10 +212,10 @@ def request_refund(payment_id):
 @jwt_required()
 def process_refund(payment_id):
     try:
-        current_user = User.query.get(get_jwt_identity())
+        current_user_id = get_jwt_identity()
         
         # Check if user is admin
-        if current_user.role != 'admin':
+        if not is_admin():
             return jsonify({'error': 'Unauthorized'}), 403
         
         data = request.get_json()
@@ -234,7 +234,7 @@ def process_refund(payment_id):
         
         # Update payment status to refunded
         payment.status = 'refunded'
-        payment.refund_processed_by = current_user.id
+        payment.refund_processed_by = current_user_id
         payment.refund_processed_at = datetime.utcnow()
         payment.updated_at = datetime.utcnow()
         
@@ -243,14 +243,10 @@ def process_refund(payment_id):
         if booking and booking.status in ['upcoming', 'active']:
             booking.status = 'cancelled'
             
-            # Make the slot available again if the booking was upcoming
-            if booking.status == 'upcoming' and booking.slot:
-                booking.slot.status = 'available'
-                
-                # Update parking location available slots
-                location = ParkingLocation.query.get(booking.slot.parking_location_id)
-                if location:
-                    location.available_slots = min(location.total_slots, location.available_slots + 1)
+            # Make the slot available again; location counters follow
+            if booking.slot:
+                booking.slot.touch()
+                release_slot(booking)
         
         db.session.commit()
         
@@ -258,10 +254,12 @@ def process_refund(payment_id):
             'message': 'Refund processed successfully',
             'payment_id': payment.id,
             'status': payment.status,
-            'refund_processed_by': current_user.id,
+            'refund_processed_by': current_user_id,
             'refund_processed_at': payment.refund_processed_at.isoformat()
         }), 200
         
     except Exception as e:
         db.session.rollback()
+        if is_write_conflict(e):
+            return write_conflict_response()
         return jsonify({'error': str(e)}), 500
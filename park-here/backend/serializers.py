@@ -0,0 +1,99 @@
+"""Response projections shared by the route handlers.
+
+Each projection pairs the serializer for one response shape with the loader
+options that fetch everything it touches up front. Querying with
+``query.options(*PROJECTION.options)`` and serializing with
+``PROJECTION.serialize`` keeps the number of SQL statements per request fixed,
+however many rows are returned.
+"""
+from collections import namedtuple
+from sqlalchemy.orm import configure_mappers, joinedload, selectinload
+from models import Booking, Slot, ParkingLocation
+
+# Backref attributes such as Booking.slot only exist once mappers are configured
+configure_mappers()
+
+Projection = namedtuple('Projection', ['options', 'serialize'])
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+def _latest_payment(booking):
+    payments = booking.payments
+    return max(payments, key=lambda payment: payment.created_at) if payments else None
+
+def _booking_base(booking):
+    return {
+        'id': booking.id,
+        'slot_id': booking.slot_id,
+        'vehicle_number': booking.vehicle_number,
+        'start_time': booking.start_time.isoformat(),
+        'end_time': _isoformat(booking.end_time),
+        'actual_end_time': _isoformat(booking.actual_end_time),
+        'total_amount': float(booking.total_amount) if booking.total_amount else 0.0,
+        'status': booking.status,
+        'created_at': booking.created_at.isoformat()
+    }
+
+# Slot and location are many-to-one, so they join into the booking query;
+# payments are one-to-many and come from a single SELECT ... IN
+_BOOKING_OPTIONS = (
+    joinedload(Booking.slot).joinedload(Slot.parking_location),
+    selectinload(Booking.payments),
+)
+
+def _serialize_booking_summary(booking):
+    slot = booking.slot
+    location = slot.parking_location if slot else None
+    payment = _latest_payment(booking)
+
+    data = _booking_base(booking)
+    data.update({
+        'slot_number': slot.slot_number if slot else None,
+        'location_name': location.name if location else None,
+        'payment_status': payment.status if payment else 'unpaid'
+    })
+    return data
+
+def _serialize_booking_detail(booking):
+    slot = booking.slot
+    location = slot.parking_location if slot else None
+    payment = _latest_payment(booking)
+
+    data = _booking_base(booking)
+    data.update({
+        'slot_number': slot.slot_number if slot else None,
+        'slot_type': slot.type if slot else None,
+        'location_id': slot.parking_location_id if slot else None,
+        'location_name': location.name if location else None,
+        'address': location.address if location else None,
+        'payment': {
+            'status': payment.status,
+            'payment_method': payment.payment_method,
+            'transaction_id': payment.transaction_id,
+            'paid_at': payment.created_at.isoformat()
+        } if payment else None
+    })
+    return data
+
+def _serialize_location_detail(location):
+    return {
+        'id': location.id,
+        'name': location.name,
+        'address': location.address,
+        'city': location.city,
+        'total_slots': location.total_slots,
+        'available_slots': location.available_slots,
+        'latitude': location.latitude,
+        'longitude': location.longitude,
+        'created_at': location.created_at.isoformat(),
+        'availability': {counter.slot_type: counter.to_dict() for counter in location.counters},
+        'slots': [slot.to_dict() for slot in location.slots]
+    }
+
+BOOKING_SUMMARY = Projection(_BOOKING_OPTIONS, _serialize_booking_summary)
+BOOKING_DETAIL = Projection(_BOOKING_OPTIONS, _serialize_booking_detail)
+LOCATION_DETAIL = Projection(
+    (selectinload(ParkingLocation.slots), selectinload(ParkingLocation.counters)),
+    _serialize_location_detail
+)
@@ -0,0 +1,244 @@
+"""Per-slot interval index of upcoming and active bookings.
+
+Every slot keeps its booked windows as a list sorted by start time. Windows on
+a slot never overlap (the engine is what rejects overlaps), so ends are sorted
+as well and a conflict check is a single binary search. The index mirrors the
+``bookings`` table: it is rebuilt at startup and updated from committed
+booking changes.
+
+Each slot also remembers the ``Slot.version`` its windows were loaded at.
+Every booking write bumps that version, so a worker that sees a newer version
+in the database than in memory knows another process booked the slot and
+reloads just that slot before answering.
+"""
+import bisect
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from models import Booking, Slot, db
+from services.commit_hooks import on_commit
+
+logger = logging.getLogger(__name__)
+
+# Bookings in these states hold their slot for their whole window
+HOLDING_STATUSES = ('upcoming', 'active')
+
+Interval = namedtuple('Interval', ['start', 'end', 'booking_id'])
+
+def to_utc_naive(value):
+    """Normalise datetimes to the naive UTC values stored in the database"""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class _SlotIntervals:
+    __slots__ = ('starts', 'intervals')
+
+    def __init__(self):
+        self.starts = []
+        self.intervals = []
+
+    def add(self, interval):
+        index = bisect.bisect_right(self.starts, interval.start)
+        self.starts.insert(index, interval.start)
+        self.intervals.insert(index, interval)
+
+    def remove(self, interval):
+        index = bisect.bisect_left(self.starts, interval.start)
+        while index < len(self.intervals) and self.starts[index] == interval.start:
+            if self.intervals[index].booking_id == interval.booking_id:
+                del self.starts[index]
+                del self.intervals[index]
+                return
+            index += 1
+
+class AvailabilityEngine:
+    """Answers "is this slot free" and "when is it next free" from memory"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._slots = {}
+        self._bookings = {}
+        self._versions = {}
+        self._claims = set()
+
+    def init_app(self, app):
+        with app.app_context():
+            self.rebuild()
+
+    def rebuild(self):
+        """Reload every holding booking from the database"""
+        rows = db.session.query(
+            Booking.id, Booking.slot_id, Booking.start_time, Booking.end_time, Slot.version
+        ).join(Slot, Slot.id == Booking.slot_id).filter(Booking.status.in_(HOLDING_STATUSES)).all()
+
+        with self._lock:
+            self._slots = {}
+            self._bookings = {}
+            self._versions = {}
+            for booking_id, slot_id, start_time, end_time, version in rows:
+                if self.find_conflict(slot_id, start_time, end_time):
+                    logger.warning('Booking %s overlaps another booking on slot %s', booking_id, slot_id)
+                self._add(booking_id, slot_id, start_time, end_time)
+                self._versions[slot_id] = version
+
+    def sync_slots(self, versions):
+        """Reload slots whose database version is ahead of the in-memory copy
+
+        ``versions`` maps slot ids to the ``Slot.version`` the caller just read.
+        Slots this process has never loaded are fetched too; everything else
+        costs a dictionary lookup.
+        """
+        with self._lock:
+            stale = [slot_id for slot_id, version in versions.items()
+                     if self._versions.get(slot_id, 0) < version]
+        if not stale:
+            return
+
+        rows = db.session.query(
+            Booking.id, Booking.slot_id, Booking.start_time, Booking.end_time
+        ).filter(Booking.slot_id.in_(stale), Booking.status.in_(HOLDING_STATUSES)).all()
+
+        by_slot = {}
+        for booking_id, slot_id, start_time, end_time in rows:
+            by_slot.setdefault(slot_id, []).append((booking_id, start_time, end_time))
+
+        with self._lock:
+            for slot_id in stale:
+                # Another thread may have caught up while we were querying
+                if self._versions.get(slot_id, 0) >= versions[slot_id]:
+                    continue
+
+                # Keep in-flight claims, they are not in the database yet
+                intervals = self._slots.get(slot_id)
+                for interval in list(intervals.intervals) if intervals else ():
+                    if interval.booking_id not in self._claims:
+                        self._remove(interval.booking_id)
+
+                for booking_id, start_time, end_time in by_slot.get(slot_id, ()):
+                    if booking_id not in self._claims:
+                        self._add(booking_id, slot_id, start_time, end_time)
+                self._versions[slot_id] = versions[slot_id]
+
+    def note_version(self, slot_id, version):
+        with self._lock:
+            if version > self._versions.get(slot_id, 0):
+                self._versions[slot_id] = version
+
+    def _add(self, booking_id, slot_id, start_time, end_time):
+        # Bookings without an end hold the slot indefinitely
+        interval = Interval(to_utc_naive(start_time), to_utc_naive(end_time) or datetime.max, booking_id)
+        self._slots.setdefault(slot_id, _SlotIntervals()).add(interval)
+        self._bookings[booking_id] = (slot_id, interval)
+
+    def _remove(self, booking_id):
+        entry = self._bookings.pop(booking_id, None)
+        if entry is None:
+            return
+        slot_id, interval = entry
+        intervals = self._slots.get(slot_id)
+        if intervals is not None:
+            intervals.remove(interval)
+            if not intervals.intervals:
+                del self._slots[slot_id]
+
+    def upsert(self, booking_id, slot_id, start_time, end_time):
+        with self._lock:
+            self._claims.discard(booking_id)
+            self._remove(booking_id)
+            self._add(booking_id, slot_id, start_time, end_time)
+
+    def remove(self, booking_id):
+        with self._lock:
+            self._claims.discard(booking_id)
+            self._remove(booking_id)
+
+    def occupant(self, slot_id, at=None, exclude_booking_id=None):
+        """Return the interval covering ``at`` (default now) on the slot or None"""
+        at = to_utc_naive(at) if at is not None else datetime.utcnow()
+        return self.find_conflict(slot_id, at, at + timedelta(microseconds=1), exclude_booking_id)
+
+    def find_conflict(self, slot_id, start_time, end_time, exclude_booking_id=None):
+        """Return the interval overlapping ``[start_time, end_time)`` or None"""
+        start_time, end_time = to_utc_naive(start_time), to_utc_naive(end_time)
+
+        with self._lock:
+            intervals = self._slots.get(slot_id)
+            if intervals is None:
+                return None
+
+            # The last window starting before end_time is the only candidate,
+            # walk past it only when it is the booking being excluded
+            index = bisect.bisect_left(intervals.starts, end_time) - 1
+            while index >= 0:
+                interval = intervals.intervals[index]
+                if interval.end <= start_time:
+                    return None
+                if interval.booking_id != exclude_booking_id:
+                    return interval
+                index -= 1
+            return None
+
+    def claim(self, slot_ids, start_time, end_time, booking_id):
+        """Reserve the first of ``slot_ids`` that is free for the window
+
+        Checking and reserving happen under one lock, so concurrent callers in
+        this process can never be handed the same window. The reservation is
+        stored under ``booking_id``; once that booking commits it simply
+        replaces the reservation, and callers must ``remove`` it if they fail
+        before committing. Returns the claimed slot id or None.
+        """
+        with self._lock:
+            for slot_id in slot_ids:
+                if self.find_conflict(slot_id, start_time, end_time) is None:
+                    self._add(booking_id, slot_id, start_time, end_time)
+                    self._claims.add(booking_id)
+                    return slot_id
+            return None
+
+    def next_free_gap(self, slot_id, after, duration, exclude_booking_id=None):
+        """Earliest start at or after ``after`` with ``duration`` free on the slot
+
+        Returns None when an open-ended booking blocks the slot. Locating
+        ``after`` is a binary search; only windows that are too short to fit
+        ``duration`` are walked past afterwards.
+        """
+        after = to_utc_naive(after)
+
+        with self._lock:
+            intervals = self._slots.get(slot_id)
+            if intervals is None:
+                return after
+
+            candidate = after
+            index = max(0, bisect.bisect_right(intervals.starts, after) - 1)
+            for index in range(index, len(intervals.intervals)):
+                interval = intervals.intervals[index]
+                if interval.booking_id == exclude_booking_id:
+                    continue
+                if interval.start >= candidate + duration:
+                    break
+                if interval.end > candidate:
+                    # An open-ended booking keeps the slot forever
+                    if interval.end == datetime.max:
+                        return None
+                    candidate = interval.end
+            return candidate
+
+availability = AvailabilityEngine()
+
+@on_commit(Booking, ['id', 'slot_id', 'start_time', 'end_time', 'status'])
+def _sync_bookings(changes):
+    for change in changes:
+        values = change.values
+        if change.op == 'delete' or values['status'] not in HOLDING_STATUSES:
+            availability.remove(values['id'])
+        else:
+            availability.upsert(values['id'], values['slot_id'], values['start_time'], values['end_time'])
+
+@on_commit(Slot, ['id', 'version'])
+def _sync_slot_versions(changes):
+    for change in changes:
+        if change.op != 'delete':
+            availability.note_version(change.values['id'], change.values['version'])
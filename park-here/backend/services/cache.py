@@ -0,0 +1,186 @@
+"""Response cache and conditional GET support for public read endpoints.
+
+Cached views are keyed on their path and normalised query string and stored
+in a size-bounded LRU with a TTL. Each entry carries tags naming the locations
+it shows. Committed writes to those locations or their slots drop the
+matching entries. Every cached response carries an ``ETag`` and a
+``Last-Modified`` header, so polling clients can revalidate and get a 304
+without a body.
+
+The cache is per process; with several workers the TTL bounds how long a
+worker that did not see a write can serve the old entry.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+from functools import wraps
+from flask import Response, make_response, request
+from models import ParkingLocation, Slot
+from services.commit_hooks import on_commit
+
+# Any location list, since inserts and moves can change which rows it returns
+ALL_LOCATIONS = 'locations'
+# Lists filtered on availability, which change membership when counts do
+AVAILABILITY = 'locations:available'
+
+CacheEntry = namedtuple('CacheEntry', ['body', 'status', 'mimetype', 'etag', 'last_modified', 'expires_at', 'tags'])
+
+def location_tag(location_id):
+    return f'location:{location_id}'
+
+class ResponseCache:
+    """Thread-safe LRU of rendered responses with TTL and tag invalidation"""
+
+    def __init__(self, max_entries=1024, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', self.max_entries)
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', self.ttl)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._discard(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    @property
+    def generation(self):
+        """Bumped by every invalidation, see ``put``"""
+        return self._generation
+
+    def put(self, key, response, tags, generation=None):
+        """Store a response unless an invalidation ran since ``generation``
+
+        Views read the database before their entry is stored; passing the
+        generation seen before rendering keeps a response built from data
+        that a concurrent write just replaced from being cached.
+        """
+        body = response.get_data()
+        entry = CacheEntry(
+            body=body,
+            status=response.status_code,
+            mimetype=response.mimetype,
+            etag=hashlib.blake2b(body, digest_size=16).hexdigest(),
+            last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+            expires_at=time.monotonic() + self.ttl,
+            tags=frozenset(tags)
+        )
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return entry
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return entry
+            self._discard(key)
+            self._entries[key] = entry
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+response_cache = ResponseCache()
+
+def _cache_key():
+    # Sort parameters by name and drop ones that are only ever empty, which the
+    # views treat as absent. Names, values and the order of repeated values
+    # stay as sent, since views read them case-sensitively and take the first.
+    params = tuple(sorted(
+        (name, tuple(values))
+        for name, values in request.args.lists()
+        if any(values)
+    ))
+    return request.path, params
+
+def _conditional_response(entry):
+    response = Response(entry.body, status=entry.status, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    response.last_modified = entry.last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def cached(tags):
+    """Cache successful responses of a view, tagged by ``tags(body, **view_args)``
+
+    Only 200 responses are cached; everything else passes straight through.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = _cache_key()
+            entry = response_cache.get(key)
+            if entry is None:
+                generation = response_cache.generation
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = response_cache.put(
+                    key, response, tags(response.get_json(silent=True), **kwargs), generation
+                )
+            return _conditional_response(entry)
+        return wrapper
+    return decorator
+
+@on_commit(ParkingLocation, ['id', 'name', 'address', 'city', 'latitude', 'longitude', 'is_active'])
+def _invalidate_locations(changes):
+    response_cache.invalidate(
+        [ALL_LOCATIONS] + [location_tag(change.values['id']) for change in changes]
+    )
+
+# Booking writes always touch their slot, which bumps its version
+@on_commit(Slot, ['parking_location_id', 'slot_number', 'type', 'status', 'price_per_hour', 'version'])
+def _invalidate_slots(changes):
+    tags = {location_tag(change.values['parking_location_id']) for change in changes}
+    if any(change.op != 'update' or 'status' in change.previous for change in changes):
+        tags.add(AVAILABILITY)
+    response_cache.invalidate(tags)
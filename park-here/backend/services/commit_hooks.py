@@ -0,0 +1,83 @@
+"""Dispatch committed model changes to in-process listeners.
+
+Listeners are registered per model with ``on_commit``. Changes are collected
+after every flush and delivered only once the surrounding transaction
+commits, so in-memory structures never observe rolled back writes.
+"""
+import logging
+from collections import namedtuple, defaultdict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# op is 'insert', 'update' or 'delete'; values holds the tracked fields after
+# the change and previous holds the old value of every tracked field that changed
+Change = namedtuple('Change', ['op', 'values', 'previous'])
+
+_PENDING_KEY = 'pending_commit_changes'
+_listeners = defaultdict(list)
+_handlers = []
+
+def on_commit(model, fields):
+    """Register ``handler(changes)`` for committed changes to ``fields`` of ``model``"""
+    def decorator(handler):
+        _listeners[model].append((tuple(fields), handler))
+        _handlers.append(handler)
+        return handler
+    return decorator
+
+def record(session, model, changes):
+    """Queue changes made outside the unit of work, e.g. bulk Core statements"""
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for fields, handler in _listeners.get(model, ()):
+        pending.setdefault(handler, []).extend(changes)
+
+def _snapshot(obj, fields, op):
+    state = inspect(obj)
+    values = {field: getattr(obj, field) for field in fields}
+    previous = {}
+    if op == 'update':
+        for field in fields:
+            history = state.attrs[field].history
+            if history.has_changes():
+                previous[field] = history.deleted[0] if history.deleted else None
+    return Change(op, values, previous)
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    if not _listeners:
+        return
+
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for op, objects in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            for fields, handler in _listeners.get(type(obj), ()):
+                change = _snapshot(obj, fields, op)
+
+                # Skip updates that did not touch any tracked field
+                if op == 'update' and not change.previous:
+                    continue
+
+                pending.setdefault(handler, []).append(change)
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+
+    # Handlers run in registration order so listeners can rely on each other
+    for handler in _handlers:
+        changes = pending.get(handler)
+        if not changes:
+            continue
+        try:
+            handler(changes)
+        except Exception:
+            # A broken listener must never fail a request that already committed
+            logger.exception('Commit listener %r failed', handler)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
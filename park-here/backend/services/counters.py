@@ -0,0 +1,183 @@
+"""Slot availability counters per location and slot type.
+
+Every flush that inserts, deletes or changes the status, type or location of
+a slot turns those changes into counter deltas and applies them in the same
+transaction as ``SET col = col + delta`` updates on ``slot_counters`` and
+``parking_locations``. Readers therefore never have to count slot rows.
+``reconcile_counters`` recomputes everything from the slots table in bulk to
+repair drift, e.g. after manual edits to the database.
+"""
+import uuid
+from collections import Counter, defaultdict
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+from models import ParkingLocation, Slot, SlotCounter, db
+
+COUNTED_STATUSES = ('available', 'booked', 'maintenance')
+
+def _slot_key(slot, committed):
+    """(location_id, type, status) of a slot before or after pending changes"""
+    state = inspect(slot)
+    key = []
+    for attr in ('parking_location_id', 'type', 'status'):
+        if committed:
+            history = state.attrs[attr].history
+            value = (history.deleted or history.unchanged or [getattr(slot, attr)])[0]
+        else:
+            value = getattr(slot, attr)
+        key.append(value)
+
+    # Column defaults are only applied on INSERT
+    if key[2] is None:
+        key[2] = 'available'
+
+    # Slots added through the relationship only know their location object,
+    # which may not have been given its client-side id yet
+    if key[0] is None and slot.parking_location is not None:
+        location = slot.parking_location
+        if location.id is None:
+            location.id = str(uuid.uuid4())
+        key[0] = location.id
+    return tuple(key)
+
+def new_deltas():
+    return defaultdict(Counter)
+
+def add_slot_delta(deltas, key, sign):
+    location_id, slot_type, status = key
+    delta = deltas[(location_id, slot_type)]
+    delta['total'] += sign
+    if status in COUNTED_STATUSES:
+        delta[status] += sign
+
+def apply_deltas(session, deltas):
+    """Apply ``{(location_id, slot_type): Counter}`` deltas within the current transaction"""
+    locations = defaultdict(Counter)
+
+    # session.get() only sees persistent rows, so index the pending ones too
+    pending = {}
+    for obj in session.new:
+        if isinstance(obj, ParkingLocation):
+            pending[(ParkingLocation, obj.id)] = obj
+        elif isinstance(obj, SlotCounter):
+            pending[(SlotCounter, (obj.parking_location_id, obj.slot_type))] = obj
+
+    def lookup(model, key):
+        obj = pending.get((model, key))
+        return obj if obj is not None else session.get(model, key)
+
+    with session.no_autoflush:
+        for (location_id, slot_type), delta in deltas.items():
+            delta = {column: value for column, value in delta.items() if value}
+            if not delta:
+                continue
+
+            locations[location_id]['total'] += delta.get('total', 0)
+            locations[location_id]['available'] += delta.get('available', 0)
+
+            counter = lookup(SlotCounter, (location_id, slot_type))
+            if counter is None:
+                counter = SlotCounter(parking_location_id=location_id, slot_type=slot_type,
+                                      total=0, available=0, booked=0, maintenance=0)
+                session.add(counter)
+            _increment(counter, delta)
+
+        for location_id, delta in locations.items():
+            location = lookup(ParkingLocation, location_id)
+            if location is not None:
+                _increment(location, {
+                    'total_slots': delta['total'],
+                    'available_slots': delta['available']
+                })
+
+def _increment(obj, delta):
+    pending = inspect(obj).pending
+    for column, value in delta.items():
+        if not value:
+            continue
+        if pending:
+            setattr(obj, column, (getattr(obj, column) or 0) + value)
+        else:
+            # Increment in SQL so concurrent transactions cannot lose updates
+            setattr(obj, column, getattr(type(obj), column) + value)
+
+@event.listens_for(Session, 'before_flush')
+def _track_slot_changes(session, flush_context, instances):
+    deltas = new_deltas()
+
+    for slot in session.new:
+        if isinstance(slot, Slot):
+            add_slot_delta(deltas, _slot_key(slot, committed=False), 1)
+
+    for slot in session.deleted:
+        if isinstance(slot, Slot):
+            add_slot_delta(deltas, _slot_key(slot, committed=True), -1)
+
+    for slot in session.dirty:
+        if not isinstance(slot, Slot) or not session.is_modified(slot):
+            continue
+        before = _slot_key(slot, committed=True)
+        after = _slot_key(slot, committed=False)
+        if before != after:
+            add_slot_delta(deltas, before, -1)
+            add_slot_delta(deltas, after, 1)
+
+    if deltas:
+        apply_deltas(session, deltas)
+
+def reconcile_counters(location_ids=None):
+    """Recompute counters from the slots table and repair any drift
+
+    Returns the number of counter and location rows that were corrected.
+    """
+    query = db.session.query(
+        Slot.parking_location_id, Slot.type, Slot.status, func.count(Slot.id)
+    ).group_by(Slot.parking_location_id, Slot.type, Slot.status)
+    counters_query = SlotCounter.query
+    locations_query = ParkingLocation.query
+    if location_ids is not None:
+        query = query.filter(Slot.parking_location_id.in_(location_ids))
+        counters_query = counters_query.filter(SlotCounter.parking_location_id.in_(location_ids))
+        locations_query = locations_query.filter(ParkingLocation.id.in_(location_ids))
+
+    expected = defaultdict(Counter)
+    for location_id, slot_type, status, count in query:
+        add_slot_delta(expected, (location_id, slot_type, status or 'available'), count)
+
+    repaired = 0
+    existing = {(c.parking_location_id, c.slot_type): c for c in counters_query}
+    for key in set(existing) | set(expected):
+        counts = expected.get(key, Counter())
+        counter = existing.get(key)
+        if counter is None:
+            counter = SlotCounter(parking_location_id=key[0], slot_type=key[1])
+            db.session.add(counter)
+        values = {column: counts.get(column, 0) for column in ('total',) + COUNTED_STATUSES}
+        if any(getattr(counter, column) != value for column, value in values.items()):
+            for column, value in values.items():
+                setattr(counter, column, value)
+            repaired += 1
+
+    totals = defaultdict(Counter)
+    for (location_id, _), counts in expected.items():
+        totals[location_id].update(counts)
+    for location in locations_query:
+        counts = totals.get(location.id, Counter())
+        if (location.total_slots, location.available_slots) != (counts['total'], counts['available']):
+            location.total_slots = counts['total']
+            location.available_slots = counts['available']
+            repaired += 1
+
+    db.session.commit()
+    return repaired
+
+def init_app(app):
+    # Backfill counters the first time they are deployed on an existing database
+    with app.app_context():
+        if SlotCounter.query.first() is None and Slot.query.first() is not None:
+            reconcile_counters()
+
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters_command():
+        """Rebuild slot counters from the slots table."""
+        print(f'Repaired {reconcile_counters()} counter rows')
@@ -0,0 +1,186 @@
+"""Idempotency-Key support for endpoints that create bookings and payments.
+
+A client that may retry a request sends the same ``Idempotency-Key`` header
+with every attempt. The first attempt claims the key in ``idempotency_keys``
+with a fingerprint of the request, runs the view and saves the response.
+Retries within the TTL get the saved response back with an
+``Idempotent-Replayed`` header and never reach the view, so they do not
+touch the booking or payment tables at all.
+
+Concurrent duplicates are collapsed. Inside one process they queue on a
+per-key lock. Across processes the primary key on (user, key) lets only one
+request claim it, and the others wait for the saved response. A claim held
+by a request that died is taken over once ``IDEMPOTENCY_LOCK_SECONDS`` pass.
+
+Only outcomes worth replaying are saved: successes and client errors. Server
+errors and retryable conflicts release the key so the retry runs again.
+"""
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Response, current_app, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from models import IdempotencyKey, db
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# Statuses that are retried as a fresh request rather than replayed
+_RETRYABLE_STATUSES = (409, 429)
+
+_locks_guard = threading.Lock()
+_locks = {}
+_last_purge = 0.0
+
+class _KeyLock:
+    """Per-key lock that is dropped once nobody holds or waits for it"""
+
+    def __init__(self, scope):
+        self.scope = scope
+
+    def __enter__(self):
+        with _locks_guard:
+            entry = _locks.setdefault(self.scope, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        with _locks_guard:
+            entry = _locks[self.scope]
+            entry[0].release()
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[self.scope]
+
+def fingerprint():
+    """Hash of the method, path and JSON body, ignoring key order and spacing"""
+    body = request.get_json(silent=True)
+    if body is None:
+        canonical = request.get_data(as_text=True)
+    else:
+        canonical = json.dumps(body, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f'{request.method} {request.path}\n{canonical}'.encode()).hexdigest()
+
+def _replay(row):
+    response = Response(row.response_body, status=row.response_status, mimetype=row.response_mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def _in_progress_response():
+    response = jsonify({'error': 'A request with this Idempotency-Key is still being processed',
+                        'retryable': True})
+    response.headers['Retry-After'] = '1'
+    return response, 409
+
+def _claim(user_id, key, request_fingerprint, now):
+    """Insert the key as in progress; returns None if claimed, else the existing row"""
+    config = current_app.config
+    values = {
+        'user_id': user_id,
+        'key': key,
+        'fingerprint': request_fingerprint,
+        'status': 'in_progress',
+        'created_at': now,
+        'locked_until': now + timedelta(seconds=config.get('IDEMPOTENCY_LOCK_SECONDS', 60)),
+        'expires_at': now + timedelta(seconds=config.get('IDEMPOTENCY_TTL_SECONDS', 86400))
+    }
+    scope = (IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+
+    # Replays and waits only read; the write transaction is for first attempts
+    with db.engine.connect() as conn:
+        existing = conn.execute(select(IdempotencyKey.__table__).where(*scope)).first()
+    if existing is not None and existing.expires_at > now and (
+            existing.status == 'completed' or existing.locked_until > now):
+        return existing
+
+    try:
+        with db.engine.begin() as conn:
+            _purge_expired(conn, now)
+            # Expired keys and claims abandoned by a crashed request are free again
+            conn.execute(delete(IdempotencyKey).where(*scope, or_(
+                IdempotencyKey.expires_at <= now,
+                (IdempotencyKey.status == 'in_progress') & (IdempotencyKey.locked_until <= now)
+            )))
+            existing = conn.execute(select(IdempotencyKey.__table__).where(*scope)).first()
+            if existing is None:
+                conn.execute(insert(IdempotencyKey).values(**values))
+            return existing
+    except IntegrityError:
+        # Another process claimed the key between the SELECT and the INSERT
+        with db.engine.connect() as conn:
+            return conn.execute(select(IdempotencyKey.__table__).where(*scope)).first()
+
+def _purge_expired(conn, now):
+    """Delete expired keys at most once per ``IDEMPOTENCY_PURGE_SECONDS``"""
+    global _last_purge
+    interval = current_app.config.get('IDEMPOTENCY_PURGE_SECONDS', 300)
+    if time.monotonic() - _last_purge < interval:
+        return
+    _last_purge = time.monotonic()
+    conn.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= now))
+
+def _finish(user_id, key, response):
+    scope = (IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    with db.engine.begin() as conn:
+        if response.status_code >= 500 or response.status_code in _RETRYABLE_STATUSES:
+            conn.execute(delete(IdempotencyKey).where(*scope))
+            return
+        conn.execute(update(IdempotencyKey).where(*scope).values(
+            status='completed',
+            response_status=response.status_code,
+            response_body=response.get_data(as_text=True),
+            response_mimetype=response.mimetype
+        ))
+
+def _release(user_id, key):
+    with db.engine.begin() as conn:
+        conn.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key))
+
+def idempotent(view):
+    """Replay the saved response for repeated ``Idempotency-Key`` requests
+
+    Must sit under ``jwt_required`` since keys are scoped to the user.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+
+        key = key.strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+
+        user_id = get_jwt_identity()
+        request_fingerprint = fingerprint()
+        wait_seconds = current_app.config.get('IDEMPOTENCY_WAIT_SECONDS', 5)
+
+        with _KeyLock((user_id, key)):
+            deadline = time.monotonic() + wait_seconds
+            while True:
+                existing = _claim(user_id, key, request_fingerprint, datetime.utcnow())
+                if existing is None:
+                    break
+                if existing.fingerprint != request_fingerprint:
+                    return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+                if existing.status == 'completed':
+                    return _replay(existing)
+                # Another process is running the first attempt
+                if time.monotonic() >= deadline:
+                    return _in_progress_response()
+                time.sleep(0.05)
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                _release(user_id, key)
+                raise
+            _finish(user_id, key, response)
+            return response
+    return wrapper
@@ -0,0 +1,131 @@
+"""Live slot and availability feed per parking location.
+
+Committed slot changes, whether from booking, slot or bulk handlers or the
+lifecycle scheduler, are published to a ``location:<id>`` topic on the
+pub/sub broker as compact deltas: one ``slots`` event with the changed slots
+and, when counts moved, one ``availability`` event with the location's
+current counters. Nothing is serialized or queried for locations nobody is
+watching.
+
+A client first gets a ``snapshot`` of each location it subscribes to and then
+applies deltas on top. Slot deltas carry the slot version, so a client keeps
+whichever copy of a slot has the higher version when events from concurrent
+commits arrive out of order.
+"""
+import json
+from sqlalchemy import select
+from models import ParkingLocation, Slot, SlotCounter, db
+from services.commit_hooks import on_commit
+from services.pubsub import broker
+
+def location_topic(location_id):
+    return f'location:{location_id}'
+
+def _slot_delta(values):
+    return {
+        'id': values['id'],
+        'slot_number': values['slot_number'],
+        'type': values['type'],
+        'status': values['status'],
+        'price_per_hour': float(values['price_per_hour']) if values['price_per_hour'] is not None else None,
+        'version': values['version']
+    }
+
+def _availability(rows):
+    """Counters per slot type plus location totals from ``slot_counters`` rows"""
+    by_type = {}
+    total = available = 0
+    for row in rows:
+        by_type[row.slot_type] = {
+            'total': row.total,
+            'available': row.available,
+            'booked': row.booked,
+            'maintenance': row.maintenance
+        }
+        total += row.total
+        available += row.available
+    return {'total_slots': total, 'available_slots': available, 'availability': by_type}
+
+def _load_availability(connection, location_ids):
+    rows = connection.execute(
+        select(SlotCounter.__table__).where(SlotCounter.parking_location_id.in_(location_ids))
+    ).all()
+    grouped = {location_id: [] for location_id in location_ids}
+    for row in rows:
+        grouped[row.parking_location_id].append(row)
+    return {location_id: _availability(rows) for location_id, rows in grouped.items()}
+
+def snapshot(location_ids):
+    """``snapshot`` events for the given locations; unknown ids are left out"""
+    found = {
+        location.id: location.name
+        for location in ParkingLocation.query.filter(ParkingLocation.id.in_(location_ids))
+    }
+    if not found:
+        return []
+
+    slots = {location_id: [] for location_id in found}
+    columns = (Slot.id, Slot.parking_location_id, Slot.slot_number, Slot.type,
+               Slot.status, Slot.price_per_hour, Slot.version)
+    for row in db.session.query(*columns).filter(Slot.parking_location_id.in_(found)).order_by(Slot.slot_number):
+        slots[row.parking_location_id].append(_slot_delta(row._asdict()))
+
+    availability = _load_availability(db.session, list(found))
+    return [
+        dict({'type': 'snapshot', 'location_id': location_id, 'name': name, 'slots': slots[location_id]},
+             **availability[location_id])
+        for location_id, name in found.items()
+    ]
+
+def format_event(event, event_id=None):
+    """Encode an event as a Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event["type"]}')
+    lines.append(f'data: {json.dumps(event, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+@on_commit(Slot, ['id', 'parking_location_id', 'slot_number', 'type', 'status', 'price_per_hour', 'version'])
+def _publish_slots(changes):
+    slots = {}
+    counted = set()
+    for change in changes:
+        values = change.values
+        location_id = values['parking_location_id']
+
+        # A slot moved away is gone from its old location, whoever watches the new one
+        if 'parking_location_id' in change.previous:
+            old_location = change.previous['parking_location_id']
+            if broker.has_subscribers(location_topic(old_location)):
+                slots.setdefault(old_location, {})[values['id']] = {'id': values['id'], 'deleted': True}
+                counted.add(old_location)
+
+        if not broker.has_subscribers(location_topic(location_id)):
+            continue
+
+        if change.op == 'delete':
+            delta = {'id': values['id'], 'deleted': True}
+        else:
+            delta = _slot_delta(values)
+        slots.setdefault(location_id, {})[values['id']] = delta
+
+        # Version-only touches from booking writes leave the counters alone
+        if change.op != 'update' or {'status', 'type', 'parking_location_id'} & set(change.previous):
+            counted.add(location_id)
+
+    if not slots:
+        return
+
+    # The commit has finished, so counters are read on a connection of their own
+    availability = {}
+    if counted:
+        with db.engine.connect() as connection:
+            availability = _load_availability(connection, sorted(counted))
+
+    for location_id, deltas in slots.items():
+        topic = location_topic(location_id)
+        broker.publish(topic, {'type': 'slots', 'location_id': location_id, 'slots': list(deltas.values())})
+        if location_id in availability:
+            broker.publish(topic, dict({'type': 'availability', 'location_id': location_id},
+                                       **availability[location_id]))
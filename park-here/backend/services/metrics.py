@@ -0,0 +1,270 @@
+"""Request, SQL, pool and cache metrics in the Prometheus text format.
+
+Every request is counted by blueprint, route rule, method and status, and
+its latency goes into a histogram. Routes are labelled by their rule
+(``/api/bookings/<booking_id>``), never the raw path, which keeps the number
+of series bounded. Responses with a 5xx status also count as errors for
+their handler. For streamed responses the latency covers producing the
+response, not sending the whole body.
+
+SQLAlchemy cursor events count statements and the time spent in them. Work
+done in a request thread is charged to that request's route and adds to a
+histogram of statements per request, which is where N+1 queries show up.
+Background threads such as the scheduler and payment workers are charged to
+``<background>``.
+
+Connection pool usage and cache hit ratios are read when ``/metrics`` is
+scraped, so they cost nothing per request. Recording is one lock and a few
+dictionary updates per request and per statement.
+
+Metrics are per process; with several workers each one is scraped on its own.
+"""
+import threading
+import time
+from bisect import bisect_left
+from flask import g, request
+from sqlalchemy import event
+from extensions import db
+
+PREFIX = 'parkhere'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+BACKGROUND = '<background>'
+UNMATCHED = '<unmatched>'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """Counts per bucket plus sum and count; not thread-safe on its own"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def copy(self):
+        histogram = Histogram(self.buckets)
+        histogram.counts, histogram.sum, histogram.count = list(self.counts), self.sum, self.count
+        return histogram
+
+    def lines(self, name, label_names, label_values):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            le = 'le="%s"' % _number(float(bound))
+            yield f'{name}_bucket{_labels(label_names, label_values, le)} {cumulative}'
+        le = 'le="+Inf"'
+        yield f'{name}_bucket{_labels(label_names, label_values, le)} {self.count}'
+        yield f'{name}_sum{_labels(label_names, label_values)} {_number(self.sum)}'
+        yield f'{name}_count{_labels(label_names, label_values)} {self.count}'
+
+class Metrics:
+    """Process-wide metric registry fed by Flask request hooks and engine events"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._engines = set()
+        self.reset()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.reset()
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        with app.app_context():
+            engine = db.engine
+        if engine not in self._engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._engines.add(engine)
+        self._engine = engine
+
+    def reset(self):
+        with self._lock:
+            self._requests = {}  # (blueprint, route, method, status) -> count
+            self._errors = {}  # (blueprint, route, method) -> count
+            self._latency = {}  # (blueprint, route, method) -> Histogram
+            self._statements = {}  # route -> [statements, seconds]
+            self._statements_per_request = {}  # route -> Histogram
+            self._in_flight = 0
+        self._engine = None
+
+    # Request hooks
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        self._local.statements = 0
+        self._local.sql_seconds = 0.0
+        self._local.active = True
+        with self._lock:
+            self._in_flight += 1
+
+    def _after_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        statements, sql_seconds = self._local.statements, self._local.sql_seconds
+        self._local.active = False
+
+        rule = request.url_rule
+        route = rule.rule if rule is not None else UNMATCHED
+        key = (request.blueprint or '', route, request.method)
+        with self._lock:
+            self._in_flight -= 1
+            status_key = key + (response.status_code,)
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+            if response.status_code >= 500:
+                self._errors[key] = self._errors.get(key, 0) + 1
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(elapsed)
+
+            totals = self._statements.setdefault(route, [0, 0.0])
+            totals[0] += statements
+            totals[1] += sql_seconds
+            histogram = self._statements_per_request.get(route)
+            if histogram is None:
+                histogram = self._statements_per_request[route] = Histogram(STATEMENT_BUCKETS)
+            histogram.observe(statements)
+        return response
+
+    # Engine events
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.sql_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - getattr(self._local, 'sql_started', time.perf_counter())
+        if getattr(self._local, 'active', False):
+            self._local.statements += 1
+            self._local.sql_seconds += elapsed
+            return
+        with self._lock:
+            totals = self._statements.setdefault(BACKGROUND, [0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed
+
+    # Exposition
+
+    def _pool_lines(self):
+        pool = getattr(self._engine, 'pool', None)
+        # Only queue pools report usage; SQLite in memory uses a static pool
+        if pool is None or not hasattr(pool, 'checkedout'):
+            return
+        yield f'# HELP {PREFIX}_db_pool_size Connections the pool keeps open.'
+        yield f'# TYPE {PREFIX}_db_pool_size gauge'
+        yield f'{PREFIX}_db_pool_size {pool.size()}'
+        yield f'# HELP {PREFIX}_db_pool_connections Pooled connections by state.'
+        yield f'# TYPE {PREFIX}_db_pool_connections gauge'
+        yield f'{PREFIX}_db_pool_connections{{state="checked_out"}} {pool.checkedout()}'
+        yield f'{PREFIX}_db_pool_connections{{state="checked_in"}} {pool.checkedin()}'
+        # Negative until the pool has opened pool_size connections
+        yield f'{PREFIX}_db_pool_connections{{state="overflow"}} {max(0, pool.overflow())}'
+
+    def _cache_lines(self):
+        from services.cache import response_cache
+        from services.principals import principal_cache
+
+        caches = (('response', response_cache), ('principal', principal_cache))
+        yield f'# HELP {PREFIX}_cache_hits_total Cache lookups answered from the cache.'
+        yield f'# TYPE {PREFIX}_cache_hits_total counter'
+        for name, cache in caches:
+            yield f'{PREFIX}_cache_hits_total{{cache="{name}"}} {cache.hits}'
+        yield f'# HELP {PREFIX}_cache_misses_total Cache lookups that had to load.'
+        yield f'# TYPE {PREFIX}_cache_misses_total counter'
+        for name, cache in caches:
+            yield f'{PREFIX}_cache_misses_total{{cache="{name}"}} {cache.misses}'
+        yield f'# HELP {PREFIX}_cache_hit_ratio Share of lookups that hit since startup.'
+        yield f'# TYPE {PREFIX}_cache_hit_ratio gauge'
+        for name, cache in caches:
+            lookups = cache.hits + cache.misses
+            yield f'{PREFIX}_cache_hit_ratio{{cache="{name}"}} {_number(cache.hits / lookups if lookups else 0.0)}'
+        yield f'# HELP {PREFIX}_cache_entries Entries held by the cache.'
+        yield f'# TYPE {PREFIX}_cache_entries gauge'
+        for name, cache in caches:
+            yield f'{PREFIX}_cache_entries{{cache="{name}"}} {len(cache)}'
+
+    def render(self):
+        """The current metrics as Prometheus exposition text"""
+        request_labels = ('blueprint', 'route', 'method')
+        with self._lock:
+            requests = sorted(self._requests.items())
+            errors = sorted(self._errors.items())
+            latency = [(key, histogram.copy()) for key, histogram in sorted(self._latency.items())]
+            statements = sorted((route, tuple(totals)) for route, totals in self._statements.items())
+            per_request = [(route, histogram.copy())
+                           for route, histogram in sorted(self._statements_per_request.items())]
+            in_flight = self._in_flight
+
+        lines = [
+            f'# HELP {PREFIX}_http_requests_total Requests handled, by route and status.',
+            f'# TYPE {PREFIX}_http_requests_total counter',
+        ]
+        lines += [f'{PREFIX}_http_requests_total{_labels(request_labels + ("status",), key)} {count}'
+                  for key, count in requests]
+        lines += [
+            f'# HELP {PREFIX}_http_request_errors_total Requests answered with a 5xx status.',
+            f'# TYPE {PREFIX}_http_request_errors_total counter',
+        ]
+        lines += [f'{PREFIX}_http_request_errors_total{_labels(request_labels, key)} {count}'
+                  for key, count in errors]
+        lines += [
+            f'# HELP {PREFIX}_http_request_duration_seconds Time to produce a response.',
+            f'# TYPE {PREFIX}_http_request_duration_seconds histogram',
+        ]
+        for key, histogram in latency:
+            lines += histogram.lines(f'{PREFIX}_http_request_duration_seconds', request_labels, key)
+        lines += [
+            f'# HELP {PREFIX}_http_requests_in_flight Requests being handled right now.',
+            f'# TYPE {PREFIX}_http_requests_in_flight gauge',
+            f'{PREFIX}_http_requests_in_flight {in_flight}',
+            f'# HELP {PREFIX}_sql_statements_total SQL statements executed, by the route that ran them.',
+            f'# TYPE {PREFIX}_sql_statements_total counter',
+        ]
+        lines += [f'{PREFIX}_sql_statements_total{{route="{_escape(route)}"}} {totals[0]}'
+                  for route, totals in statements]
+        lines += [
+            f'# HELP {PREFIX}_sql_duration_seconds_total Time spent executing SQL, by route.',
+            f'# TYPE {PREFIX}_sql_duration_seconds_total counter',
+        ]
+        lines += [f'{PREFIX}_sql_duration_seconds_total{{route="{_escape(route)}"}} {_number(totals[1])}'
+                  for route, totals in statements]
+        lines += [
+            f'# HELP {PREFIX}_request_sql_statements SQL statements per request.',
+            f'# TYPE {PREFIX}_request_sql_statements histogram',
+        ]
+        for route, histogram in per_request:
+            lines += histogram.lines(f'{PREFIX}_request_sql_statements', ('route',), (route,))
+        lines += self._pool_lines()
+        lines += self._cache_lines()
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
@@ -0,0 +1,107 @@
+"""Password hashing off the request threads.
+
+Hashing and verifying passwords is deliberately slow and CPU bound. Running
+it in the request thread lets a burst of logins take every core and stall
+unrelated requests. Here the work runs in a small pool of worker processes,
+which caps how many cores hashing can use at once. Admission control caps
+how many hashes may wait: once ``PASSWORD_HASH_QUEUE`` are in flight, new
+requests are turned away with ``HasherBusy`` rather than queued behind a
+backlog they would time out in anyway.
+
+Stored hashes carry their method and parameters. A successful verification
+of a hash made with older parameters than ``PASSWORD_HASH_METHOD`` returns a
+fresh hash in the same worker call, so logins upgrade passwords without an
+extra round trip.
+
+This module only imports werkzeug, so the spawned workers start quickly and
+never load the app.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'pbkdf2:sha256:600000'
+
+class HasherBusy(Exception):
+    """Too many hashes are already waiting for a worker"""
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+def hash_prefix(method):
+    """The method and parameters werkzeug stores for ``method``
+
+    Shorthands expand, so ``scrypt`` is stored as ``scrypt:32768:8:1``.
+    """
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+def needs_rehash(password_hash, prefix):
+    return password_hash.split('$', 1)[0] != prefix
+
+def _verify(password_hash, password, method, prefix):
+    """Return ``(valid, new_hash)``, with ``new_hash`` set when parameters are stale"""
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash, prefix):
+        return True, _hash(password, method)
+    return True, None
+
+class PasswordHasher:
+    """Bounded process pool for password hashing with admission control"""
+
+    def __init__(self, workers=1, queue_size=8, timeout=30, method=DEFAULT_METHOD):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.method = method
+        self._prefix = None
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def init_app(self, app):
+        self.shutdown()
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.queue_size = app.config.get('PASSWORD_HASH_QUEUE', max(self.workers, 1) * 4)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self._prefix = hash_prefix(self.method)
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _pool(self):
+        # Started on first use so scripts that never hash spawn no processes
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _run(self, function, *args):
+        if self.workers <= 0:
+            return function(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            return self._pool().submit(function, *args).result(timeout=self.timeout)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Check a password; returns ``(valid, new_hash)``, see ``_verify``"""
+        if self._prefix is None:
+            self._prefix = hash_prefix(self.method)
+        return self._run(_verify, password_hash, password, self.method, self._prefix)
+
+hasher = PasswordHasher(workers=max(1, (os.cpu_count() or 2) // 2))
@@ -0,0 +1,290 @@
+"""Asynchronous payment processing against a pluggable gateway.
+
+``initiate_payment`` only records a ``pending`` payment. Once that insert
+commits, the payment is queued for a bounded pool of worker threads that
+charge it through the configured gateway adapter outside of any database
+transaction. Transient gateway errors are retried with exponential backoff
+and jitter; declines and exhausted retries fail the payment.
+
+Every outcome, whether from a worker or from a client calling ``/verify``,
+goes through ``settle_payment``, a guarded ``UPDATE ... WHERE status =
+'pending'``, so whichever side learns the result first wins and the other is
+a no-op.
+
+The payment's transaction id is sent as the gateway idempotency key. A retry
+after a timeout, or a second worker process recovering the same pending
+payment after a restart, therefore never charges twice.
+"""
+import heapq
+import importlib
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import select, update
+from models import Payment, db
+from services import commit_hooks
+from services.commit_hooks import on_commit
+
+logger = logging.getLogger(__name__)
+
+# status is 'completed' or 'failed'; reference is the gateway's id for the charge
+GatewayResult = namedtuple('GatewayResult', ['status', 'reference', 'message'])
+
+ChargeRequest = namedtuple('ChargeRequest', ['payment_id', 'transaction_id', 'amount', 'payment_method'])
+
+class TransientGatewayError(Exception):
+    """The gateway could not answer; the charge may be retried"""
+
+class PaymentGateway:
+    """Adapter interface for payment gateways
+
+    ``charge`` must treat ``request.transaction_id`` as an idempotency key.
+    ``lookup`` returns the outcome of an earlier charge, or ``None`` while it
+    is unknown or still in progress.
+    """
+
+    def charge(self, request):
+        raise NotImplementedError
+
+    def lookup(self, transaction_id):
+        raise NotImplementedError
+
+class SimulatedGateway(PaymentGateway):
+    """Local gateway with configurable latency, outage and decline rates"""
+
+    def __init__(self, latency_ms=200, failure_rate=0.0, decline_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._outcomes = {}
+
+    def charge(self, request):
+        with self._lock:
+            known = self._outcomes.get(request.transaction_id)
+            # Latency varies by up to 50% either way
+            delay = self.latency_ms * self._random.uniform(0.5, 1.5) / 1000
+            roll = self._random.random()
+        if known is not None:
+            return known
+
+        time.sleep(delay)
+        if roll < self.failure_rate:
+            raise TransientGatewayError('Simulated gateway timeout')
+
+        if roll < self.failure_rate + self.decline_rate:
+            result = GatewayResult('failed', None, 'Declined by the simulated gateway')
+        else:
+            result = GatewayResult('completed', f'SIM-{request.transaction_id}', None)
+        with self._lock:
+            return self._outcomes.setdefault(request.transaction_id, result)
+
+    def lookup(self, transaction_id):
+        with self._lock:
+            return self._outcomes.get(transaction_id)
+
+def load_gateway(app):
+    """Build the gateway named by ``PAYMENT_GATEWAY``"""
+    name = app.config.get('PAYMENT_GATEWAY') or 'simulated'
+    if name == 'simulated':
+        return SimulatedGateway(
+            latency_ms=app.config.get('PAYMENT_GATEWAY_LATENCY_MS', 200),
+            failure_rate=app.config.get('PAYMENT_GATEWAY_FAILURE_RATE', 0.0),
+            decline_rate=app.config.get('PAYMENT_GATEWAY_DECLINE_RATE', 0.0)
+        )
+    module_name, _, class_name = name.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)(app)
+
+def settle_payment(payment_id, result):
+    """Apply a final gateway result to a pending payment; returns True if it changed
+
+    Runs in the caller's session and transaction; the caller commits.
+    """
+    if result is None or result.status not in ('completed', 'failed'):
+        return False
+
+    details = {'gateway_reference': result.reference}
+    if result.message:
+        details['gateway_message'] = result.message
+    rows = db.session.execute(
+        update(Payment)
+        .where(Payment.id == payment_id, Payment.status == 'pending')
+        .values(status=result.status, payment_details=details, updated_at=datetime.utcnow())
+        .returning(Payment.id, Payment.transaction_id, Payment.amount, Payment.payment_method, Payment.status)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    # Core updates bypass the flush, so tell the commit listeners directly
+    commit_hooks.record(db.session, Payment, [
+        commit_hooks.Change('update', row._asdict(), {'status': 'pending'}) for row in rows
+    ])
+    return bool(rows)
+
+class PaymentProcessor:
+    """Bounded worker pool charging pending payments with retries"""
+
+    def __init__(self, workers=4, queue_size=1000, max_attempts=5, retry_base_seconds=0.5, retry_max_seconds=30):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.gateway = SimulatedGateway()
+        self._ready = threading.Condition()
+        self._jobs = []
+        self._queued = set()
+        self._sequence = itertools.count()
+        self._overflowed = False
+        self._stopping = False
+        self._threads = []
+        self._app = None
+
+    def init_app(self, app):
+        self.stop()
+        self.workers = app.config.get('PAYMENT_WORKERS', self.workers)
+        self.queue_size = app.config.get('PAYMENT_QUEUE_SIZE', self.queue_size)
+        self.max_attempts = app.config.get('PAYMENT_MAX_ATTEMPTS', self.max_attempts)
+        self.retry_base_seconds = app.config.get('PAYMENT_RETRY_BASE_SECONDS', self.retry_base_seconds)
+        self.retry_max_seconds = app.config.get('PAYMENT_RETRY_MAX_SECONDS', self.retry_max_seconds)
+        self.gateway = load_gateway(app)
+        self._app = app
+
+        with self._ready:
+            self._jobs = []
+            self._queued = set()
+            self._overflowed = False
+            self._stopping = False
+
+        if self.workers > 0:
+            self.start()
+
+    def start(self):
+        # The first worker recovers payments left pending by a previous run
+        self._overflowed = True
+        self._threads = [
+            threading.Thread(target=self._run, name=f'payment-worker-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        with self._ready:
+            self._stopping = True
+            self._ready.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def submit(self, request, attempt=0, delay=0.0):
+        """Queue a charge; returns False when the queue is full
+
+        Payments that do not fit stay pending and are picked up again by a
+        sweep of the payments table once the queue has drained.
+        """
+        with self._ready:
+            if request.payment_id in self._queued and attempt == 0:
+                return True
+            if len(self._jobs) >= self.queue_size:
+                self._overflowed = True
+                return False
+            self._queued.add(request.payment_id)
+            heapq.heappush(self._jobs, (time.monotonic() + delay, next(self._sequence), attempt, request))
+            self._ready.notify()
+        return True
+
+    def backoff(self, attempt):
+        """Delay before retry number ``attempt`` (1-based), with full jitter"""
+        ceiling = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (attempt - 1))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def _next_job(self):
+        with self._ready:
+            while not self._stopping:
+                if self._jobs:
+                    wait = self._jobs[0][0] - time.monotonic()
+                    if wait <= 0:
+                        _, _, attempt, request = heapq.heappop(self._jobs)
+                        return attempt, request
+                    self._ready.wait(wait)
+                elif self._overflowed:
+                    self._overflowed = False
+                    return None, None
+                else:
+                    self._ready.wait()
+            return None, None
+
+    def _run(self):
+        while True:
+            attempt, request = self._next_job()
+            if self._stopping:
+                return
+            with self._app.app_context():
+                try:
+                    if request is None:
+                        self._recover()
+                    else:
+                        self._process(request, attempt)
+                except Exception:
+                    logger.exception('Payment worker failed')
+                finally:
+                    db.session.remove()
+
+    def _process(self, request, attempt):
+        try:
+            result = self.gateway.charge(request)
+        except TransientGatewayError as e:
+            attempt += 1
+            if attempt < self.max_attempts:
+                delay = self.backoff(attempt)
+                logger.info('Payment %s attempt %d failed (%s), retrying in %.1fs',
+                            request.payment_id, attempt, e, delay)
+                if not self.submit(request, attempt, delay):
+                    # Left pending for the sweep once the queue drains
+                    with self._ready:
+                        self._queued.discard(request.payment_id)
+                return
+            result = GatewayResult('failed', None, f'Gateway unavailable after {attempt} attempts')
+
+        with self._ready:
+            self._queued.discard(request.payment_id)
+        try:
+            settle_payment(request.payment_id, result)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # The outcome is recorded at the gateway; the next sweep settles it
+            with self._ready:
+                self._overflowed = True
+            raise
+
+    def _recover(self):
+        rows = db.session.execute(
+            select(Payment.id, Payment.transaction_id, Payment.amount, Payment.payment_method)
+            .where(Payment.status == 'pending')
+            .order_by(Payment.created_at)
+            .limit(self.queue_size)
+        ).all()
+        db.session.rollback()
+        queued = sum(self.submit(ChargeRequest(*row)) for row in rows)
+        if queued:
+            logger.info('Queued %d pending payments', queued)
+
+processor = PaymentProcessor()
+
+def charge_request(values):
+    return ChargeRequest(values['id'], values['transaction_id'], values['amount'], values['payment_method'])
+
+@on_commit(Payment, ['id', 'transaction_id', 'amount', 'payment_method', 'status'])
+def _enqueue_payments(changes):
+    for change in changes:
+        if change.op == 'insert' and change.values['status'] == 'pending':
+            processor.submit(charge_request(change.values))
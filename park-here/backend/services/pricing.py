@@ -0,0 +1,168 @@
+"""Tariffs and vectorised price quotes.
+
+A booking costs the slot's hourly rate times the multiplier for its slot type
+times the billed hours. Billed hours are the window's length rounded up to
+``PRICING_INCREMENT_MINUTES``, when set, and never less than
+``PRICING_MINIMUM_HOURS``. No booking costs less than
+``PRICING_MINIMUM_CHARGE``. With the defaults an amount is simply hours times
+``price_per_hour``, as before.
+
+The tariff is compiled into arrays once per app. Slot types map to integer
+codes, and the multipliers are indexed by code. Each location's slots are kept
+as id, code and rate arrays, which are dropped when a slot's type, status or
+price is committed and otherwise expire after ``PRICING_CACHE_TTL`` seconds.
+The commit hook only sees this process's writes, so with several workers the
+TTL bounds how long another worker quotes old prices. Quoting S slots over W windows is then a single (S, W)
+array expression, not S * W Python calls.
+
+Bookings are charged through ``quote_amount``, the same expression on a 1 x 1
+matrix, so a quote always matches what the booking will cost.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+import numpy as np
+from sqlalchemy import or_
+from models import Slot, db
+from services.commit_hooks import on_commit
+
+DEFAULT_TYPE_MULTIPLIERS = {'car': 1.0, 'bike': 1.0, 'ev': 1.0, 'handicap': 1.0}
+
+# One location's bookable slots, in slot number order
+PriceTable = namedtuple('PriceTable', ['ids', 'numbers', 'types', 'prices', 'rates'])
+
+class Tariff:
+    """Pricing rules compiled into lookup arrays"""
+
+    def __init__(self, multipliers=None, minimum_hours=0.0, minimum_charge=0.0, increment_minutes=0):
+        multipliers = dict(DEFAULT_TYPE_MULTIPLIERS if multipliers is None else multipliers)
+        self.type_codes = {slot_type: code for code, slot_type in enumerate(sorted(multipliers))}
+        # Types without a rule take the last entry, a multiplier of one
+        self.multipliers = np.array([float(multipliers[slot_type]) for slot_type in sorted(multipliers)] + [1.0])
+        self.minimum_hours = float(minimum_hours)
+        self.minimum_charge = float(minimum_charge)
+        self.increment_hours = float(increment_minutes) / 60
+
+    def rates(self, prices, slot_types):
+        """Hourly rates for parallel sequences of base prices and slot types"""
+        unknown = len(self.type_codes)
+        codes = np.fromiter((self.type_codes.get(slot_type, unknown) for slot_type in slot_types),
+                            dtype=np.intp, count=len(slot_types))
+        return np.asarray(prices, dtype=np.float64) * self.multipliers[codes]
+
+    def billed_hours(self, hours):
+        hours = np.asarray(hours, dtype=np.float64)
+        if self.increment_hours > 0:
+            # Durations a hair over a whole increment are float noise, not another increment
+            hours = np.ceil(hours / self.increment_hours - 1e-9) * self.increment_hours
+        return np.maximum(hours, self.minimum_hours)
+
+    def amounts(self, rates, hours):
+        """(S, W) matrix of amounts for S hourly rates and W durations in hours"""
+        amounts = np.multiply.outer(np.asarray(rates, dtype=np.float64), self.billed_hours(hours))
+        return np.round(np.maximum(amounts, self.minimum_charge), 2)
+
+def window_hours(windows):
+    return np.array([(end - start).total_seconds() / 3600 for start, end in windows], dtype=np.float64)
+
+class PricingEngine:
+    """The app's tariff plus a per-location LRU of slot price arrays"""
+
+    def __init__(self, max_locations=1024, ttl=30):
+        self.max_locations = max_locations
+        self.ttl = ttl
+        self.tariff = Tariff()
+        self._lock = threading.Lock()
+        self._tables = OrderedDict()
+        self._generation = 0
+
+    def init_app(self, app):
+        self.max_locations = app.config.get('PRICING_CACHE_MAX_LOCATIONS', self.max_locations)
+        self.ttl = app.config.get('PRICING_CACHE_TTL', self.ttl)
+        self.tariff = Tariff(
+            app.config.get('PRICING_TYPE_MULTIPLIERS'),
+            app.config.get('PRICING_MINIMUM_HOURS', 0.0),
+            app.config.get('PRICING_MINIMUM_CHARGE', 0.0),
+            app.config.get('PRICING_INCREMENT_MINUTES', 0)
+        )
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._tables.clear()
+
+    def invalidate(self, location_ids):
+        with self._lock:
+            self._generation += 1
+            for location_id in location_ids:
+                self._tables.pop(location_id, None)
+
+    def quote_amount(self, price_per_hour, slot_type, start_time, end_time):
+        """What a booking of one slot for one window costs"""
+        rates = self.tariff.rates([price_per_hour], [slot_type])
+        return float(self.tariff.amounts(rates, window_hours([(start_time, end_time)]))[0, 0])
+
+    def price_table(self, location_id):
+        """Price arrays for a location's slots that are not under maintenance"""
+        with self._lock:
+            cached = self._tables.get(location_id)
+            if cached is not None and cached[0] <= time.monotonic():
+                del self._tables[location_id]
+                cached = None
+            if cached is not None:
+                self._tables.move_to_end(location_id)
+                return cached[1]
+            generation = self._generation
+
+        rows = db.session.query(Slot.id, Slot.slot_number, Slot.type, Slot.price_per_hour).filter(
+            Slot.parking_location_id == location_id,
+            or_(Slot.status.is_(None), Slot.status != 'maintenance')
+        ).order_by(Slot.slot_number).all()
+        ids, numbers, types, prices = (list(column) for column in zip(*rows)) if rows else ([], [], [], [])
+        table = PriceTable(ids, numbers, types, np.asarray(prices, dtype=np.float64),
+                           self.tariff.rates(prices, types))
+
+        if self.max_locations > 0 and self.ttl > 0:
+            with self._lock:
+                # A slot commit since the read may have made these prices stale
+                if generation != self._generation:
+                    return table
+                self._tables[location_id] = (time.monotonic() + self.ttl, table)
+                while len(self._tables) > self.max_locations:
+                    self._tables.popitem(last=False)
+        return table
+
+    def quote_location(self, location_id, windows, slot_type=None, slot_ids=None):
+        """Quote every matching slot at a location for every window
+
+        Returns the location's price table, the indexes of the rows quoted,
+        the billed hours per window and the (slots, windows) amount matrix.
+        """
+        table = self.price_table(location_id)
+        selected = np.ones(len(table.ids), dtype=bool)
+        if slot_type:
+            selected &= np.array([value == slot_type for value in table.types], dtype=bool)
+        if slot_ids is not None:
+            wanted = set(slot_ids)
+            selected &= np.array([value in wanted for value in table.ids], dtype=bool)
+        rows = np.flatnonzero(selected)
+
+        hours = window_hours(windows)
+        return table, rows, self.tariff.billed_hours(hours), self.tariff.amounts(table.rates[rows], hours)
+
+pricing = PricingEngine()
+
+def quote_amount(slot, start_time, end_time):
+    """Amount charged for booking ``slot`` from ``start_time`` to ``end_time``"""
+    return pricing.quote_amount(slot.price_per_hour, slot.type, start_time, end_time)
+
+# Version-only touches from bookings leave prices alone and do not get here
+@on_commit(Slot, ['parking_location_id', 'slot_number', 'type', 'status', 'price_per_hour'])
+def _invalidate_prices(changes):
+    location_ids = set()
+    for change in changes:
+        location_ids.add(change.values['parking_location_id'])
+        if 'parking_location_id' in change.previous:
+            location_ids.add(change.previous['parking_location_id'])
+    pricing.invalidate(location_ids)
@@ -0,0 +1,103 @@
+"""Authorization claims and a cached principal lookup.
+
+Access tokens carry the user's role as a claim, so most checks never query
+the ``users`` table. A token that claims no privilege is trusted as is;
+claiming less than you have cannot hurt. A token that claims a privileged
+role is confirmed against the principal cache instead. Demoting a user
+therefore takes effect without waiting for their 30 day token to expire.
+Tokens issued before roles were embedded fall back to the cache as well.
+
+The cache is a per-process LRU of the authorization relevant user fields.
+Committed changes to a user drop their entry. Other workers do not see that
+commit, so entries also expire after ``PRINCIPAL_CACHE_TTL`` seconds.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from models import User, db
+from services.commit_hooks import on_commit
+
+# Roles that must be confirmed against the database rather than the token
+PRIVILEGED_ROLES = ('admin', 'parking_owner')
+
+Principal = namedtuple('Principal', ['id', 'name', 'email', 'phone', 'role', 'created_at'])
+
+def token_claims(user):
+    """Extra claims for access tokens issued to ``user``"""
+    return {'role': user.role or 'user'}
+
+class PrincipalCache:
+    """Thread-safe LRU of principals with a TTL"""
+
+    def __init__(self, max_entries=4096, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('PRINCIPAL_CACHE_MAX_ENTRIES', self.max_entries)
+        self.ttl = app.config.get('PRINCIPAL_CACHE_TTL', self.ttl)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id):
+        """Return the principal for ``user_id``, loading it on a miss; None if unknown"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        row = db.session.query(
+            User.id, User.name, User.email, User.phone, User.role, User.created_at
+        ).filter(User.id == user_id).first()
+        if row is None:
+            return None
+
+        principal = Principal(*row)
+        if self.ttl > 0 and self.max_entries > 0:
+            with self._lock:
+                self._entries[user_id] = (principal, time.monotonic() + self.ttl)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return principal
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+principal_cache = PrincipalCache()
+
+def current_principal():
+    return principal_cache.get(get_jwt_identity())
+
+def has_role(role):
+    """Whether the current user has ``role``; needs a verified JWT in the request"""
+    claimed = get_jwt().get('role')
+    if claimed is not None and claimed != role:
+        return False
+    if claimed is not None and role not in PRIVILEGED_ROLES:
+        return True
+    principal = current_principal()
+    return principal is not None and principal.role == role
+
+def is_admin():
+    return has_role('admin')
+
+@on_commit(User, ['id', 'name', 'email', 'phone', 'role'])
+def _invalidate_users(changes):
+    principal_cache.invalidate([change.values['id'] for change in changes])
@@ -0,0 +1,369 @@
+"""On-demand profiling of single requests.
+
+An admin profiles a request by sending ``X-Profile: sample`` or adding
+``?profile=sample`` to it. ``trace`` in place of ``sample`` records every
+Python call instead. The flag is ignored for everyone else. Separately,
+``PROFILING_SAMPLE_RATE`` profiles that fraction of all traffic in sampling
+mode.
+
+- Sampling: a shared thread snapshots the stacks of the threads being
+  profiled every ``PROFILING_INTERVAL_MS``. Each sample is weighted by the
+  time since the previous one. This is cheap enough to leave on for a small
+  share of production traffic. While the request is busy in Python, the
+  sampler needs the GIL to take a sample, so samples can be up to the
+  interpreter's switch interval (5 ms) apart. Short requests are better
+  traced.
+- Tracing: ``sys.setprofile`` on the request thread records each call and
+  return. It is exact, but makes the request several times slower.
+
+Either way the SQL statements the request ran are recorded with their start
+offset and duration.
+
+Each profile is stored in ``PROFILING_DIR`` as a speedscope file
+(https://www.speedscope.app). The file holds the request's profile and an
+"SQL" profile on the same timeline. A small metadata file next to it has the
+request details and the SQL timeline. Profiles can also be downloaded as
+collapsed stacks for flamegraph tools. Only the newest
+``PROFILING_MAX_PROFILES`` are kept.
+"""
+import glob
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from flask import g, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import event
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID = re.compile(r'^\d{14}-[0-9a-f]{8}$')
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+MAX_STATEMENT_LENGTH = 2000
+
+def _frame_key(code):
+    return code.co_name, code.co_filename, code.co_firstlineno
+
+class Capture:
+    """Stack samples or call events and SQL statements of one request"""
+
+    def __init__(self, mode, requested, max_events):
+        self.mode = mode
+        self.requested = requested
+        self.thread_id = threading.get_ident()
+        self.max_events = max_events
+        self.started = time.perf_counter()
+        self.ended = None
+        self.last_sample = self.started
+        self.samples = []  # (stack outermost first, seconds)
+        self.events = []  # ('O' or 'C', frame key, perf_counter)
+        self.sql = []  # (start, end, statement)
+        self.sql_started = None
+        self.truncated = False
+
+    def trace(self, frame, event, arg):
+        if event == 'call' or event == 'return':
+            self.events.append(('O' if event == 'call' else 'C', _frame_key(frame.f_code), time.perf_counter()))
+            if len(self.events) >= self.max_events:
+                sys.setprofile(None)
+                self.truncated = True
+
+class Profiler:
+    """Request hooks, the shared sampler thread and profile storage"""
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.interval = 0.002
+        self.directory = None
+        self.max_profiles = 100
+        self.max_events = 1000000
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._sampling = {}  # thread id -> Capture
+        self._tracing = {}  # thread id -> Capture, for the SQL hooks
+        self._sampler = None
+        self._engines = set()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PROFILING_ENABLED', True)
+        self.sample_rate = app.config.get('PROFILING_SAMPLE_RATE', 0.0)
+        self.interval = app.config.get('PROFILING_INTERVAL_MS', 2) / 1000
+        self.directory = app.config.get('PROFILING_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.max_profiles = app.config.get('PROFILING_MAX_PROFILES', self.max_profiles)
+        self.max_events = app.config.get('PROFILING_MAX_EVENTS', self.max_events)
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        with app.app_context():
+            engine = db.engine
+        if engine not in self._engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._engines.add(engine)
+
+    # Request hooks
+
+    def _requested_mode(self):
+        """``(mode, requested)`` for this request, or None to leave it alone"""
+        flag = (request.headers.get('X-Profile') or request.args.get('profile') or '').lower()
+        if flag and self._is_admin():
+            return ('trace' if flag == 'trace' else 'sample'), True
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample', False
+        return None
+
+    def _is_admin(self):
+        from services.principals import is_admin
+        try:
+            verify_jwt_in_request(optional=True)
+            return get_jwt_identity() is not None and is_admin()
+        except Exception:
+            return False
+
+    def _before_request(self):
+        decision = self._requested_mode()
+        if decision is None:
+            return
+        capture = Capture(decision[0], decision[1], self.max_events)
+        g.profile = capture
+        with self._lock:
+            self._tracing[capture.thread_id] = capture
+            if capture.mode == 'sample':
+                self._sampling[capture.thread_id] = capture
+                self._ensure_sampler()
+                self._wake.notify()
+        if capture.mode == 'trace':
+            sys.setprofile(capture.trace)
+
+    def _stop(self, capture):
+        if capture.mode == 'trace':
+            sys.setprofile(None)
+        capture.ended = time.perf_counter()
+        with self._lock:
+            self._sampling.pop(capture.thread_id, None)
+            self._tracing.pop(capture.thread_id, None)
+
+    def _after_request(self, response):
+        capture = g.pop('profile', None)
+        if capture is None:
+            return response
+        self._stop(capture)
+
+        rule = request.url_rule
+        meta = {
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'route': rule.rule if rule is not None else None,
+            'status': response.status_code,
+            'mode': capture.mode,
+            'trigger': 'flag' if capture.requested else 'rate',
+        }
+        try:
+            profile_id = self.save(capture, meta)
+        except OSError:
+            logger.exception('Could not store profile')
+            return response
+        if capture.requested:
+            response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    def _teardown_request(self, error=None):
+        # Stop a profile that after_request never got to, so tracing cannot leak
+        capture = g.pop('profile', None)
+        if capture is not None:
+            self._stop(capture)
+
+    # SQL timeline
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        capture = self._tracing.get(threading.get_ident())
+        if capture is not None:
+            capture.sql_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        capture = self._tracing.get(threading.get_ident())
+        if capture is not None and capture.sql_started is not None:
+            capture.sql.append((capture.sql_started, time.perf_counter(), statement[:MAX_STATEMENT_LENGTH]))
+            capture.sql_started = None
+
+    # Sampling
+
+    def _ensure_sampler(self):
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._sample_loop, name='request-profiler', daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                while not self._sampling:
+                    self._wake.wait()
+            time.sleep(self.interval)
+
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            with self._lock:
+                captures = list(self._sampling.values())
+            for capture in captures:
+                frame = frames.get(capture.thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_key(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                capture.samples.append((tuple(stack), now - capture.last_sample))
+                capture.last_sample = now
+
+    # Storage
+
+    def _speedscope(self, capture, title):
+        frames, indexes = [], {}
+
+        def frame_index(key):
+            index = indexes.get(key)
+            if index is None:
+                index = indexes[key] = len(frames)
+                frames.append({'name': key[0], 'file': key[1], 'line': key[2]} if key[1] else {'name': key[0]})
+            return index
+
+        def offset(at):
+            return (at - capture.started) * 1000
+
+        duration = offset(capture.ended)
+        profiles = []
+        if capture.mode == 'sample':
+            profiles.append({
+                'type': 'sampled', 'name': title, 'unit': 'milliseconds', 'startValue': 0, 'endValue': duration,
+                'samples': [[frame_index(key) for key in stack] for stack, _ in capture.samples],
+                'weights': [weight * 1000 for _, weight in capture.samples],
+            })
+        else:
+            events, open_frames = [], []
+            for kind, key, at in capture.events:
+                if kind == 'O':
+                    open_frames.append(key)
+                    events.append({'type': 'O', 'frame': frame_index(key), 'at': offset(at)})
+                # Returns from frames entered before tracing began have no open event
+                elif open_frames and open_frames[-1] == key:
+                    open_frames.pop()
+                    events.append({'type': 'C', 'frame': frame_index(key), 'at': offset(at)})
+            while open_frames:
+                events.append({'type': 'C', 'frame': frame_index(open_frames.pop()), 'at': duration})
+            profiles.append({'type': 'evented', 'name': title, 'unit': 'milliseconds',
+                             'startValue': 0, 'endValue': duration, 'events': events})
+
+        sql_events = []
+        for start, end, statement in capture.sql:
+            index = frame_index((statement, None, None))
+            sql_events += [{'type': 'O', 'frame': index, 'at': offset(start)},
+                           {'type': 'C', 'frame': index, 'at': offset(end)}]
+        profiles.append({'type': 'evented', 'name': 'SQL', 'unit': 'milliseconds',
+                         'startValue': 0, 'endValue': duration, 'events': sql_events})
+
+        return {'$schema': SPEEDSCOPE_SCHEMA, 'name': title, 'exporter': 'park-here',
+                'activeProfileIndex': 0, 'shared': {'frames': frames}, 'profiles': profiles}
+
+    def save(self, capture, meta):
+        """Write the capture and its metadata; returns the profile id"""
+        created_at = datetime.utcnow()
+        profile_id = f'{created_at:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}'
+        title = f'{meta["method"]} {meta["path"]}'
+        meta = dict(meta, id=profile_id, created_at=created_at.isoformat(),
+                    duration_ms=round((capture.ended - capture.started) * 1000, 3),
+                    samples=len(capture.samples), events=len(capture.events), truncated=capture.truncated,
+                    sql_count=len(capture.sql),
+                    sql_ms=round(sum(end - start for start, end, _ in capture.sql) * 1000, 3),
+                    sql=[{'start_ms': round((start - capture.started) * 1000, 3),
+                          'duration_ms': round((end - start) * 1000, 3), 'statement': statement}
+                         for start, end, statement in capture.sql])
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f'{profile_id}.speedscope.json'), 'w') as handle:
+            json.dump(self._speedscope(capture, title), handle)
+        # Metadata last, so a listed profile always has its profile file
+        with open(os.path.join(self.directory, f'{profile_id}.json'), 'w') as handle:
+            json.dump(meta, handle)
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        stored = sorted(glob.glob(os.path.join(self.directory, '*.speedscope.json')))
+        for path in stored[:max(0, len(stored) - self.max_profiles)]:
+            for stale in (path, path.replace('.speedscope.json', '.json')):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+    def list(self):
+        """Metadata of stored profiles, newest first, without the SQL timelines"""
+        profiles = []
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.json')), reverse=True):
+            if path.endswith('.speedscope.json'):
+                continue
+            try:
+                with open(path) as handle:
+                    meta = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            meta.pop('sql', None)
+            profiles.append(meta)
+        return profiles
+
+    def _path(self, profile_id, suffix):
+        if not PROFILE_ID.match(profile_id or ''):
+            return None
+        path = os.path.join(self.directory, f'{profile_id}{suffix}')
+        return path if os.path.exists(path) else None
+
+    def meta(self, profile_id):
+        path = self._path(profile_id, '.json')
+        if path is None:
+            return None
+        with open(path) as handle:
+            return json.load(handle)
+
+    def speedscope_path(self, profile_id):
+        return self._path(profile_id, '.speedscope.json')
+
+    def collapsed(self, profile_id):
+        """The stored profile as collapsed stacks weighted in microseconds"""
+        path = self.speedscope_path(profile_id)
+        if path is None:
+            return None
+        with open(path) as handle:
+            document = json.load(handle)
+
+        frames = [f'{frame["name"]} ({os.path.basename(frame["file"])}:{frame["line"]})' if 'file' in frame
+                  else frame['name'] for frame in document['shared']['frames']]
+        totals = Counter()
+        profile = document['profiles'][0]
+        if profile['type'] == 'sampled':
+            for stack, weight in zip(profile['samples'], profile['weights']):
+                totals[';'.join(frames[index] for index in stack)] += weight
+        else:
+            # Replay the events, charging time between them to the open stack
+            stack, last = [], 0
+            for event in profile['events']:
+                if stack:
+                    totals[';'.join(frames[index] for index in stack)] += event['at'] - last
+                last = event['at']
+                if event['type'] == 'O':
+                    stack.append(event['frame'])
+                else:
+                    stack.pop()
+        return ''.join(f'{line} {round(ms * 1000)}\n' for line, ms in totals.items() if round(ms * 1000) > 0)
+
+profiler = Profiler()
@@ -0,0 +1,124 @@
+"""Topic based publish/subscribe for pushing events to connected clients.
+
+Publishers call ``broker.publish(topic, event)`` and every subscription to
+that topic gets the event in its own bounded queue. A subscriber that falls
+too far behind loses its oldest events and is told so, so one slow client can
+never hold up a publisher or grow memory without bound.
+
+``LocalBroker`` fans out within the current process only. With several
+workers each worker sees only its own commits, so ``PUBSUB_BROKER`` can name
+a replacement (``'package.module:ClassName'``, constructed with the app) that
+implements the same ``publish``, ``subscribe``, ``has_subscribers`` and
+``subscriber_count`` methods on top of a shared broker; the rest of the app
+only ever talks to ``broker``.
+"""
+import importlib
+import threading
+from collections import deque
+
+class Subscription:
+    """Bounded queue of ``(topic, event)`` pairs for one subscriber"""
+
+    def __init__(self, broker, topics, max_queue):
+        self.broker = broker
+        self.topics = frozenset(topics)
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.closed = False
+        self._events = deque()
+        self._ready = threading.Condition()
+
+    def put(self, topic, event):
+        with self._ready:
+            if len(self._events) >= self.max_queue:
+                self._events.popleft()
+                self.dropped += 1
+            self._events.append((topic, event))
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        """Return every queued event, waiting up to ``timeout`` for the first"""
+        with self._ready:
+            if not self._events and not self.closed:
+                self._ready.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+    def take_dropped(self):
+        """Number of events lost since the last call"""
+        with self._ready:
+            dropped, self.dropped = self.dropped, 0
+            return dropped
+
+    def close(self):
+        self.broker.unsubscribe(self)
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class LocalBroker:
+    """In-process broker; publishing never blocks on subscribers"""
+
+    def __init__(self, max_queue=1000):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._topics = {}
+        self._subscriptions = set()
+
+    def subscribe(self, topics, max_queue=None):
+        subscription = Subscription(self, topics, max_queue or self.max_queue)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            for topic in subscription.topics:
+                self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+            for topic in subscription.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._topics[topic]
+
+    def has_subscribers(self, topic):
+        return topic in self._topics
+
+    def subscriber_count(self):
+        return len(self._subscriptions)
+
+    def publish(self, topic, event):
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            subscription.put(topic, event)
+        return len(subscribers)
+
+class _BrokerProxy:
+    """Module level handle that forwards to the configured broker"""
+
+    def __init__(self):
+        self._broker = LocalBroker()
+
+    def init_app(self, app):
+        path = app.config.get('PUBSUB_BROKER')
+        if path:
+            module_name, _, class_name = path.partition(':')
+            broker_class = getattr(importlib.import_module(module_name), class_name)
+            self._broker = broker_class(app)
+        else:
+            self._broker = LocalBroker(app.config.get('PUBSUB_MAX_QUEUE', 1000))
+
+    def __getattr__(self, name):
+        return getattr(self._broker, name)
+
+broker = _BrokerProxy()
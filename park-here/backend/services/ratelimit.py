@@ -0,0 +1,253 @@
+"""Rate limiting and load shedding for expensive public endpoints.
+
+Each route class (``auth`` for login/register, ``search`` for the public
+location search) has token buckets per client IP, per user and for the
+route as a whole, plus a concurrency cap.
+
+- A request that would overdraw any bucket is rejected with 429 and a
+  ``Retry-After`` telling the client when a token will be available.
+- A request that finds every concurrency slot of its class busy waits up to
+  ``RATELIMIT_QUEUE_TIMEOUT`` seconds and is then shed with 503.
+
+Either way the rejection is decided before the view runs, so a flood of
+logins or searches cannot take the CPU or database time that booking
+traffic needs.
+
+For login and register the "user" is the email in the request body, which
+also slows credential stuffing spread over many IPs. Elsewhere it is the
+JWT identity, if any.
+
+Buckets live in process memory by default. With several workers,
+``RATELIMIT_STORE = 'shared'`` keeps them in a shared memory segment guarded
+by a file lock, so the limits hold for the whole host rather than per worker.
+The file lock needs ``fcntl``; where it is missing, as on Windows, the limiter
+falls back to in-memory buckets. Concurrency caps are always per worker, since they protect the worker's own
+threads.
+"""
+import hashlib
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from multiprocessing import resource_tracker, shared_memory
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+_UNITS = {'second': 1, 'minute': 60, 'hour': 3600}
+_RULE_PATTERN = re.compile(r'^\s*(\d+)\s*/\s*(second|minute|hour)\s*(?:burst\s+(\d+))?\s*$')
+
+# Bucket rules as "<count>/<unit> [burst <n>]" and concurrent requests per worker
+DEFAULT_LIMITS = {
+    'auth': {'ip': '20/minute burst 10', 'user': '10/minute burst 5', 'route': '50/second', 'concurrency': 8},
+    'search': {'ip': '10/second burst 20', 'user': '10/second burst 20', 'route': '500/second', 'concurrency': 16},
+}
+
+def parse_rule(rule):
+    """Return ``(tokens per second, capacity)`` for a rule string"""
+    match = _RULE_PATTERN.match(rule)
+    if not match:
+        raise ValueError(f'invalid rate limit rule: {rule!r}')
+    count, unit, burst = match.groups()
+    return int(count) / _UNITS[unit], int(burst or count)
+
+def _refill(tokens, updated, now, rate, capacity, cost):
+    """Apply one take to a bucket; returns ``(tokens, allowed, retry_after)``"""
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= cost:
+        return tokens - cost, True, 0.0
+    return tokens, False, (cost - tokens) / rate
+
+class MemoryStore:
+    """Buckets for this process only, least recently used dropped first"""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, rate, capacity, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens, allowed, retry_after = _refill(tokens, updated, now, rate, capacity, cost)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_entries:
+                # An evicted bucket comes back full, which only ever errs towards allowing
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+class SharedMemoryStore:
+    """Buckets in a shared memory hash table used by every worker on the host
+
+    Each slot holds a 64-bit key hash, the token count and the last update
+    time. Lookups probe a few slots from the key's home slot; when all of them
+    belong to other keys, the least recently updated one is taken over, which
+    at worst refills that key's bucket early. A file lock serialises updates
+    across processes.
+    """
+
+    SLOT = struct.Struct('<Qdd')
+    PROBES = 8
+
+    def __init__(self, name='park_here_ratelimit', slots=65536):
+        # POSIX only; imported here so the app still starts where it is missing
+        import fcntl
+        self._fcntl = fcntl
+        self.slots = slots
+        size = self.SLOT.size * slots
+        try:
+            self._memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._memory = shared_memory.SharedMemory(name=name)
+        # The segment outlives any single worker; keep Python from unlinking it at exit
+        resource_tracker.unregister(self._memory._name, 'shared_memory')
+        self._lock_file = open(os.path.join(tempfile.gettempdir(), f'{name}.lock'), 'a+')
+        self._thread_lock = threading.Lock()
+
+    def _hash(self, key):
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=8).digest()
+        # Zero marks an empty slot
+        return int.from_bytes(digest, 'little') or 1
+
+    def take(self, key, rate, capacity, cost=1):
+        key_hash = self._hash(key)
+        buffer = self._memory.buf
+        with self._thread_lock:
+            self._fcntl.flock(self._lock_file, self._fcntl.LOCK_EX)
+            try:
+                now = time.monotonic()
+                home = key_hash % self.slots
+                target, tokens, updated = None, capacity, now
+                oldest = None
+                for probe in range(self.PROBES):
+                    index = (home + probe) % self.slots
+                    stored_hash, stored_tokens, stored_updated = self.SLOT.unpack_from(buffer, index * self.SLOT.size)
+                    if stored_hash == key_hash:
+                        target, tokens, updated = index, stored_tokens, stored_updated
+                        break
+                    if stored_hash == 0:
+                        target = index
+                        break
+                    if oldest is None or stored_updated < oldest[1]:
+                        oldest = (index, stored_updated)
+                if target is None:
+                    target = oldest[0]
+
+                tokens, allowed, retry_after = _refill(tokens, updated, now, rate, capacity, cost)
+                self.SLOT.pack_into(buffer, target * self.SLOT.size, key_hash, tokens, now)
+            finally:
+                self._fcntl.flock(self._lock_file, self._fcntl.LOCK_UN)
+        return allowed, retry_after
+
+class RateLimiter:
+    """Token buckets and concurrency caps per route class"""
+
+    def __init__(self):
+        self.enabled = True
+        self.queue_timeout = 0.05
+        self.trust_proxy = False
+        self.store = MemoryStore()
+        self._rules = {}
+        self._slots = {}
+        self.rejected = 0
+        self.shed = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        self.queue_timeout = app.config.get('RATELIMIT_QUEUE_TIMEOUT', self.queue_timeout)
+        self.trust_proxy = app.config.get('RATELIMIT_TRUST_PROXY', False)
+        self.store = MemoryStore()
+        if app.config.get('RATELIMIT_STORE', 'memory') == 'shared':
+            try:
+                self.store = SharedMemoryStore(app.config.get('RATELIMIT_SHARED_NAME', 'park_here_ratelimit'))
+            except ImportError:
+                app.logger.warning('Shared rate limit store needs fcntl; using per-worker buckets')
+
+        self._rules = {}
+        self._slots = {}
+        for route_class, limits in app.config.get('RATE_LIMITS', DEFAULT_LIMITS).items():
+            self._rules[route_class] = {
+                scope: parse_rule(rule) for scope, rule in limits.items() if scope != 'concurrency'
+            }
+            if limits.get('concurrency'):
+                self._slots[route_class] = threading.BoundedSemaphore(limits['concurrency'])
+
+    def client_ip(self):
+        if self.trust_proxy and request.headers.get('X-Forwarded-For'):
+            return request.headers['X-Forwarded-For'].split(',')[0].strip()
+        return request.remote_addr or 'unknown'
+
+    def check(self, route_class, user):
+        """Take a token from each bucket that applies; returns seconds to wait, or 0"""
+        keys = {'ip': self.client_ip(), 'user': user, 'route': ''}
+        rules = self._rules.get(route_class, {})
+        # Narrowest first, stopping at the first empty bucket, so one noisy
+        # client cannot drain the shared route bucket for everyone else
+        for scope in ('ip', 'user', 'route'):
+            if scope not in rules or keys[scope] is None:
+                continue
+            rate, capacity = rules[scope]
+            allowed, retry_after = self.store.take((route_class, scope, keys[scope]), rate, capacity)
+            if not allowed:
+                return retry_after
+        return 0.0
+
+    def acquire(self, route_class):
+        slots = self._slots.get(route_class)
+        return slots is None or slots.acquire(timeout=self.queue_timeout)
+
+    def release(self, route_class):
+        slots = self._slots.get(route_class)
+        if slots is not None:
+            slots.release()
+
+rate_limiter = RateLimiter()
+
+def _json_email():
+    data = request.get_json(silent=True)
+    email = data.get('email') if isinstance(data, dict) else None
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+def _jwt_user():
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        # Invalid tokens are rejected by the view itself where it matters
+        return None
+
+def _rejection(message, status, retry_after):
+    response = jsonify({'error': message, 'retryable': True})
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response, status
+
+def limit(route_class, user_key=_jwt_user):
+    """Apply the buckets and concurrency cap of ``route_class`` to a view"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not rate_limiter.enabled:
+                return view(*args, **kwargs)
+
+            wait = rate_limiter.check(route_class, user_key())
+            if wait:
+                rate_limiter.rejected += 1
+                return _rejection('Too many requests, slow down', 429, wait)
+
+            if not rate_limiter.acquire(route_class):
+                rate_limiter.shed += 1
+                return _rejection('Server is busy, please retry shortly', 503, 1)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                rate_limiter.release(route_class)
+        return wrapper
+    return decorator
+
+def auth_limit(view):
+    return limit('auth', user_key=_json_email)(view)
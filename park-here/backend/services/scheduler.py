@@ -0,0 +1,257 @@
+"""Background scheduler for booking lifecycle transitions.
+
+Bookings move from ``upcoming`` to ``active`` at their start time and from
+``active`` to ``completed`` at their end time. Slot status follows occupancy:
+a slot is ``booked`` while one of its bookings is active and ``available``
+again once it completes.
+
+Due transitions sit in a min-heap keyed on their due time. Only the next
+``horizon`` of transitions is loaded from the database at once, so memory
+stays bounded however many bookings are pending, and the window is reloaded
+before it runs out. Committed booking changes push their next transition
+into the heap when it falls inside the loaded window. Entries are never
+removed; when one comes due, the transition is applied by a guarded
+``UPDATE ... WHERE status = ... AND time <= now`` for the whole batch, so
+cancelled, extended or already handled bookings simply drop out. The same
+guard makes several workers running their own scheduler harmless.
+
+On startup the whole window, including everything that fell due while the
+app was down, is loaded and worked off in batches, and slots left booked
+without an active booking are released.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_, select, update
+from models import Booking, Slot, db
+from services import commit_hooks
+from services.commit_hooks import on_commit
+from services.slots import bulk_update_slots
+
+logger = logging.getLogger(__name__)
+
+ACTIVATE = 'activate'
+COMPLETE = 'complete'
+
+class BookingScheduler:
+    """Min-heap of due booking transitions worked off by a daemon thread"""
+
+    def __init__(self, horizon_seconds=1800, batch_size=500, poll_seconds=1.0):
+        self.horizon = timedelta(seconds=horizon_seconds)
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._heap = []
+        self._sequence = itertools.count()
+        self._loaded_until = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._app = None
+
+    def init_app(self, app):
+        self.stop()
+        self.horizon = timedelta(seconds=app.config.get('SCHEDULER_HORIZON_SECONDS', self.horizon.total_seconds()))
+        self.batch_size = app.config.get('SCHEDULER_BATCH_SIZE', self.batch_size)
+        self.poll_seconds = app.config.get('SCHEDULER_POLL_SECONDS', self.poll_seconds)
+        self._app = app
+
+        with self._lock:
+            self._heap = []
+            self._loaded_until = None
+
+        if app.config.get('SCHEDULER_ENABLED', True):
+            self.start()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='booking-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, booking_id, kind, due):
+        """Queue a transition if it falls inside the loaded window"""
+        with self._lock:
+            if self._loaded_until is None or due > self._loaded_until:
+                # The next window load picks it up
+                return
+            heapq.heappush(self._heap, (due, next(self._sequence), kind, booking_id))
+            is_next = self._heap[0][3] == booking_id
+        if is_next:
+            self._wakeup.set()
+
+    def load_window(self, now=None):
+        """Load every pending transition due up to ``now + horizon``"""
+        until = (now or datetime.utcnow()) + self.horizon
+        with self._lock:
+            since = self._loaded_until
+            # Move the boundary first: bookings committed from here on are
+            # pushed by the commit hook, the query covers everything before
+            self._loaded_until = until
+
+        loaded = 0
+        try:
+            for kind, status, column in ((ACTIVATE, 'upcoming', Booking.start_time),
+                                         (COMPLETE, 'active', Booking.end_time)):
+                query = select(Booking.id, column).where(Booking.status == status, column <= until)
+                if since is not None:
+                    query = query.where(column > since)
+                rows = db.session.execute(query).all()
+                with self._lock:
+                    for booking_id, due in rows:
+                        self._heap.append((due, next(self._sequence), kind, booking_id))
+                    heapq.heapify(self._heap)
+                loaded += len(rows)
+        except Exception:
+            # Load this window again next time; duplicates are harmless
+            with self._lock:
+                self._loaded_until = since
+            raise
+        finally:
+            db.session.rollback()
+        return loaded
+
+    def _pop_due(self, now):
+        due = {ACTIVATE: [], COMPLETE: []}
+        with self._lock:
+            count = 0
+            while self._heap and self._heap[0][0] <= now and count < self.batch_size:
+                _, _, kind, booking_id = heapq.heappop(self._heap)
+                due[kind].append(booking_id)
+                count += 1
+        return due
+
+    def run_due(self, now=None):
+        """Apply every transition due at ``now`` in batches; returns how many changed"""
+        now = now or datetime.utcnow()
+        applied = 0
+        while True:
+            due = self._pop_due(now)
+            if not due[ACTIVATE] and not due[COMPLETE]:
+                return applied
+            try:
+                applied += self._apply(due, now)
+            except Exception:
+                db.session.rollback()
+                logger.exception('Booking transitions failed, retrying on the next tick')
+                # Put the batch back so nothing is lost
+                with self._lock:
+                    for kind, booking_ids in due.items():
+                        for booking_id in booking_ids:
+                            heapq.heappush(self._heap, (now, next(self._sequence), kind, booking_id))
+                return applied
+
+    def _apply(self, due, now):
+        """Run one batch of transitions in a single transaction"""
+        completed = self._transition(due[COMPLETE], and_(Booking.status == 'active', Booking.end_time <= now),
+                                     'completed', now)
+        activated = self._transition(due[ACTIVATE], and_(Booking.status == 'upcoming', Booking.start_time <= now),
+                                     'active', now)
+
+        # Completions run first so back-to-back bookings hand the slot over
+        active_slots = {row.slot_id for row in activated}
+        released = {row.slot_id for row in completed} - active_slots
+        if released:
+            still_active = select(Booking.slot_id).where(Booking.status == 'active', Booking.slot_id.in_(released))
+            bulk_update_slots(
+                [Slot.id.in_(released), Slot.status == 'booked', Slot.id.not_in(still_active)],
+                {'status': 'available'}
+            )
+        if active_slots:
+            bulk_update_slots([Slot.id.in_(active_slots), Slot.status == 'available'], {'status': 'booked'})
+
+        db.session.commit()
+        return len(completed) + len(activated)
+
+    def _transition(self, booking_ids, guard, status, now):
+        if not booking_ids:
+            return []
+        rows = db.session.execute(
+            update(Booking)
+            .where(Booking.id.in_(booking_ids), guard)
+            .values(status=status, version=Booking.version + 1, updated_at=now)
+            .returning(Booking.id, Booking.user_id, Booking.slot_id, Booking.start_time,
+                       Booking.end_time, Booking.status, Booking.version)
+            .execution_options(synchronize_session=False)
+        ).all()
+
+        # Core updates bypass the flush, so tell the commit listeners directly
+        previous_status = 'active' if status == 'completed' else 'upcoming'
+        commit_hooks.record(db.session, Booking, [
+            commit_hooks.Change('update', row._asdict(), {'status': previous_status}) for row in rows
+        ])
+        return rows
+
+    def release_idle_slots(self):
+        """Free slots marked booked without an active booking
+
+        Slots used to stay booked from the moment a booking was made, so
+        databases written before the scheduler existed carry leaked ones.
+        """
+        active = select(Booking.slot_id).where(Booking.status == 'active')
+        summary = bulk_update_slots([Slot.status == 'booked', Slot.id.not_in(active)], {'status': 'available'})
+        db.session.commit()
+        return summary['updated']
+
+    def _next_wait(self):
+        with self._lock:
+            if not self._heap:
+                return self.poll_seconds
+            delay = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+        return min(max(delay, 0), self.poll_seconds)
+
+    def _run(self):
+        with self._app.app_context():
+            try:
+                logger.info('Recovered %d pending booking transitions', self.load_window())
+                released = self.release_idle_slots()
+                if released:
+                    logger.info('Released %d slots without an active booking', released)
+            except Exception:
+                logger.exception('Loading booking transitions failed')
+            finally:
+                db.session.remove()
+
+        while not self._stop.is_set():
+            self._wakeup.wait(self._next_wait())
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+
+            with self._app.app_context():
+                try:
+                    now = datetime.utcnow()
+                    # Reload well before the window runs out
+                    if self._loaded_until is None or self._loaded_until - now < self.horizon / 2:
+                        self.load_window(now)
+                    self.run_due(now)
+                except Exception:
+                    logger.exception('Booking scheduler tick failed')
+                    time.sleep(self.poll_seconds)
+                finally:
+                    db.session.remove()
+
+scheduler = BookingScheduler()
+
+@on_commit(Booking, ['id', 'start_time', 'end_time', 'status'])
+def _schedule_bookings(changes):
+    for change in changes:
+        values = change.values
+        if change.op == 'delete':
+            continue
+        if values['status'] == 'upcoming':
+            scheduler.schedule(values['id'], ACTIVATE, values['start_time'])
+        elif values['status'] == 'active' and values['end_time'] is not None:
+            scheduler.schedule(values['id'], COMPLETE, values['end_time'])
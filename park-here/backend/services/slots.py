@@ -0,0 +1,305 @@
+"""Bulk slot provisioning and updates.
+
+Slot definitions arrive either as explicit rows or as compact range specs
+such as ``L2-001..L2-400, type=car, price=50``. Each row is validated, and
+duplicates within the batch and against the location's existing slots are
+found in one set-based pass. The valid rows are then inserted with a single
+executemany in one transaction. Bulk updates select slots by filter or id
+list and change status and price with one UPDATE statement. In both cases
+counter deltas and commit hook changes are recorded once for the whole batch
+rather than per row.
+"""
+import re
+import uuid
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import func, insert, or_, select, update
+from models import Booking, ParkingLocation, Slot, db
+from services import commit_hooks, counters
+
+MAX_BULK_SLOTS = 5000
+# Ids per UPDATE, well under SQLite's bound parameter limit
+UPDATE_CHUNK_SIZE = 500
+SLOT_NUMBER_LENGTH = Slot.__table__.c.slot_number.type.length
+
+_RANGE = re.compile(r'^(?P<prefix>.*?)(?P<start>\d+)\.\.(?P<end_prefix>.*?)(?P<end>\d+)$')
+_SPEC_KEYS = {'type': 'type', 'price': 'price_per_hour', 'price_per_hour': 'price_per_hour'}
+
+def expand_range(text):
+    """Expand ``L2-001..L2-400`` into slot numbers, keeping the zero padding"""
+    text = text.strip()
+    match = _RANGE.match(text)
+    if not match:
+        return [text]
+
+    prefix, end_prefix = match.group('prefix'), match.group('end_prefix')
+    if end_prefix and end_prefix != prefix:
+        raise ValueError(f'range {text!r} must use the same prefix on both ends')
+
+    start, end = int(match.group('start')), int(match.group('end'))
+    if start > end:
+        raise ValueError(f'range {text!r} runs backwards')
+    if end - start + 1 > MAX_BULK_SLOTS:
+        raise ValueError(f'range {text!r} is larger than {MAX_BULK_SLOTS} slots')
+
+    width = len(match.group('start'))
+    return [f'{prefix}{number:0{width}d}' for number in range(start, end + 1)]
+
+def parse_spec(spec):
+    """Turn a range spec string or dict into ``(slot_numbers, defaults)``"""
+    if isinstance(spec, str):
+        parts = [part.strip() for part in spec.split(',') if part.strip()]
+        if not parts:
+            raise ValueError('empty range spec')
+        numbers, defaults = parts[0], {}
+        for part in parts[1:]:
+            key, sep, value = part.partition('=')
+            key = key.strip().lower()
+            if not sep or key not in _SPEC_KEYS:
+                raise ValueError(f'unknown option {part!r} in range spec')
+            defaults[_SPEC_KEYS[key]] = value.strip()
+    elif isinstance(spec, dict):
+        numbers = spec.get('range')
+        if not isinstance(numbers, str):
+            raise ValueError('range is required')
+        defaults = {field: spec[field] for field in ('type', 'price_per_hour') if field in spec}
+    else:
+        raise ValueError('range spec must be a string or an object')
+
+    return expand_range(numbers), defaults
+
+def _validate(row):
+    """Return the insert values for one slot definition or raise ValueError"""
+    if not isinstance(row, dict):
+        raise ValueError('slot definition must be an object')
+
+    for field in ('slot_number', 'type', 'price_per_hour'):
+        if field not in row or row[field] in (None, ''):
+            raise ValueError(f'{field} is required')
+
+    slot_number = str(row['slot_number']).strip()
+    if len(slot_number) > SLOT_NUMBER_LENGTH:
+        raise ValueError(f'slot_number must be at most {SLOT_NUMBER_LENGTH} characters')
+
+    try:
+        price = float(row['price_per_hour'])
+    except (TypeError, ValueError):
+        raise ValueError('price_per_hour must be a number')
+    if not price >= 0:
+        raise ValueError('price_per_hour must not be negative')
+
+    return {'slot_number': slot_number, 'type': str(row['type']).strip(), 'price_per_hour': price}
+
+def expand_definitions(data):
+    """Flatten ``slots`` and ``ranges`` from a request body into definitions
+
+    Returns ``(definitions, errors)``. Each definition is a ``(source, row)``
+    pair where ``source`` names the ``slots`` index or ``ranges`` index the row
+    came from, so per-row failures can point back at the request.
+    """
+    definitions, errors = [], []
+    for index, row in enumerate(data.get('slots') or []):
+        definitions.append(({'index': index}, row))
+
+    for index, spec in enumerate(data.get('ranges') or []):
+        try:
+            numbers, defaults = parse_spec(spec)
+        except ValueError as e:
+            errors.append({'range': index, 'error': str(e)})
+            continue
+        definitions.extend(({'range': index}, dict(defaults, slot_number=number)) for number in numbers)
+
+    if len(definitions) > MAX_BULK_SLOTS:
+        raise ValueError(f'at most {MAX_BULK_SLOTS} slots can be provisioned per request')
+    return definitions, errors
+
+def bulk_create_slots(location, definitions):
+    """Insert the valid ``(source, row)`` definitions for ``location`` in the current transaction
+
+    Returns ``(created, failed)``: the inserted rows and, in request order,
+    ``source`` plus ``slot_number`` and ``error`` for every rejected row.
+    """
+    failed = []
+    candidates = []
+    for position, (source, row) in enumerate(definitions):
+        try:
+            candidates.append((position, source, _validate(row)))
+        except ValueError as e:
+            slot_number = row.get('slot_number') if isinstance(row, dict) else None
+            failed.append((position, dict(source, slot_number=slot_number, error=str(e))))
+
+    # One query for the numbers already taken at this location
+    existing = {
+        number for (number,) in
+        db.session.query(Slot.slot_number).filter(Slot.parking_location_id == location.id)
+    }
+
+    now = datetime.utcnow()
+    seen = set()
+    created = []
+    for position, source, values in candidates:
+        number = values['slot_number']
+        if number in existing:
+            failed.append((position, dict(source, slot_number=number, error='Slot number already exists in this location')))
+            continue
+        if number in seen:
+            failed.append((position, dict(source, slot_number=number, error='Duplicate slot number in request')))
+            continue
+        seen.add(number)
+        values.update(
+            id=str(uuid.uuid4()),
+            parking_location_id=location.id,
+            status='available',
+            version=1,
+            created_at=now,
+            updated_at=now
+        )
+        created.append(values)
+
+    if created:
+        db.session.execute(insert(Slot), created)
+
+        # The flush-time counter and commit listeners never see Core inserts
+        deltas = counters.new_deltas()
+        for values in created:
+            counters.add_slot_delta(deltas, (location.id, values['type'], values['status']), 1)
+        counters.apply_deltas(db.session, deltas)
+        commit_hooks.record(db.session, Slot, [
+            commit_hooks.Change('insert', dict(values), {}) for values in created
+        ])
+
+    failed.sort(key=lambda failure: failure[0])
+    return created, [failure for _, failure in failed]
+
+SETTABLE_STATUSES = ('available', 'maintenance')
+
+def _slot_number_range(text):
+    """SQL criteria matching the slot numbers of ``L2-001..L2-400``"""
+    numbers = expand_range(text)
+    first, last = numbers[0], numbers[-1]
+    if first == last:
+        return [Slot.slot_number == first]
+    # Same prefix and width on both ends, so string order is numeric order
+    return [Slot.slot_number.between(first, last), func.length(Slot.slot_number) == len(first)]
+
+def slot_criteria(data):
+    """Build WHERE criteria from ``slot_ids`` and/or ``filter`` in a request body"""
+    criteria = []
+    slot_ids = data.get('slot_ids')
+    if slot_ids is not None:
+        if not isinstance(slot_ids, list) or not slot_ids:
+            raise ValueError('slot_ids must be a non-empty list')
+        if len(slot_ids) > MAX_BULK_SLOTS:
+            raise ValueError(f'at most {MAX_BULK_SLOTS} slot_ids can be updated per request')
+        criteria.append(Slot.id.in_([str(slot_id) for slot_id in slot_ids]))
+
+    spec = data.get('filter') or {}
+    if not isinstance(spec, dict):
+        raise ValueError('filter must be an object')
+    if spec.get('location_id'):
+        criteria.append(Slot.parking_location_id == spec['location_id'])
+    if spec.get('city'):
+        criteria.append(Slot.parking_location_id.in_(
+            select(ParkingLocation.id).where(ParkingLocation.city.ilike(spec['city']))
+        ))
+    if spec.get('type'):
+        criteria.append(Slot.type == spec['type'])
+    if spec.get('status'):
+        criteria.append(Slot.status == spec['status'])
+    if spec.get('slot_numbers'):
+        criteria.extend(_slot_number_range(spec['slot_numbers']))
+
+    # Never touch every slot in the system by accident
+    if slot_ids is None and not (spec.get('location_id') or spec.get('city')):
+        raise ValueError('slot_ids or a filter with location_id or city is required')
+    return criteria
+
+def slot_changes(data):
+    """Validate the ``set`` block of a bulk update"""
+    changes = data.get('set')
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError('set must name status and/or price_per_hour')
+    unknown = set(changes) - {'status', 'price_per_hour'}
+    if unknown:
+        raise ValueError(f'cannot set {", ".join(sorted(unknown))}')
+
+    values = {}
+    if 'status' in changes:
+        if changes['status'] not in SETTABLE_STATUSES:
+            raise ValueError(f'status must be one of {", ".join(SETTABLE_STATUSES)}')
+        values['status'] = changes['status']
+    if 'price_per_hour' in changes:
+        try:
+            values['price_per_hour'] = float(changes['price_per_hour'])
+        except (TypeError, ValueError):
+            raise ValueError('price_per_hour must be a number')
+        if not values['price_per_hour'] >= 0:
+            raise ValueError('price_per_hour must not be negative')
+    return values
+
+def bulk_update_slots(criteria, values, dry_run=False):
+    """Apply ``values`` to every slot matching ``criteria`` with one UPDATE
+
+    Slots that already have the requested values are left alone, and so are
+    slots with an active booking when their status would change away from
+    booked; those are listed under ``skipped_active_bookings``. The matching
+    rows are read once, locked where the backend supports it, to work out
+    counter deltas and commit hook changes, and the UPDATE touches exactly
+    those rows, so a slot that starts matching after the read is never
+    changed without its counters. Returns a summary of matched and changed
+    slots per location and status.
+    """
+    # Only rows that actually change are updated and get a new version; IS
+    # DISTINCT FROM also catches slots whose status is still NULL
+    differs = or_(*[getattr(Slot, column).is_distinct_from(value) for column, value in values.items()])
+    columns = (Slot.id, Slot.parking_location_id, Slot.slot_number, Slot.type,
+               Slot.status, Slot.price_per_hour, Slot.version)
+
+    matched = db.session.query(func.count(Slot.id)).filter(*criteria).scalar()
+
+    # Freeing or closing a slot under an active booking would strand the driver
+    skipped = []
+    if 'status' in values and values['status'] != 'booked':
+        active = select(Booking.slot_id).where(Booking.status == 'active')
+        skipped = [row.id for row in db.session.query(Slot.id).filter(*criteria, differs, Slot.id.in_(active))]
+        criteria = list(criteria) + [Slot.id.not_in(active)]
+
+    rows = db.session.query(*columns).filter(*criteria, differs).with_for_update().all()
+
+    locations = Counter(row.parking_location_id for row in rows)
+    summary = {
+        'matched': matched,
+        'updated': len(rows),
+        'unchanged': matched - len(rows) - len(skipped),
+        'skipped_active_bookings': skipped,
+        'locations': dict(locations),
+        'previous_status': dict(Counter(row.status or 'available' for row in rows)),
+        'dry_run': dry_run
+    }
+    if dry_run or not rows:
+        return summary
+
+    ids = [row.id for row in rows]
+    now = datetime.utcnow()
+    for offset in range(0, len(ids), UPDATE_CHUNK_SIZE):
+        db.session.execute(
+            update(Slot)
+            .where(Slot.id.in_(ids[offset:offset + UPDATE_CHUNK_SIZE]), differs)
+            .values(version=Slot.version + 1, updated_at=now, **values)
+            .execution_options(synchronize_session=False)
+        )
+
+    deltas = counters.new_deltas()
+    changes = []
+    for row in rows:
+        before = row._asdict()
+        after = dict(before, version=row.version + 1, **values)
+        if 'status' in values:
+            counters.add_slot_delta(deltas, (row.parking_location_id, row.type, row.status or 'available'), -1)
+            counters.add_slot_delta(deltas, (row.parking_location_id, row.type, values['status']), 1)
+        previous = {column: before[column] for column in after if after[column] != before[column]}
+        changes.append(commit_hooks.Change('update', after, previous))
+
+    counters.apply_deltas(db.session, deltas)
+    commit_hooks.record(db.session, Slot, changes)
+    return summary
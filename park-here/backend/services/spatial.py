@@ -0,0 +1,202 @@
+"""In-memory grid index over active parking locations.
+
+Locations are bucketed into fixed-size latitude/longitude cells. A nearest
+neighbour query walks rings of cells outwards from the query point and stops
+as soon as no unvisited cell can hold a closer location, so lookups only touch
+the cells around the point instead of scanning the whole table.
+"""
+import heapq
+import math
+import threading
+from models import ParkingLocation, db
+from services.commit_hooks import on_commit
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class SpatialIndex:
+    """Grid-cell index mapping location ids to coordinates"""
+
+    def __init__(self, cell_degrees=0.05):
+        self._lock = threading.RLock()
+        self._configure(cell_degrees)
+
+    def _configure(self, cell_degrees):
+        self.cell_degrees = cell_degrees
+        self._lng_cells = max(1, int(round(360 / cell_degrees)))
+        # Row of a location at exactly 90 degrees north
+        self._max_row = int(math.floor(180 / cell_degrees))
+        self._cells = {}
+        self._points = {}
+
+    def init_app(self, app):
+        self._configure(app.config.get('SPATIAL_CELL_DEGREES', self.cell_degrees))
+        with app.app_context():
+            self.rebuild()
+
+    def rebuild(self):
+        """Reload every active location from the database"""
+        rows = db.session.query(
+            ParkingLocation.id, ParkingLocation.latitude, ParkingLocation.longitude
+        ).filter(ParkingLocation.is_active.is_(True)).all()
+
+        with self._lock:
+            self._cells = {}
+            self._points = {}
+            for location_id, lat, lng in rows:
+                self._insert(location_id, lat, lng)
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat, lng):
+        row = int(math.floor((lat + 90) / self.cell_degrees))
+        col = int(math.floor((lng + 180) / self.cell_degrees)) % self._lng_cells
+        return row, col
+
+    def _insert(self, location_id, lat, lng):
+        cell = self._cell(lat, lng)
+        self._cells.setdefault(cell, {})[location_id] = (lat, lng)
+        self._points[location_id] = cell
+
+    def _remove(self, location_id):
+        cell = self._points.pop(location_id, None)
+        if cell is None:
+            return
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(location_id, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def upsert(self, location_id, lat, lng):
+        with self._lock:
+            self._remove(location_id)
+            self._insert(location_id, lat, lng)
+
+    def remove(self, location_id):
+        with self._lock:
+            self._remove(location_id)
+
+    def _ring(self, row, col, radius):
+        """Cells at Chebyshev distance ``radius`` from (row, col)"""
+        if radius == 0:
+            return [(row, col)]
+
+        cols = range(col - radius, col + radius + 1)
+        cells = [(row - radius, c) for c in cols] + [(row + radius, c) for c in cols]
+        for r in range(row - radius + 1, row + radius):
+            cells.append((r, col - radius))
+            cells.append((r, col + radius))
+
+        # Wrap around the antimeridian, drop duplicates on very wide rings and
+        # rows past the poles, which hold no cells
+        return {(r, c % self._lng_cells) for r, c in cells if 0 <= r <= self._max_row}
+
+    def _ring_lower_bound_km(self, lat, radius):
+        """Smallest possible distance to any point in ring ``radius`` or beyond"""
+        if radius <= 1:
+            return 0.0
+
+        offset = (radius - 1) * self.cell_degrees
+        lat_bound = offset * KM_PER_DEGREE
+
+        # Longitude cells shrink towards the poles, so bound with the widest
+        # latitude the ring can reach
+        max_lat = math.radians(min(90.0, abs(lat) + (radius + 1) * self.cell_degrees))
+        half_lng = math.radians(min(180.0, offset)) / 2
+        lng_bound = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.cos(max_lat) * math.sin(half_lng)))
+
+        return min(lat_bound, lng_bound)
+
+    def _band(self, row, col, lat, radius_km, rows):
+        """Cells within ``rows`` rows of (row, col) that can hold a point within ``radius_km``
+
+        hav(d) >= cos(lat1) cos(lat2) hav(dlng), so the longitude a match can
+        differ by is bounded with the latitude nearest the pole in the band.
+        Bands touching a pole span every column.
+        """
+        first, last = max(0, row - rows), min(self._max_row, row + rows)
+        max_lat = math.radians(min(90.0, abs(lat) + (rows + 1) * self.cell_degrees))
+        reach = math.sin(radius_km / EARTH_RADIUS_KM / 2) / max(math.cos(max_lat), 1e-12)
+        span = self._lng_cells
+        if reach < 1.0:
+            span = int(math.ceil(math.degrees(2 * math.asin(reach)) / self.cell_degrees)) + 1
+
+        if 2 * span + 1 >= self._lng_cells:
+            # Sparse indexes are cheaper to filter than a full band of columns
+            if (last - first + 1) * self._lng_cells > len(self._cells):
+                return [cell for cell in self._cells if first <= cell[0] <= last]
+            cols = range(self._lng_cells)
+        else:
+            cols = [c % self._lng_cells for c in range(col - span, col + span + 1)]
+        return [(r, c) for r in range(first, last + 1) for c in cols]
+
+    def nearest(self, lat, lng, radius_km):
+        """Yield ``(distance_km, location_id)`` within ``radius_km``, nearest first
+
+        Results are produced lazily, so callers that filter rows afterwards can
+        keep pulling until they have enough matches.
+        """
+        row, col = self._cell(lat, lng)
+        # Anything within radius_km is at most this many rows away. Near the
+        # poles longitude cells shrink to nothing and the ring bound below
+        # stays near zero, so the walk stops here and the rest of the band is
+        # scanned instead.
+        max_rings = int(math.ceil(radius_km / KM_PER_DEGREE / self.cell_degrees)) + 1
+
+        candidates = []
+        visited = set()
+        exhausted = False
+        for radius in range(max_rings + 1):
+            with self._lock:
+                for cell in self._ring(row, col, radius):
+                    # Very wide rings wrap onto cells an earlier ring covered
+                    if cell in visited:
+                        continue
+                    visited.add(cell)
+                    for location_id, (p_lat, p_lng) in self._cells.get(cell, {}).items():
+                        distance = haversine_km(lat, lng, p_lat, p_lng)
+                        if distance <= radius_km:
+                            heapq.heappush(candidates, (distance, location_id))
+
+            # Anything closer than the next ring's bound can no longer be beaten
+            bound = self._ring_lower_bound_km(lat, radius + 1)
+            while candidates and candidates[0][0] <= bound:
+                yield heapq.heappop(candidates)
+
+            if bound > radius_km:
+                exhausted = True
+                break
+
+        if not exhausted:
+            # Cells in the band that no ring reached, such as those across a pole
+            with self._lock:
+                for cell in self._band(row, col, lat, radius_km, max_rings):
+                    if cell in visited:
+                        continue
+                    for location_id, (p_lat, p_lng) in self._cells.get(cell, {}).items():
+                        distance = haversine_km(lat, lng, p_lat, p_lng)
+                        if distance <= radius_km:
+                            heapq.heappush(candidates, (distance, location_id))
+
+        while candidates:
+            yield heapq.heappop(candidates)
+
+spatial_index = SpatialIndex()
+
+@on_commit(ParkingLocation, ['id', 'latitude', 'longitude', 'is_active'])
+def _sync_locations(changes):
+    for change in changes:
+        values = change.values
+        if change.op == 'delete' or not values['is_active']:
+            spatial_index.remove(values['id'])
+        else:
+            spatial_index.upsert(values['id'], values['latitude'], values['longitude'])
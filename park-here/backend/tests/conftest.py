@@ -0,0 +1,23 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def app(tmp_path):
+    from app import create_app
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'SCHEDULER_ENABLED': False,
+        'PAYMENT_WORKERS': 0,
+        'PASSWORD_HASH_WORKERS': 0,
+        'RATELIMIT_ENABLED': False,
+        'PROFILING_ENABLED': False
+    })
+    yield app
+    from extensions import db
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
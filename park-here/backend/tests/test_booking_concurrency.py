@@ -0,0 +1,109 @@
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+from models import Booking, ParkingLocation, Slot, User, db
+
+WORKERS = 8
+WINDOWS = 3
+
+def _seed(app):
+    with app.app_context():
+        user = User(name='Stress', email='stress@example.com', phone='9000000000', password_hash='x')
+        location = ParkingLocation(name='Stress Lot', address='Nowhere', city='Test',
+                                   latitude=0.0, longitude=0.0, total_slots=1, available_slots=1)
+        slot = Slot(parking_location=location, slot_number='S-001', type='car',
+                    status='available', price_per_hour=10)
+        db.session.add_all([user, location, slot])
+        db.session.commit()
+        return slot.id, create_access_token(identity=user.id)
+
+def _windows(count):
+    base = (datetime.utcnow() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+    return [(base + timedelta(hours=2 * i), base + timedelta(hours=2 * i + 1)) for i in range(count)]
+
+def _hammer(app, headers, slot_id, slots_windows, barrier, results, lock):
+    """Book every window at once with the other workers, retrying only retryable 409s"""
+    client = app.test_client()
+    outcome = []
+    barrier.wait()
+    for index, (start, end) in enumerate(slots_windows):
+        for _ in range(20):
+            response = client.post('/api/bookings', headers=headers, json={
+                'slot_id': slot_id,
+                'vehicle_number': 'STRESS',
+                'start_time': start.isoformat(),
+                'end_time': end.isoformat()
+            })
+            outcome.append((index, response.status_code, response.get_json()))
+            if response.status_code != 409 or not response.get_json().get('retryable'):
+                break
+    with lock:
+        results.extend(outcome)
+
+def test_exactly_one_booking_wins_per_window(app):
+    slot_id, token = _seed(app)
+    headers = {'Authorization': f'Bearer {token}'}
+    slots_windows = _windows(WINDOWS)
+
+    barrier = threading.Barrier(WORKERS)
+    results, lock = [], threading.Lock()
+    threads = [threading.Thread(target=_hammer, args=(app, headers, slot_id, slots_windows, barrier, results, lock))
+               for _ in range(WORKERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        stored = Counter()
+        for booking in Booking.query.filter_by(slot_id=slot_id, status='upcoming'):
+            stored[slots_windows.index((booking.start_time, booking.end_time))] += 1
+
+    for index in range(WINDOWS):
+        responses = [(status, body) for window, status, body in results if window == index]
+        statuses = Counter(status for status, _ in responses)
+        assert statuses[201] == 1
+        assert stored[index] == 1
+        # Losers either collide on the slot version and are told to retry, or
+        # find the window already claimed
+        assert set(statuses) <= {201, 409, 400}
+        assert all(body.get('retryable') is True for status, body in responses if status == 409)
+        assert all('already booked' in body['error'] for status, body in responses if status == 400)
+        assert statuses[201] + statuses[400] == WORKERS
+
+def test_concurrent_writes_to_one_slot_are_retryable_conflicts(app):
+    slot_id, token = _seed(app)
+    headers = {'Authorization': f'Bearer {token}'}
+    # A window each, so only the slot version stands between the writers
+    slots_windows = _windows(WORKERS)
+
+    barrier = threading.Barrier(WORKERS)
+    results, lock = [], threading.Lock()
+
+    def book_once(window):
+        client = app.test_client()
+        start, end = window
+        barrier.wait()
+        response = client.post('/api/bookings', headers=headers, json={
+            'slot_id': slot_id,
+            'vehicle_number': 'STRESS',
+            'start_time': start.isoformat(),
+            'end_time': end.isoformat()
+        })
+        with lock:
+            results.append((response.status_code, response.get_json()))
+
+    threads = [threading.Thread(target=book_once, args=(window,)) for window in slots_windows]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        stored = Booking.query.filter_by(slot_id=slot_id).count()
+
+    statuses = Counter(status for status, _ in results)
+    assert set(statuses) <= {201, 409}
+    assert all(body.get('retryable') is True for status, body in results if status == 409)
+    assert stored == statuses[201] >= 1
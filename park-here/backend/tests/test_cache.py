@@ -0,0 +1,30 @@
+from models import ParkingLocation, db
+from services.cache import response_cache
+
+def _names(response):
+    return sorted(location['name'] for location in response.get_json()['locations'])
+
+def test_cache_key_keeps_parameter_names_and_values_as_sent(app):
+    with app.app_context():
+        db.session.add_all([
+            ParkingLocation(name='Bandra', address='1 Hill Rd', city='Mumbai', latitude=19.06, longitude=72.83),
+            ParkingLocation(name='Kothrud', address='2 Paud Rd', city='Pune', latitude=18.50, longitude=73.81)
+        ])
+        db.session.commit()
+    client = app.test_client()
+
+    # The views ignore CITY, so this is the unfiltered list
+    assert _names(client.get('/api/parking/locations?CITY=Mumbai')) == ['Bandra', 'Kothrud']
+    assert _names(client.get('/api/parking/locations?city=Mumbai')) == ['Bandra']
+    # Nor do they strip values
+    assert _names(client.get('/api/parking/locations?city=%20Mumbai%20')) == []
+    assert _names(client.get('/api/parking/locations?city=&city=Pune')) == ['Bandra', 'Kothrud']
+
+def test_cache_key_shares_equivalent_urls(app):
+    client = app.test_client()
+    client.get('/api/parking/locations?limit=5&available_only=true')
+    hits = response_cache.hits
+
+    client.get('/api/parking/locations?available_only=true&limit=5&city=')
+
+    assert response_cache.hits == hits + 1
@@ -0,0 +1,28 @@
+from models import ParkingLocation, Slot, db
+from services.live import location_topic
+from services.pubsub import broker
+
+def _location(name):
+    location = ParkingLocation(name=name, address='1 Main St', city='Pune', latitude=18.52, longitude=73.85)
+    db.session.add(location)
+    db.session.flush()
+    return location
+
+def test_slot_moved_to_unwatched_location_reaches_old_watchers(app):
+    with app.app_context():
+        watched, unwatched = _location('Watched'), _location('Unwatched')
+        slot = Slot(parking_location_id=watched.id, slot_number='A1', type='car', price_per_hour=20.0)
+        db.session.add(slot)
+        db.session.commit()
+
+        slot = db.session.get(Slot, slot.id)
+        with broker.subscribe([location_topic(watched.id)]) as subscription:
+            slot.parking_location_id = unwatched.id
+            db.session.commit()
+            events = [event for _, event in subscription.get(timeout=1)]
+        slot_id, watched_id = slot.id, watched.id
+
+    assert [event['type'] for event in events] == ['slots', 'availability']
+    assert events[0]['slots'] == [{'id': slot_id, 'deleted': True}]
+    assert events[1]['location_id'] == watched_id
+    assert events[1]['total_slots'] == 0
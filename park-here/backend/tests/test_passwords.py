@@ -0,0 +1,21 @@
+from werkzeug.security import generate_password_hash
+from services.passwords import PasswordHasher, hash_prefix
+
+def test_hash_prefix_expands_shorthand():
+    assert hash_prefix('scrypt') == 'scrypt:32768:8:1'
+
+def test_shorthand_method_does_not_rehash():
+    hasher = PasswordHasher(workers=0, method='scrypt')
+    password_hash = hasher.hash('secret')
+
+    assert hasher.verify(password_hash, 'secret') == (True, None)
+    assert hasher.verify(password_hash, 'wrong') == (False, None)
+
+def test_stale_parameters_rehash():
+    hasher = PasswordHasher(workers=0, method='scrypt')
+    old_hash = generate_password_hash('secret', method='pbkdf2:sha256:1000')
+
+    valid, new_hash = hasher.verify(old_hash, 'secret')
+
+    assert valid
+    assert new_hash.startswith('scrypt:32768:8:1$')
@@ -0,0 +1,36 @@
+import time
+from sqlalchemy import update
+from models import ParkingLocation, Slot, db
+from services.pricing import pricing
+
+def _lot_with_slot():
+    location = ParkingLocation(name='Lot', address='1 Main St', city='Pune', latitude=18.52, longitude=73.85)
+    db.session.add(location)
+    db.session.flush()
+    slot = Slot(parking_location_id=location.id, slot_number='A1', type='car', price_per_hour=20.0)
+    db.session.add(slot)
+    db.session.commit()
+    return location.id, slot.id
+
+def test_price_table_includes_slots_with_null_status(app):
+    with app.app_context():
+        location_id, slot_id = _lot_with_slot()
+        db.session.execute(update(Slot).where(Slot.id == slot_id).values(status=None))
+        db.session.commit()
+        pricing.clear()
+
+        assert pricing.price_table(location_id).ids == [slot_id]
+
+def test_price_table_expires_after_ttl(app, monkeypatch):
+    with app.app_context():
+        location_id, slot_id = _lot_with_slot()
+        assert list(pricing.price_table(location_id).prices) == [20.0]
+
+        # A re-price in another worker never reaches this process's commit hook
+        db.session.execute(update(Slot).where(Slot.id == slot_id).values(price_per_hour=35.0))
+        db.session.commit()
+        assert list(pricing.price_table(location_id).prices) == [20.0]
+
+        now = time.monotonic()
+        monkeypatch.setattr(time, 'monotonic', lambda: now + pricing.ttl + 1)
+        assert list(pricing.price_table(location_id).prices) == [35.0]
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from models import Booking, ParkingLocation, Payment, Slot, User, db
+from services.cache import response_cache
+
+# Statements allowed per request, independent of the number of rows
+BUDGETS = {
+    'list bookings': 2,
+    'booking detail': 2,
+    'location detail': 3,
+    'payment history': 2,
+}
+
+def _add_bookings(user_id, slots, first, count):
+    start = datetime.utcnow() - timedelta(days=first + count)
+    for i in range(first, first + count):
+        booking = Booking(user_id=user_id, slot_id=slots[i % len(slots)].id, vehicle_number='QC',
+                          start_time=start + timedelta(days=i), end_time=start + timedelta(days=i, hours=2),
+                          total_amount=20, status='completed')
+        db.session.add(booking)
+        db.session.flush()
+        db.session.add(Payment(booking_id=booking.id, user_id=user_id, amount=20,
+                               payment_method='upi', transaction_id=f'TXN-QC-{i}', status='completed'))
+    db.session.commit()
+    return booking.id
+
+def test_query_counts_do_not_grow_with_rows(app):
+    with app.app_context():
+        user = User(name='Heavy', email='heavy@example.com', phone='9000000001', password_hash='x')
+        location = ParkingLocation(name='Query Lot', address='Somewhere', city='Test', latitude=0.0, longitude=0.0)
+        slots = [Slot(parking_location=location, slot_number=f'Q-{i:03d}', type='car',
+                      status='available', price_per_hour=10) for i in range(20)]
+        db.session.add_all([user, location] + slots)
+        db.session.commit()
+        user_id, location_id = user.id, location.id
+        booking_id = _add_bookings(user_id, slots, 0, 1)
+        token = create_access_token(identity=user_id)
+
+        statements = []
+        listener = lambda conn, cursor, statement, *rest: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    urls = {
+        'list bookings': '/api/bookings?limit=100',
+        'booking detail': f'/api/bookings/{booking_id}',
+        'location detail': f'/api/parking/locations/{location_id}',
+        'payment history': '/api/payments/history?limit=50',
+    }
+
+    def count(name):
+        statements.clear()
+        response = client.get(urls[name], headers=headers)
+        assert response.status_code == 200
+        return len(statements)
+
+    # Warm the principal cache so the first request's user lookup is not counted
+    count('list bookings')
+    one = {name: count(name) for name in urls}
+
+    with app.app_context():
+        slots = Slot.query.filter_by(parking_location_id=location_id).order_by(Slot.slot_number).all()
+        _add_bookings(user_id, slots, 1, 199)
+    response_cache.clear()
+    many = {name: count(name) for name in urls}
+
+    assert many == one
+    for name, budget in BUDGETS.items():
+        assert many[name] <= budget, name
+
+    # Deep pages cost the same as the first
+    seen, cursor = [], ''
+    while True:
+        statements.clear()
+        response = client.get(f'/api/bookings?limit=20&cursor={cursor}', headers=headers)
+        assert len(statements) <= BUDGETS['list bookings']
+        seen.extend(booking['id'] for booking in response.get_json()['bookings'])
+        cursor = response.get_json()['pagination']['next_cursor']
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 200
+
+    with app.app_context():
+        event.remove(db.engine, 'before_cursor_execute', listener)
@@ -0,0 +1,20 @@
+import importlib
+import sys
+from flask import Flask
+import services.ratelimit as ratelimit
+
+def test_shared_store_falls_back_without_fcntl(monkeypatch):
+    # Importing a module mapped to None raises ImportError, as on Windows
+    monkeypatch.setitem(sys.modules, 'fcntl', None)
+    module = importlib.reload(ratelimit)
+    try:
+        app = Flask(__name__)
+        app.config['RATELIMIT_STORE'] = 'shared'
+        limiter = module.RateLimiter()
+        limiter.init_app(app)
+
+        assert isinstance(limiter.store, module.MemoryStore)
+        assert limiter.store.take('key', 1.0, 1) == (True, 0.0)
+    finally:
+        monkeypatch.undo()
+        importlib.reload(ratelimit)
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert, update
+from models import Booking, ParkingLocation, Slot, User, db
+from services.slots import bulk_update_slots
+
+def test_bulk_status_change_skips_slots_with_active_bookings(app):
+    with app.app_context():
+        location = ParkingLocation(name='Lot', address='1 Main St', city='Pune', latitude=18.52, longitude=73.85)
+        user = User(name='Driver', phone='9000000001', email='driver@example.com', password_hash='x')
+        db.session.add_all([location, user])
+        db.session.flush()
+        held = Slot(parking_location_id=location.id, slot_number='A1', type='car', price_per_hour=20.0, status='booked')
+        free = Slot(parking_location_id=location.id, slot_number='A2', type='car', price_per_hour=20.0)
+        db.session.add_all([held, free])
+        db.session.flush()
+        now = datetime.utcnow()
+        db.session.add(Booking(user_id=user.id, slot_id=held.id, vehicle_number='MH01AB1234',
+                               start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1), status='active'))
+        db.session.commit()
+
+        summary = bulk_update_slots([Slot.parking_location_id == location.id], {'status': 'maintenance'})
+        db.session.commit()
+
+        assert summary['matched'] == 2
+        assert summary['updated'] == 1
+        assert summary['unchanged'] == 0
+        assert summary['skipped_active_bookings'] == [held.id]
+        assert db.session.get(Slot, held.id).status == 'booked'
+        assert db.session.get(Slot, free.id).status == 'maintenance'
+
+        # Prices can still change under an active booking
+        summary = bulk_update_slots([Slot.parking_location_id == location.id], {'price_per_hour': 30.0})
+        assert summary['updated'] == 2
+        assert summary['skipped_active_bookings'] == []
+
+def _lot():
+    location = ParkingLocation(name='Lot', address='1 Main St', city='Pune', latitude=18.52, longitude=73.85)
+    db.session.add(location)
+    db.session.flush()
+    return location
+
+def test_bulk_update_changes_slots_with_null_status(app):
+    with app.app_context():
+        location = _lot()
+        slot = Slot(parking_location_id=location.id, slot_number='A1', type='car', price_per_hour=20.0)
+        db.session.add(slot)
+        db.session.commit()
+        db.session.execute(update(Slot).where(Slot.id == slot.id).values(status=None))
+        db.session.commit()
+
+        summary = bulk_update_slots([Slot.parking_location_id == location.id], {'status': 'maintenance'})
+        db.session.commit()
+
+        assert summary['updated'] == 1
+        assert summary['previous_status'] == {'available': 1}
+        assert db.session.get(Slot, slot.id).status == 'maintenance'
+
+def test_bulk_update_only_touches_the_rows_it_read(app):
+    with app.app_context():
+        location = _lot()
+        db.session.add(Slot(parking_location_id=location.id, slot_number='A1', type='car', price_per_hour=20.0))
+        db.session.commit()
+        location_id = location.id
+
+        # Another writer adds a matching slot between the read and the UPDATE
+        inserted = []
+        def insert_before_update(conn, cursor, statement, parameters, context, executemany):
+            if not inserted and statement.lstrip().startswith('UPDATE slots'):
+                inserted.append(True)
+                conn.execute(insert(Slot).values(id='late', parking_location_id=location_id, slot_number='A2',
+                                                 type='car', status='available', price_per_hour=20.0, version=1))
+        event.listen(db.engine, 'before_cursor_execute', insert_before_update)
+
+        try:
+            summary = bulk_update_slots([Slot.parking_location_id == location_id], {'status': 'maintenance'})
+            db.session.commit()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', insert_before_update)
+
+        assert inserted
+        assert summary['updated'] == 1
+        assert db.session.get(Slot, 'late').status == 'available'
@@ -0,0 +1,61 @@
+import random
+import time
+import services.spatial as spatial
+from services.spatial import SpatialIndex, haversine_km
+
+def test_nearest_orders_by_distance():
+    index = SpatialIndex()
+    index.upsert(1, 12.97, 77.59)
+    index.upsert(2, 12.98, 77.60)
+    index.upsert(3, 13.50, 77.59)
+
+    results = list(index.nearest(12.97, 77.59, 10))
+
+    assert [location_id for _, location_id in results] == [1, 2]
+    assert results[0][0] == 0
+
+def test_nearest_across_antimeridian():
+    index = SpatialIndex()
+    index.upsert(1, 0.0, -179.99)
+
+    results = list(index.nearest(0.0, 179.99, 5))
+
+    assert [location_id for _, location_id in results] == [1]
+
+def test_nearest_near_pole_is_bounded():
+    index = SpatialIndex()
+    # Across the pole from the query, about 22 km away
+    index.upsert(1, 89.9, 180.0)
+    index.upsert(2, 80.0, 0.0)
+
+    started = time.perf_counter()
+    empty = list(index.nearest(89.9, 0.0, 1))
+    results = list(index.nearest(89.9, 0.0, 30))
+    elapsed = time.perf_counter() - started
+
+    assert empty == []
+    assert [location_id for _, location_id in results] == [1]
+    assert abs(results[0][0] - haversine_km(89.9, 0.0, 89.9, 180.0)) < 1e-9
+    assert elapsed < 1.0
+
+def test_nearest_mid_latitude_only_checks_nearby_cells(monkeypatch):
+    rnd = random.Random(7)
+    points = [(i, rnd.uniform(38, 42), rnd.uniform(73, 77)) for i in range(20000)]
+    index = SpatialIndex()
+    for point in points:
+        index.upsert(*point)
+
+    calls = []
+    def counting_haversine(*args):
+        calls.append(args)
+        return haversine_km(*args)
+    monkeypatch.setattr(spatial, 'haversine_km', counting_haversine)
+
+    results = list(index.nearest(40.0, 75.0, 50))
+
+    expected = sorted((haversine_km(40.0, 75.0, p_lat, p_lng), location_id)
+                      for location_id, p_lat, p_lng in points
+                      if haversine_km(40.0, 75.0, p_lat, p_lng) <= 50)
+    assert results == expected
+    # The band scan must not fall back to every cell in the rows it spans
+    assert len(calls) < len(points) // 8